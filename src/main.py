@@ -12,7 +12,7 @@ from models import SynackTargetModel, TargetModel
 from modules.apphelp import AppHelp # pylint: disable=C0412
 from models import ChecklistModel # pylint: disable=C0412
 from modules.checklist import Checklist # pylint: disable=C0412
-from modules.database import Database # pylint: disable=C0412
+from modules.database import Database, dispose_engines # pylint: disable=C0412
 from modules.proxy import Proxy
 from modules.synack import Synack
 from modules.targets import Targets
@@ -46,6 +46,8 @@ class W3bT00lkit:
         self.selected_target = None
         self.selected_synack_target = None
         self.selected_target_in_scope = None
+        self.selected_target_scope_matcher = None
+        self.selected_target_capture_policy = None
         self.selected_target_out_of_scope = None
         self.session = PromptSession(completer=Completers())
         self.apphelp = AppHelp(self, [])
@@ -98,11 +100,15 @@ class W3bT00lkit:
                 self.selected_target: TargetModel = target
                 self.name = f"{self.base_name} (proxy) ({self.selected_target.name}) "
                 self.selected_target_in_scope = None
+                self.selected_target_scope_matcher = None
+                self.selected_target_capture_policy = None
                 self.selected_target_out_of_scope = None
             else:
                 self.selected_target: TargetModel = target
                 self.name = f"{self.base_name} ({self.selected_target.name}) "
                 self.selected_target_in_scope = None
+                self.selected_target_scope_matcher = None
+                self.selected_target_capture_policy = None
                 self.selected_target_out_of_scope = None
         self._clear()
         self._print_output(self.INTRO)
@@ -131,12 +137,16 @@ class W3bT00lkit:
                 self.selected_synack_target = target
                 self.name = f"{self.base_name} (proxy) ({selected_target.name}) "
                 self.selected_target_in_scope = None
+                self.selected_target_scope_matcher = None
+                self.selected_target_capture_policy = None
                 self.selected_target_out_of_scope = None
             else:
                 self.selected_target: TargetModel = selected_target
                 self.selected_synack_target = target
                 self.name = f"{self.base_name} ({selected_target.name}) "
                 self.selected_target_in_scope = None
+                self.selected_target_scope_matcher = None
+                self.selected_target_capture_policy = None
                 self.selected_target_out_of_scope = None
 
             self._clear()
@@ -205,6 +215,7 @@ class W3bT00lkit:
 
     def _exit(self) -> None:
         """Exit the app."""
+        dispose_engines()
         sys.exit(0)
 
 if __name__ == '__main__':
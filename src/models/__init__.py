@@ -2,7 +2,7 @@
 import hashlib
 from typing import Any
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy import Boolean, BigInteger, Column, DateTime, ForeignKey, func, Index, Integer, String, TIMESTAMP, UniqueConstraint
+from sqlalchemy import Boolean, BigInteger, Column, DateTime, ForeignKey, func, Index, Integer, LargeBinary, String, TIMESTAMP, UniqueConstraint
 from sqlalchemy.orm import relationship
 from sqlalchemy.orm.relationships import _RelationshipDeclared
 from sqlalchemy.dialects.postgresql import JSONB
@@ -36,11 +36,42 @@ class ChecklistModel(Base):
 
     Index('ux_name_version_item', name, checklist_version, item_id, unique=True)
 
+class BodyModel(Base): # pylint: disable=R0903
+    """BodyModel."""
+    __tablename__: str = 'body'
+
+    hash = Column(String, primary_key=True)
+    size = Column(BigInteger)
+    stored_size = Column(BigInteger)
+    encoding = Column(String)
+    content = Column(String)
+    data = Column(LargeBinary)
+    segment = Column(String)
+    segment_offset = Column(BigInteger)
+    segment_length = Column(BigInteger)
+    ref_count = Column(Integer, default=0)
+    comments_ind = Column(Boolean, index=True)
+    search_ind = Column(Boolean, index=True)
+    created_timestamp = Column(DateTime, default=func.now()) # pylint: disable=E1102
+    modified_timestamp = Column(DateTime, nullable=True)
+
+class CommentModel(Base): # pylint: disable=R0903
+    """CommentModel."""
+    __tablename__: str = 'comment'
+
+    id = Column(Integer, primary_key=True)
+    body_hash = Column(String, index=True)
+    kind = Column(String)
+    position = Column(Integer)
+    text = Column(String)
+    created_timestamp = Column(DateTime, default=func.now()) # pylint: disable=E1102
+
 class ProxyModel(Base): # pylint: disable=R0903
     """ProxyModel."""
     __tablename__: str = 'proxy'
 
     id = Column(Integer, primary_key=True)
+    flow_id = Column(String, unique=True, index=True)
     target_id = Column(Integer)
     name = Column(String)
     action = Column(String)
@@ -57,6 +88,7 @@ class ProxyModel(Base): # pylint: disable=R0903
     response_reason = Column(String)
     response_headers = Column(String)
     response_text = Column(String)
+    response_body_hash = Column(String, index=True)
     timestamp_start = Column(BigInteger)
     timestamp_end = Column(BigInteger)
     full_url = Column(String)
@@ -80,6 +112,39 @@ class ProxyModel(Base): # pylint: disable=R0903
     finding_category = Column(String)
     created_timestamp = Column(DateTime, default=func.now()) # pylint: disable=E1102
     modified_timestamp = Column(DateTime, nullable=True)
+    Index('ix_proxy_target_id_timestamp_start_id', target_id, timestamp_start, id)
+    Index('ix_proxy_timestamp_start_id', timestamp_start, id)
+    Index('ix_proxy_target_id_response_status_code_timestamp_start_id', target_id, response_status_code, timestamp_start, id)
+    Index('ix_proxy_responses_target_id_timestamp_start_id', target_id, timestamp_start, id,
+          postgresql_where=response_status_code.isnot(None), sqlite_where=response_status_code.isnot(None))
+    Index('ix_proxy_responses_target_id_method_timestamp_start_id', target_id, method, timestamp_start, id,
+          postgresql_where=response_status_code.isnot(None), sqlite_where=response_status_code.isnot(None))
+    Index('ix_proxy_target_id_host_path', target_id, host, path)
+
+class SchemaVersionModel(Base): # pylint: disable=R0903
+    """SchemaVersionModel."""
+    __tablename__: str = 'schema_version'
+
+    version = Column(Integer, primary_key=True)
+    description = Column(String)
+    applied_timestamp = Column(DateTime, default=func.now()) # pylint: disable=E1102
+
+class TrafficSummaryModel(Base): # pylint: disable=R0903
+    """TrafficSummaryModel."""
+    __tablename__: str = 'trafficsummary'
+
+    id = Column(Integer, primary_key=True)
+    target_id = Column(Integer, nullable=False)
+    host = Column(String, nullable=False)
+    method = Column(String, nullable=False)
+    response_status_code = Column(Integer, nullable=False)
+    content_class = Column(String, nullable=False)
+    request_count = Column(BigInteger, default=0)
+    response_bytes = Column(BigInteger, default=0)
+    last_seen = Column(BigInteger)
+    modified_timestamp = Column(DateTime, default=func.now(), onupdate=func.now()) # pylint: disable=E1102
+
+    Index('ux_trafficsummary_key', target_id, host, method, response_status_code, content_class, unique=True)
 
 class SynackTargetModel(Base): # pylint: disable=R0903
     """SynackTargetModel."""
@@ -128,6 +193,20 @@ class TargetModel(Base): # pylint: disable=R0903
     created_timestamp = Column(DateTime, default=func.now()) # pylint: disable=E1102
     modified_timestamp = Column(DateTime, nullable=True)
 
+class CapturePolicyModel(Base): # pylint: disable=R0903
+    """CapturePolicyModel."""
+    __tablename__: str = 'capturepolicy'
+
+    id = Column(Integer, primary_key=True, index=True)
+    target_id = Column(Integer, ForeignKey('target.id'), index=True)
+    rule_type = Column(String)
+    pattern = Column(String)
+    mode = Column(String)
+    active = Column(Boolean, default=True)
+    created_timestamp = Column(DateTime, default=func.now()) # pylint: disable=E1102
+    modified_timestamp = Column(DateTime, nullable=True)
+
+
 class TargetScopeModel(Base): # pylint: disable=R0903
     """TargetScopeModel."""
     __tablename__: str = 'targetscope'
@@ -0,0 +1,369 @@
+"""bodystore.py"""
+import hashlib
+import os
+import zlib
+from typing import Iterable, List
+from sqlalchemy import Row, bindparam, delete, distinct, func, insert, select, update
+from sqlalchemy.orm import Session
+from dotenv import load_dotenv
+from mitmproxy.net import encoding as http_encoding
+from modules.querycache import QUERY_CACHE
+from modules.segments import DATA_PATH, SegmentRef, SegmentWriter, read_segment
+from models import BodyModel, ProxyModel, TargetModel
+
+try:
+    import zstandard
+except ImportError: # pragma: no cover
+    zstandard = None
+
+load_dotenv()
+
+# pylint: disable=C0121,E1102
+
+BACKFILL_CHUNK_SIZE = 500
+SEARCH_CHUNK_SIZE = 100
+BODY_COMPRESSION = os.environ.get('BODY_COMPRESSION', 'zstd' if zstandard is not None else 'zlib').lower()
+BODY_COMPRESSION_THRESHOLD = int(os.environ.get('BODY_COMPRESSION_THRESHOLD', '4096'))
+BODY_COMPRESSION_LEVEL = int(os.environ.get('BODY_COMPRESSION_LEVEL', '3'))
+BODY_SPILL_THRESHOLD = int(os.environ.get('BODY_SPILL_THRESHOLD', str(1024 * 1024)))
+BODY_SEGMENT_PATH = os.path.join(DATA_PATH, 'bodies')
+SPILLED_HASH_PREFIX = 'spilled:'
+
+
+def compress(data: bytes, encoding: str = BODY_COMPRESSION, level: int = BODY_COMPRESSION_LEVEL) -> bytes:
+    """Compress bytes with `zstd` or `zlib`."""
+    if encoding == 'zstd':
+        return zstandard.ZstdCompressor(level=level).compress(data)
+    return zlib.compress(data, level)
+
+def decompress(data: bytes, encoding: str) -> bytes:
+    """Decompress bytes written by `compress`."""
+    if encoding == 'zstd':
+        return zstandard.ZstdDecompressor().decompress(data)
+    return zlib.decompress(data)
+
+
+class SpilledBody:
+    """Response body written to a body segment instead of the database.
+
+    An instance is a mitmproxy stream callable: set it as `flow.response.stream`
+    and every chunk is written to its reserved range as it passes through, so the
+    body is never held in memory. Chunks beyond the reserved length are passed on
+    but not stored, and the body is marked `truncated`.
+
+    The chunks are still content-encoded, so the body cannot be keyed like the
+    decoded text of an inline body. Its key is the SHA-256 of the content
+    encoding and the raw bytes, prefixed with `SPILLED_HASH_PREFIX`, so spilled
+    bodies only deduplicate with each other and never share a key with an
+    inline body.
+    """
+
+    def __init__(self, segments: SegmentWriter, length: int, content_encoding: str = None) -> None:
+        self.segments = segments
+        self.ref: SegmentRef = segments.reserve(length)
+        self.content_encoding = content_encoding
+        self.written = 0
+        self.truncated = False
+        self.digest = hashlib.sha256(f"{content_encoding or ''}\n".encode('utf-8'))
+
+    def __call__(self, data: bytes) -> bytes:
+        if len(data) > 0:
+            if self.written + len(data) <= self.ref.length:
+                self.segments.write_at(self.ref, self.written, data)
+                self.digest.update(data)
+                self.written += len(data)
+            else:
+                self.truncated = True
+        return data
+
+    def record(self) -> dict:
+        """Get the `response_body` value queued for the proxy writer.
+
+        `truncated` is set when the body did not fit its reserved length, or
+        fell short of it; `BodyStore.extract` does not store such bodies.
+        """
+        return {
+            'hash': SPILLED_HASH_PREFIX + self.digest.hexdigest(),
+            'segment': self.ref.segment,
+            'segment_offset': self.ref.offset,
+            'segment_length': self.written,
+            'encoding': self.content_encoding,
+            'truncated': self.truncated or self.written < self.ref.length
+        }
+
+
+class BodyStore:
+    """Content-addressed store for response bodies.
+
+    Each distinct body is written once to the `body` table, keyed by its SHA-256
+    hash, and proxy rows only keep the hash in `response_body_hash`. A reference
+    count per body tracks how many proxy rows point at it so unused bodies can be
+    pruned.
+
+    Bodies of at least `BODY_COMPRESSION_THRESHOLD` bytes are compressed into the
+    binary `data` column and `encoding` records the codec; smaller bodies stay as
+    text in `content`. Bodies are only decompressed when they are viewed or searched.
+
+    Bodies above `BODY_SPILL_THRESHOLD` bytes are kept out of the database: the
+    proxy writes them to a segment file under `BODY_SEGMENT_PATH` as they stream
+    through (see `SpilledBody`) and the body row only keeps the segment, offset and
+    length. Spilled bodies are keyed by their raw bytes under `SPILLED_HASH_PREFIX`
+    rather than by their text. Segment bytes of pruned bodies are not reclaimed.
+    """
+
+    def __init__(self, compression: str = BODY_COMPRESSION, threshold: int = BODY_COMPRESSION_THRESHOLD,
+                 segment_path: str = BODY_SEGMENT_PATH) -> None:
+        if compression == 'zstd' and zstandard is None:
+            compression = 'zlib'
+        self.compression = compression
+        self.threshold = threshold
+        self.segment_path = segment_path
+        self.stored_bytes = 0
+
+    @staticmethod
+    def hash_body(body: str) -> str:
+        """Hash a body.
+
+        Args:
+            body (str): The body text.
+
+        Returns:
+            The hex SHA-256 digest of the UTF-8 encoded body.
+        """
+        return hashlib.sha256(body.encode('utf-8', 'surrogatepass')).hexdigest()
+
+    def extract(self, records: Iterable[dict]) -> dict[str, list]:
+        """Move the `response_text` of each record into a body keyed by hash.
+
+        Args:
+            records: `ProxyModel` column values, updated in place. A `response_body`
+                value from `SpilledBody.record` takes the place of `response_text`;
+                a truncated one is not stored and leaves the row without a body.
+
+        Returns:
+            The bodies found as {hash: [text or spilled body, reference count]}.
+        """
+        bodies: dict[str, list] = {}
+        for record in records:
+            if 'response_body' in record:
+                body = record.pop('response_body')
+                record.pop('response_text', None)
+                if body.get('truncated', False):
+                    record['response_body_hash'] = None
+                    continue
+                body_hash = body['hash']
+                record['response_body_hash'] = body_hash
+                if body_hash in bodies:
+                    bodies[body_hash][1] += 1
+                else:
+                    bodies[body_hash] = [body, 1]
+                continue
+            if 'response_text' not in record:
+                continue
+            body = record.pop('response_text')
+            if body is None:
+                record['response_body_hash'] = None
+                continue
+            body_hash = self.hash_body(body)
+            record['response_body_hash'] = body_hash
+            if body_hash in bodies:
+                bodies[body_hash][1] += 1
+            else:
+                bodies[body_hash] = [body, 1]
+        return bodies
+
+    def save(self, db: Session, bodies: dict[str, list]) -> int:
+        """Write the bodies seen for the first time and bump the reference counts of the others.
+
+        Args:
+            db (Session): The current session to connect to the database.
+            bodies: The bodies returned by `extract`.
+
+        Returns:
+            The number of new bodies written.
+        """
+        if len(bodies) == 0:
+            return 0
+        existing = set(db.scalars(select(BodyModel.hash).where(BodyModel.hash.in_(list(bodies)))).all())
+
+        new_bodies: List[dict] = []
+        references: List[dict] = []
+        for body_hash, (body, ref_count) in bodies.items():
+            if body_hash in existing:
+                if ref_count != 0:
+                    references.append({'b_hash': body_hash, 'b_ref_count': ref_count})
+            else:
+                new_bodies.append({'hash': body_hash, 'ref_count': ref_count, **self._encode(body)})
+
+        if len(new_bodies) > 0:
+            db.execute(insert(BodyModel), new_bodies)
+            self.stored_bytes += sum(body['stored_size'] for body in new_bodies)
+        if len(references) > 0:
+            body_table = BodyModel.__table__
+            db.execute(update(body_table)
+                       .where(body_table.c.hash == bindparam('b_hash'))
+                       .values(ref_count=body_table.c.ref_count + bindparam('b_ref_count'), modified_timestamp=func.now()),
+                       references)
+        return len(new_bodies)
+
+    @staticmethod
+    def release(db: Session, references: dict[str, int]) -> None:
+        """Drop references to bodies, e.g. of deleted proxy rows or replaced responses.
+
+        Bodies left without references are deleted by `prune`.
+
+        Args:
+            db (Session): The current session to connect to the database.
+            references: The number of references to drop per body hash.
+
+        Returns:
+            None
+        """
+        references = [{'b_hash': body_hash, 'b_ref_count': ref_count}
+                      for body_hash, ref_count in references.items() if ref_count > 0]
+        if len(references) == 0:
+            return
+        body_table = BodyModel.__table__
+        db.execute(update(body_table)
+                   .where(body_table.c.hash == bindparam('b_hash'))
+                   .values(ref_count=body_table.c.ref_count - bindparam('b_ref_count'), modified_timestamp=func.now()),
+                   references)
+
+    def _encode(self, body: str | dict) -> dict:
+        """Get the `BodyModel` storage columns for a body, compressing it when it is large enough."""
+        if isinstance(body, dict):
+            return {'size': body['segment_length'], 'stored_size': body['segment_length'], 'encoding': body['encoding'],
+                    'content': None, 'data': None, 'segment': body['segment'],
+                    'segment_offset': body['segment_offset'], 'segment_length': body['segment_length']}
+        raw = body.encode('utf-8', 'surrogatepass')
+        if self.compression in ('zlib', 'zstd') and len(raw) >= self.threshold:
+            data = compress(raw, self.compression)
+            if len(data) < len(raw):
+                return {'size': len(raw), 'stored_size': len(data), 'encoding': self.compression,
+                        'content': None, 'data': data}
+        return {'size': len(raw), 'stored_size': len(raw), 'encoding': None, 'content': body, 'data': None}
+
+    def decode(self, row: Row) -> str | None:
+        """Get the text of a `BodyModel` row with `content`, `data`, `encoding` and segment columns."""
+        if row.segment is not None:
+            data = read_segment(self.segment_path, row.segment, row.segment_offset, row.segment_length)
+            if row.encoding is not None:
+                data = http_encoding.decode(data, row.encoding)
+            return data.decode('utf-8', 'replace')
+        if row.encoding is None:
+            return row.content
+        return decompress(row.data, row.encoding).decode('utf-8', 'surrogatepass')
+
+    def get_text(self, db: Session, body_hash: str) -> str | None:
+        """Get the text of a body.
+
+        Args:
+            db (Session): The current session to connect to the database.
+            body_hash (str): The hash of the body.
+
+        Returns:
+            The body text, or None when it is not stored.
+        """
+        if body_hash is None:
+            return None
+        row = db.execute(select(BodyModel.content, BodyModel.data, BodyModel.encoding, BodyModel.segment,
+                                BodyModel.segment_offset, BodyModel.segment_length)
+                         .where(BodyModel.hash == body_hash)).first()
+        if row is None:
+            return None
+        return self.decode(row)
+
+    def search_compressed(self, db: Session, terms: List[str], target_id: int = None) -> List[str]:
+        """Find the compressed bodies containing every one of the terms.
+
+        Compressed bodies cannot be matched with `LIKE`, so they are streamed and
+        decompressed one chunk at a time. Spilled bodies are not searched.
+
+        Args:
+            db (Session): The current session to connect to the database.
+            terms: The strings to look for.
+            target_id (int): Only search the bodies captured for this target.
+
+        Returns:
+            The hashes of the matching bodies.
+        """
+        query = select(BodyModel.hash, BodyModel.content, BodyModel.data, BodyModel.encoding, BodyModel.segment)\
+            .where(BodyModel.encoding.isnot(None), BodyModel.segment.is_(None))
+        if target_id is not None:
+            query = query.where(BodyModel.hash.in_(
+                select(ProxyModel.response_body_hash).where(ProxyModel.target_id == target_id)))
+        matches: List[str] = []
+        for row in db.execute(query.execution_options(yield_per=SEARCH_CHUNK_SIZE)):
+            text = self.decode(row)
+            if all(term in text for term in terms):
+                matches.append(row.hash)
+        return matches
+
+    def storage_by_target(self, db: Session) -> List[Row]:
+        """Get the body storage used per target.
+
+        Args:
+            db (Session): The current session to connect to the database.
+
+        Returns:
+            Rows of (target name, bodies, size, stored size).
+        """
+        target_bodies = select(distinct(ProxyModel.response_body_hash).label('body_hash'), ProxyModel.target_id)\
+            .where(ProxyModel.response_body_hash.isnot(None)).subquery()
+        return db.execute(select(TargetModel.name,
+                                 func.count(BodyModel.hash).label('bodies'),
+                                 func.sum(BodyModel.size).label('size'),
+                                 func.sum(func.coalesce(BodyModel.stored_size, BodyModel.size)).label('stored_size'))
+                          .join(target_bodies, target_bodies.c.body_hash == BodyModel.hash)
+                          .join(TargetModel, TargetModel.id == target_bodies.c.target_id, isouter=True)
+                          .group_by(TargetModel.name)
+                          .order_by(TargetModel.name)).all()
+
+    def backfill(self, db: Session, chunk_size: int = BACKFILL_CHUNK_SIZE) -> int:
+        """Move the bodies of proxy rows written before the body store existed.
+
+        Args:
+            db (Session): The current session to connect to the database.
+            chunk_size (int): Number of rows moved per transaction.
+
+        Returns:
+            The number of proxy rows moved.
+        """
+        moved = 0
+        while True:
+            rows = db.execute(select(ProxyModel.id, ProxyModel.response_text)
+                              .where(ProxyModel.response_text.isnot(None), ProxyModel.response_body_hash.is_(None))
+                              .limit(chunk_size)).all()
+            if len(rows) == 0:
+                if moved > 0:
+                    QUERY_CACHE.clear()
+                return moved
+            records = [{'id': row.id, 'response_text': row.response_text} for row in rows]
+            self.save(db, self.extract(records))
+            for record in records:
+                record['response_text'] = None
+                record['raw_response'] = None
+                record['decoded_content'] = None
+            db.execute(update(ProxyModel), records)
+            db.commit()
+            moved += len(records)
+
+    def prune(self, db: Session) -> int:
+        """Recount the references of every body and delete the unreferenced ones.
+
+        Args:
+            db (Session): The current session to connect to the database.
+
+        Returns:
+            The number of bodies deleted.
+        """
+        references = select(func.count(ProxyModel.id))\
+            .where(ProxyModel.response_body_hash == BodyModel.hash)\
+            .scalar_subquery()
+        db.execute(update(BodyModel).values(ref_count=references), execution_options={'synchronize_session': False})
+        deleted = db.execute(delete(BodyModel).where(BodyModel.ref_count <= 0),
+                             execution_options={'synchronize_session': False}).rowcount
+        db.commit()
+        if deleted > 0:
+            QUERY_CACHE.clear()
+        return deleted
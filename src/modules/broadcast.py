@@ -0,0 +1,110 @@
+"""broadcast.py"""
+import threading
+from collections import deque
+from typing import Any, List
+
+BROADCAST_BUFFER = 1000
+
+
+class Subscription:
+    """The messages published to a `Broadcast` since subscribing, for one consumer.
+
+    At most `maxsize` messages are buffered; when the consumer falls behind,
+    the oldest are discarded and counted in `dropped`, so publishing never
+    waits for it.
+    """
+
+    def __init__(self, broadcast: 'Broadcast', maxsize: int) -> None:
+        self.broadcast = broadcast
+        self.messages: deque = deque(maxlen=max(1, maxsize))
+        self.condition = threading.Condition()
+        self.dropped = 0
+        self.closed = False
+
+    def put(self, message: Any) -> None:
+        """Buffer a message, discarding the oldest one when full."""
+        with self.condition:
+            if len(self.messages) == self.messages.maxlen:
+                self.dropped += 1
+            self.messages.append(message)
+            self.condition.notify()
+
+    def get(self, timeout: float = None) -> Any | None:
+        """Get the next message, waiting at most `timeout` seconds for one.
+
+        Returns:
+            The message, None on timeout or once closed.
+        """
+        with self.condition:
+            if len(self.messages) == 0 and not self.closed:
+                self.condition.wait(timeout)
+            return self.messages.popleft() if len(self.messages) > 0 else None
+
+    def drain(self) -> List[Any]:
+        """Get the buffered messages without waiting."""
+        with self.condition:
+            messages = list(self.messages)
+            self.messages.clear()
+            return messages
+
+    def close(self) -> None:
+        """Stop receiving messages and wake up a consumer waiting in `get`."""
+        self.broadcast.unsubscribe(self)
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+    def __enter__(self) -> 'Subscription':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+class Broadcast:
+    """In-process publish/subscribe channel delivering every message to every subscriber.
+
+    Publishing copies a message reference into the bounded buffer of each
+    subscription and returns; with no subscribers it does nothing, so
+    publishers can call it on a hot path. Subscribers only see the messages
+    published after they subscribed.
+    """
+
+    def __init__(self, maxsize: int = BROADCAST_BUFFER) -> None:
+        self.maxsize = maxsize
+        self.lock = threading.Lock()
+        self.subscribers: tuple[Subscription, ...] = ()
+
+    def subscribe(self, maxsize: int = None) -> Subscription:
+        """Start receiving the messages published from now on.
+
+        Args:
+            maxsize (int): The number of messages buffered, `maxsize` of the broadcast by default.
+
+        Returns:
+            The subscription; close it when done.
+        """
+        subscription = Subscription(self, maxsize or self.maxsize)
+        with self.lock:
+            self.subscribers = (*self.subscribers, subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        """Stop delivering messages to a subscription."""
+        with self.lock:
+            self.subscribers = tuple(subscriber for subscriber in self.subscribers if subscriber is not subscription)
+
+    def active(self) -> bool:
+        """Check whether anyone is subscribed, to skip building messages nobody reads."""
+        return len(self.subscribers) > 0
+
+    def publish(self, message: Any) -> int:
+        """Deliver a message to the current subscribers.
+
+        Returns:
+            The number of subscribers it was delivered to.
+        """
+        subscribers = self.subscribers
+        for subscription in subscribers:
+            subscription.put(message)
+        return len(subscribers)
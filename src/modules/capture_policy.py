@@ -0,0 +1,140 @@
+"""capture_policy.py"""
+import fnmatch
+import posixpath
+from typing import Iterable, List, NamedTuple
+from sqlalchemy.orm import Session
+from models import CapturePolicyModel
+
+# pylint: disable=C0121,R0903
+
+CAPTURE_FULL = 'full'
+CAPTURE_METADATA = 'metadata'
+CAPTURE_DROP = 'drop'
+CAPTURE_MODES = [CAPTURE_FULL, CAPTURE_METADATA, CAPTURE_DROP]
+
+RULE_CONTENT_TYPE = 'content-type'
+RULE_EXTENSION = 'extension'
+RULE_HOST = 'host'
+RULE_PATH = 'path'
+RULE_TYPES = [RULE_CONTENT_TYPE, RULE_EXTENSION, RULE_HOST, RULE_PATH]
+
+MEDIA_EXTENSIONS = ['avif', 'bmp', 'eot', 'gif', 'ico', 'jpeg', 'jpg', 'm4a', 'mov', 'mp3', 'mp4', 'ogg', 'otf',
+                    'png', 'svg', 'tif', 'tiff', 'ttf', 'wav', 'webm', 'webp', 'woff', 'woff2']
+MEDIA_CONTENT_TYPES = ['audio/*', 'font/*', 'image/*', 'video/*', 'application/font-*', 'application/x-font-*',
+                       'application/vnd.ms-fontobject']
+
+
+class CaptureRule(NamedTuple):
+    """A compiled capture policy rule."""
+    rule_type: str
+    pattern: str
+    mode: str
+
+
+def media_rules(mode: str = CAPTURE_DROP) -> List[dict]:
+    """Get the rules that keep images, fonts, audio and video out of the database.
+
+    Args:
+        mode (str): The capture mode of the rules.
+
+    Returns:
+        The rules as `CapturePolicyModel` column values.
+    """
+    rules = [{'rule_type': RULE_EXTENSION, 'pattern': extension, 'mode': mode} for extension in MEDIA_EXTENSIONS]
+    rules += [{'rule_type': RULE_CONTENT_TYPE, 'pattern': content_type, 'mode': mode} for content_type in MEDIA_CONTENT_TYPES]
+    return rules
+
+
+def path_extension(path: str) -> str:
+    """Get the lowercase file extension of a request path without its query string."""
+    path = path.split('?', 1)[0].split('#', 1)[0]
+    return posixpath.splitext(path)[1][1:].lower()
+
+
+class CapturePolicy:
+    """Capture policy of a target.
+
+    Rules are checked in the order they were added and the first match decides
+    how much of a flow is stored: `full` stores everything, `metadata` stores the
+    request line, headers and status without bodies and `drop` stores nothing.
+    Host, path and extension rules only need the request line, so the request
+    hook decides a flow when one of them matches before any content type rule;
+    the other flows are decided from the response headers, before the response
+    body is read, with every rule in order. Flows no rule matches use the
+    default mode.
+    """
+
+    def __init__(self, rules: Iterable[dict], default_mode: str = CAPTURE_FULL) -> None:
+        self.default_mode = default_mode
+        self.rules: List[CaptureRule] = []
+        for rule in rules or []:
+            compiled = CaptureRule(rule['rule_type'], rule['pattern'].strip().lower(), rule['mode'])
+            if compiled.rule_type == RULE_EXTENSION:
+                self.rules.append(compiled._replace(pattern=compiled.pattern.lstrip('.')))
+            elif compiled.rule_type in RULE_TYPES:
+                self.rules.append(compiled)
+
+    def for_request(self, host: str, path: str) -> str | None:
+        """Get the mode of the first rule matching a request, if it is decided by the request line.
+
+        Args:
+            host (str): The host of the request.
+            path (str): The path of the request, with the query string.
+
+        Returns:
+            The capture mode, or None when no rule matches or a content type rule comes first.
+        """
+        return self._first_match(host, path, None, request_only=True)
+
+    def for_response(self, content_type: str | None, host: str = None, path: str = None) -> str | None:
+        """Get the mode of the first rule matching a flow whose response headers are in.
+
+        Args:
+            content_type (str): The `Content-Type` header of the response.
+            host (str): The host of the request.
+            path (str): The path of the request, with the query string.
+
+        Returns:
+            The capture mode, or None when no rule matches.
+        """
+        return self._first_match(host, path, content_type, request_only=False)
+
+    def _first_match(self, host: str | None, path: str | None, content_type: str | None, request_only: bool) -> str | None:
+        host = (host or '').lower()
+        path = path or '/'
+        media_type = (content_type or '').split(';', 1)[0].strip().lower()
+        extension = None
+        for rule in self.rules:
+            if rule.rule_type == RULE_CONTENT_TYPE:
+                if request_only:
+                    return None
+                matched = media_type != '' and fnmatch.fnmatchcase(media_type, rule.pattern)
+            elif rule.rule_type == RULE_HOST:
+                matched = fnmatch.fnmatchcase(host, rule.pattern)
+            elif rule.rule_type == RULE_PATH:
+                matched = fnmatch.fnmatchcase(path.lower(), rule.pattern)
+            else:
+                if extension is None:
+                    extension = path_extension(path)
+                matched = fnmatch.fnmatchcase(extension, rule.pattern)
+            if matched:
+                return rule.mode
+        return None
+
+
+def load_capture_policy(db: Session, target_id: int) -> CapturePolicy:
+    """Load the active capture policy rules of a target.
+
+    Args:
+        db (Session): The current session to connect to the database.
+        target_id (int): The target.
+
+    Returns:
+        CapturePolicy
+    """
+    records: List[CapturePolicyModel] = db.query(CapturePolicyModel).filter(
+            CapturePolicyModel.target_id == target_id,
+            CapturePolicyModel.active == True
+        ).order_by(CapturePolicyModel.id).all()
+    return CapturePolicy([{'rule_type': record.rule_type, 'pattern': record.pattern, 'mode': record.mode}
+                          for record in records])
@@ -8,9 +8,8 @@ from prompt_toolkit.completion import WordCompleter
 from sqlalchemy import text
 from modules.database import Database
 from modules.input_handler import InputHandler
+from modules.pager import Pager
 from models import ChecklistModel, TargetModel
-import pandas as pd
-from rich.console import Console
 from rich.table import Table
 
 
@@ -92,37 +91,36 @@ class Checklist(): # pylint: disable=R0903
         """
         print("\nChecklists:")
 
+    @staticmethod
+    def _checklist_table(rows: List[ChecklistModel], start_index: int) -> Table:
+        """Build the table of a page of checklist items, numbering its rows from `start_index`."""
+        table = Table()
+        table.add_column('#')
+        table.add_column('id')
+        table.add_column('name')
+        table.add_column('# Notes')
+
+        for local_counter, record in enumerate(rows, start_index):
+            note_count = '' if (record.note_count == 0 or record.note_count is None) else str(record.note_count)
+            table.add_row(str(local_counter), record.item_id, record.item_name, note_count)
+        return table
+
     def _paginated_print(self, data, page_size=25):
         """Prints data in paginated format.
 
         Args:
-            data: A list of lists or a 2D array representing the data to be printed.
+            data: The checklist items to print.
             page_size: The number of records to display per page.
         """
+        pager = Pager(data, self._checklist_table, page_size)
         self.start_index = 0
         self.end_index = page_size
-        df = pd.DataFrame(data)
-        df.index.name = '#'
         running = True
         while running and self.start_index < len(data):
             self.prompt_user = True
             try:
-                page_data = df.iloc[self.start_index:self.end_index]
-                local_counter = self.start_index
-                table = Table()
-                table.add_column('#')
-                table.add_column('id')
-                table.add_column('name')
-                table.add_column('# Notes')
-
-                for record in page_data[0]:
-                    table.add_row(str(local_counter), record.item_id, record.item_name, str('' if (record.note_count == 0 or record.note_count is None) else record.note_count))
-                    #self.page_counter += 1
-                    local_counter += 1
-                    self.page_counter = local_counter
-
-                console = Console()
-                console.print(table)
+                page_data = pager.show(self.start_index // page_size)
+                self.page_counter = self.start_index + len(page_data)
             except Exception as exc:
                 print(exc)
 
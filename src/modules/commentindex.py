@@ -0,0 +1,142 @@
+"""commentindex.py"""
+from typing import List, NamedTuple
+from sqlalchemy import distinct, func, insert, inspect, select, update
+from sqlalchemy.orm import Session
+from modules.bodystore import BodyStore
+from modules.comments import Comment, extract_comments
+from modules.querycache import QUERY_CACHE
+from models import BodyModel, CommentModel, ProxyModel
+
+# pylint: disable=E1102,W0718
+
+COMMENT_BACKFILL_CHUNK_SIZE = 100
+COMMENT_LIST_LIMIT = 500
+
+
+class CommentRow(NamedTuple):
+    """A distinct comment listed by `proxy comments`."""
+    kind: str
+    text: str
+    bodies: int
+    proxy_id: int
+    full_url: str | None
+
+
+class CommentIndex:
+    """Comments of the stored response bodies, extracted once per body.
+
+    The proxy writer extracts the comments of every new body as it is stored
+    and writes them to the `comment` table keyed by body hash.
+    `BodyModel.comments_ind` records whether a body has comments and stays NULL
+    until it was scanned, which `backfill` does for bodies stored earlier and
+    for spilled bodies; proxy rows copy it into `ProxyModel.comments_ind`.
+    """
+
+    def __init__(self, body_store: BodyStore = None) -> None:
+        self.body_store = body_store if body_store is not None else BodyStore()
+        self.present = None
+
+    def available(self, db: Session) -> bool:
+        """Check whether the comment table exists, once."""
+        if self.present is None:
+            self.present = inspect(db.connection()).has_table(CommentModel.__tablename__)
+        return self.present
+
+    def index(self, db: Session, bodies: dict[str, list], records: List[dict]) -> None:
+        """Extract the comments of the bodies seen for the first time and set `comments_ind` on their records.
+
+        Spilled bodies are left to `backfill`.
+
+        Args:
+            db (Session): The current session to connect to the database.
+            bodies: The bodies returned by `BodyStore.extract`, after `BodyStore.save`.
+            records: The records the bodies were extracted from; updated in place.
+
+        Returns:
+            None
+        """
+        if len(bodies) == 0 or not self.available(db):
+            return
+        state = dict(db.execute(select(BodyModel.hash, BodyModel.comments_ind)
+                                .where(BodyModel.hash.in_(list(bodies)))).all())
+        found = {body_hash: extract_comments(body) for body_hash, (body, _) in bodies.items()
+                 if state.get(body_hash) is None and isinstance(body, str)}
+        self._store(db, found)
+        state.update({body_hash: len(comments) > 0 for body_hash, comments in found.items()})
+        for record in records:
+            if record.get('response_body_hash') in bodies:
+                record['comments_ind'] = state.get(record['response_body_hash'])
+
+    @staticmethod
+    def _store(db: Session, found: dict[str, List[Comment]]) -> None:
+        """Write the comments of scanned bodies and mark the bodies."""
+        rows = [{'body_hash': body_hash, 'kind': comment.kind, 'position': comment.position, 'text': comment.text}
+                for body_hash, comments in found.items() for comment in comments]
+        if len(rows) > 0:
+            db.execute(insert(CommentModel), rows)
+        for comments_ind in (True, False):
+            hashes = [body_hash for body_hash, comments in found.items() if (len(comments) > 0) == comments_ind]
+            if len(hashes) > 0:
+                db.execute(update(BodyModel).where(BodyModel.hash.in_(hashes)).values(comments_ind=comments_ind),
+                           execution_options={'synchronize_session': False})
+
+    def backfill(self, db: Session, limit: int = None, chunk_size: int = COMMENT_BACKFILL_CHUNK_SIZE) -> int:
+        """Extract the comments of the bodies not scanned yet.
+
+        Args:
+            db (Session): The current session to connect to the database.
+            limit (int): Stop after about this many bodies, e.g. to backfill a chunk at a time.
+            chunk_size (int): Number of bodies scanned per transaction.
+
+        Returns:
+            The number of bodies scanned.
+        """
+        if not self.available(db):
+            return 0
+        scanned = 0
+        while limit is None or scanned < limit:
+            rows = db.execute(select(BodyModel.hash, BodyModel.content, BodyModel.data, BodyModel.encoding,
+                                     BodyModel.segment, BodyModel.segment_offset, BodyModel.segment_length)
+                              .where(BodyModel.comments_ind.is_(None)).limit(chunk_size)).all()
+            if len(rows) == 0:
+                break
+            found: dict[str, List[Comment]] = {}
+            for row in rows:
+                try:
+                    text = self.body_store.decode(row)
+                except Exception:
+                    text = None
+                found[row.hash] = extract_comments(text) if text else []
+            self._store(db, found)
+            for comments_ind in (True, False):
+                hashes = [body_hash for body_hash, comments in found.items() if (len(comments) > 0) == comments_ind]
+                if len(hashes) > 0:
+                    db.execute(update(ProxyModel).where(ProxyModel.response_body_hash.in_(hashes))
+                               .values(comments_ind=comments_ind), execution_options={'synchronize_session': False})
+            db.commit()
+            scanned += len(rows)
+        if scanned > 0:
+            QUERY_CACHE.clear()
+        return scanned
+
+    @staticmethod
+    def comments(db: Session, target_id: int = None, limit: int = COMMENT_LIST_LIMIT) -> List[CommentRow]:
+        """List the distinct comments, most recently seen first.
+
+        Args:
+            db (Session): The current session to connect to the database.
+            target_id (int): Only list the comments of this target's responses.
+            limit (int): The maximum number of comments.
+
+        Returns:
+            Each comment with the number of bodies it is in and the latest proxy row showing it.
+        """
+        latest = func.max(ProxyModel.id).label('proxy_id')
+        query = select(CommentModel.kind, CommentModel.text, func.count(distinct(CommentModel.body_hash)), latest)\
+            .join(ProxyModel, ProxyModel.response_body_hash == CommentModel.body_hash)
+        if target_id is not None:
+            query = query.where(ProxyModel.target_id == target_id)
+        rows = db.execute(query.group_by(CommentModel.kind, CommentModel.text).order_by(latest.desc()).limit(limit)).all()
+        urls = dict(db.execute(select(ProxyModel.id, ProxyModel.full_url)
+                               .where(ProxyModel.id.in_([row.proxy_id for row in rows]))).all())
+        return [CommentRow(kind, text, bodies, proxy_id, urls.get(proxy_id)) for kind, text, bodies, proxy_id in rows]
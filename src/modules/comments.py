@@ -0,0 +1,110 @@
+"""comments.py"""
+import re
+from typing import Iterator, List, NamedTuple
+
+COMMENT_HTML = 'html'
+COMMENT_LINE = 'line'
+COMMENT_BLOCK = 'block'
+COMMENT_MAX_LENGTH = 1000
+COMMENT_MAX_COUNT = 500
+
+HTML_COMMENT = re.compile(r'<!--(.*?)(?:-->|\Z)', re.S)
+HTML_BLOCK = re.compile(r'<(script|style)\b[^>]*>(.*?)(?:</\1\s*>|\Z)', re.S | re.I)
+CSS_COMMENT = re.compile(r'/\*(.*?)(?:\*/|\Z)', re.S)
+SCRIPT_TOKEN = re.compile(r'''
+    //(?P<line>[^\n]*)
+  | /\*(?P<block>.*?)(?:\*/|\Z)
+  | "(?:[^"\\\n]|\\.)*"
+  | '(?:[^'\\\n]|\\.)*'
+  | `(?:[^`\\]|\\.)*`
+  | (?P<regex>/(?:[^/\\\n\[]|\\.|\[(?:[^\]\\\n]|\\.)*\])+/)
+''', re.S | re.X)
+REGEX_KEYWORDS = {'return', 'typeof', 'instanceof', 'in', 'of', 'new', 'delete', 'void', 'throw', 'case', 'do',
+                  'else', 'yield', 'await'}
+
+
+class Comment(NamedTuple):
+    """A comment found in a body."""
+    kind: str
+    position: int
+    text: str
+
+
+def extract_comments(body: str) -> List[Comment]:
+    """Find the developer comments in a response body.
+
+    HTML (and XML) bodies are recognised by their first character; their
+    `<!-- -->` comments are returned along with the comments of their inline
+    scripts and styles. Other bodies are scanned as JavaScript or CSS for `//`
+    and `/* */` comments. Strings and regular expression literals are skipped,
+    so `"https://..."` is not a comment. JSON and binary bodies have none.
+
+    Args:
+        body (str): The body text.
+
+    Returns:
+        The distinct comments in order, stripped and cut to `COMMENT_MAX_LENGTH`,
+        at most `COMMENT_MAX_COUNT`.
+    """
+    start = body.lstrip('\ufeff \t\r\n')[:1]
+    if start in ('', '{', '[') or '\x00' in body[:1024]:
+        return []
+    if start == '<':
+        found = _html_comments(body)
+    else:
+        found = _script_comments(body)
+    comments: List[Comment] = []
+    seen = set()
+    for kind, position, text in found:
+        text = text.strip()
+        if text == '' or (kind, text) in seen:
+            continue
+        seen.add((kind, text))
+        comments.append(Comment(kind, position, text[:COMMENT_MAX_LENGTH]))
+        if len(comments) == COMMENT_MAX_COUNT:
+            break
+    return comments
+
+
+def _html_comments(body: str) -> Iterator[tuple]:
+    found = [(COMMENT_HTML, match.start(), match.group(1)) for match in HTML_COMMENT.finditer(body)]
+    for block in HTML_BLOCK.finditer(body):
+        if block.group(1).lower() == 'script':
+            found.extend(_script_comments(body, block.start(2), block.end(2)))
+        else:
+            found.extend((COMMENT_BLOCK, match.start(), match.group(1))
+                         for match in CSS_COMMENT.finditer(body, block.start(2), block.end(2)))
+    return iter(sorted(found, key=lambda comment: comment[1]))
+
+
+def _previous(body: str, position: int, start: int) -> str:
+    """Get the last word or character before a position, ignoring whitespace."""
+    end = position
+    while end > start and body[end - 1].isspace():
+        end -= 1
+    begin = end
+    while begin > start and (body[begin - 1].isalnum() or body[begin - 1] in '_$'):
+        begin -= 1
+    return body[begin:end] if begin < end else body[end - 1:end] if end > start else ''
+
+
+def _script_comments(body: str, start: int = 0, end: int = None) -> Iterator[tuple]:
+    end = len(body) if end is None else end
+    position = start
+    while True:
+        match = SCRIPT_TOKEN.search(body, position, end)
+        if match is None:
+            return
+        if match.group('regex') is not None:
+            previous = _previous(body, match.start(), start)
+            if previous != '' and (previous[-1].isalnum() or previous[-1] in '_$)]') and previous not in REGEX_KEYWORDS:
+                position = match.start() + 1
+                continue
+        elif match.group('line') is not None:
+            if match.start() > start and body[match.start() - 1] == ':':
+                position = match.start() + 2
+                continue
+            yield COMMENT_LINE, match.start(), match.group('line')
+        elif match.group('block') is not None:
+            yield COMMENT_BLOCK, match.start(), match.group('block')
+        position = match.end()
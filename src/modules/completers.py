@@ -6,13 +6,14 @@ default_list: list[str] = ['add','checklists','clear','database','exit','help','
 
 add_list: list[str] = ['note','param','path','scope','target']
 checklist_list: list[str] = ['owasp-wstg']
-database_list: list[str] = ['setup','tables']
+database_list: list[str] = ['migrate','prune','setup','tables','version']
 help_list: list[str] = ['checklists','database','proxy','targets']
-proxy_list: list[str] = ['comments','options','requests','responses','search','search-requests','search-responses','start','stop']
+proxy_list: list[str] = ['comments','explain','grep','options','policy','replay','requests','responses','search',
+                          'search-requests','search-responses','start','stats','stop','storage','summary','tail']
 proxy_history_list: list[str] = ['requests','responses']
 
 requests_responses_list = ['100','101','200','201','202','204','301','302','304','400','401','403','404','405','409','418','429','500','502','503','504',
-                                    'api','asc','delete','desc','distinct','foobar','get','head','js','json','options','patch',
+                                    'api','asc','delete','desc','distinct','foobar','get','head','js','json','no-media','options','patch',
                                     'post','put','trace']
 proxy_history_requests: list[str] = requests_responses_list
 proxy_history_responses: list[str] = requests_responses_list
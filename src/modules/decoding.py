@@ -0,0 +1,128 @@
+"""decoding.py"""
+import codecs
+import threading
+from collections import OrderedDict
+import chardet
+from mitmproxy.net.http.headers import parse_content_type
+
+ENCODING_CACHE_SIZE = 4096
+CHARDET_SAMPLE_SIZE = 64 * 1024
+
+
+def decode_header(value: str | bytes) -> str:
+    """Decode a header name or value.
+
+    Args:
+        value: The header name or value.
+
+    Returns:
+        The value as UTF-8 when it is valid UTF-8, otherwise as latin-1.
+    """
+    if isinstance(value, str):
+        return value
+    try:
+        return value.decode('utf-8')
+    except UnicodeDecodeError:
+        return value.decode('latin-1')
+
+
+def content_type_charset(content_type: str | None) -> tuple[str | None, str | None]:
+    """Split a `Content-Type` header into its media type and a known charset.
+
+    Args:
+        content_type: The `Content-Type` header value.
+
+    Returns:
+        (media type, charset) with None for the parts that are missing or unknown.
+    """
+    if not content_type:
+        return None, None
+    parsed = parse_content_type(content_type)
+    if parsed is None:
+        return content_type.split(';', 1)[0].strip().lower() or None, None
+    media_type = f"{parsed[0]}/{parsed[1]}".lower()
+    charset = parsed[2].get('charset')
+    if charset is not None:
+        try:
+            charset = codecs.lookup(charset.strip('"\' ')).name
+        except LookupError:
+            charset = None
+    return media_type, charset
+
+
+class BodyDecoder:
+    """Decode message bodies to text with as little encoding detection as possible.
+
+    A body is decoded with the first of these that works: the `Content-Type`
+    charset, UTF-8, the encoding last detected for the same host and media type,
+    the encoding `chardet` detects on a sample of the body, and finally latin-1.
+    Detected encodings are remembered per (host, media type), so `chardet` only
+    runs for the first non UTF-8 body of a kind.
+    """
+
+    def __init__(self, cache_size: int = ENCODING_CACHE_SIZE) -> None:
+        self.cache_size = max(1, cache_size)
+        self.cache: OrderedDict[tuple, str] = OrderedDict()
+        self.lock = threading.Lock()
+        self.detect_count = 0
+
+    def _cached(self, key: tuple) -> str | None:
+        with self.lock:
+            encoding = self.cache.get(key)
+            if encoding is not None:
+                self.cache.move_to_end(key)
+            return encoding
+
+    def _remember(self, key: tuple, encoding: str) -> None:
+        with self.lock:
+            self.cache[key] = encoding
+            self.cache.move_to_end(key)
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+
+    def decode(self, content: bytes | None, content_type: str | None = None, host: str | None = None) -> str | None:
+        """Decode a body.
+
+        Args:
+            content: The body with any content encoding already removed.
+            content_type: The `Content-Type` header value.
+            host: The host the body came from.
+
+        Returns:
+            The body text, or None when there is no body.
+        """
+        if content is None:
+            return None
+        if isinstance(content, str):
+            return content
+        media_type, charset = content_type_charset(content_type)
+        if charset is not None:
+            try:
+                return content.decode(charset)
+            except UnicodeDecodeError:
+                pass
+
+        try:
+            return content.decode('utf-8')
+        except UnicodeDecodeError:
+            pass
+
+        key = (host, media_type)
+        cached = self._cached(key)
+        if cached is not None:
+            try:
+                return content.decode(cached)
+            except UnicodeDecodeError:
+                pass
+
+        self.detect_count += 1
+        detected = chardet.detect(content[:CHARDET_SAMPLE_SIZE])['encoding']
+        if detected is not None:
+            try:
+                text = content.decode(detected)
+                self._remember(key, codecs.lookup(detected).name)
+                return text
+            except (LookupError, UnicodeDecodeError):
+                pass
+        self._remember(key, 'latin-1')
+        return content.decode('latin-1')
@@ -0,0 +1,155 @@
+"""flowarchive.py"""
+import os
+import threading
+from typing import Iterator
+from mitmproxy import flow as mitmproxy_flow
+from mitmproxy.io import FlowReader, compat, tnetstring
+from modules.segments import DATA_PATH, SEGMENT_MAX_SIZE, SegmentWriter, read_segment, session_prefix
+
+# pylint: disable=R0902
+
+FLOW_ARCHIVE_PATH = os.path.join(DATA_PATH, 'flows')
+INDEX_SUFFIX = '.idx'
+METADATA_PREFIX = 'w3bt00lkit_'
+
+
+def flow_state(flow: mitmproxy_flow.Flow) -> dict:
+    """Get the serializable state of a flow without the toolkit's own metadata.
+
+    The metadata is left out before `get_state` deep-copies it, as some of the
+    toolkit's values, e.g. spilled bodies, cannot be copied.
+
+    Args:
+        flow: The flow.
+
+    Returns:
+        dict
+    """
+    metadata = flow.metadata
+    flow.metadata = {key: value for key, value in metadata.items() if not key.startswith(METADATA_PREFIX)}
+    try:
+        return flow.get_state()
+    finally:
+        flow.metadata = metadata
+
+
+class FlowArchive:
+    """Append-only archive of captured flows in mitmproxy's native format.
+
+    Each target gets a directory with one set of rotating segments per proxy
+    session. A segment is a plain mitmproxy dump, so it can be opened with
+    `mitmproxy -r` or scanned with `FlowArchive.scan`. Every flow written is also
+    appended to the session index as `flow id, segment, offset, length`, and the
+    reference returned by `append` is stored in the `flow` column of the proxy row
+    for random access with `FlowArchive.read`. The toolkit's own flow metadata is
+    left out.
+    """
+
+    def __init__(self, directory: str = FLOW_ARCHIVE_PATH, max_size: int = SEGMENT_MAX_SIZE) -> None:
+        self.directory = directory
+        self.max_size = max_size
+        self.session = session_prefix('session')
+        self.lock = threading.Lock()
+        self.segments: dict[int, SegmentWriter] = {}
+        self.indexes: dict[int, object] = {}
+        self.archived_count = 0
+
+    def _target_segments(self, target_id: int) -> SegmentWriter:
+        with self.lock:
+            segments = self.segments.get(target_id)
+            if segments is None:
+                target_directory = os.path.join(self.directory, f'target-{target_id}')
+                segments = SegmentWriter(target_directory, self.session, self.max_size)
+                os.makedirs(target_directory, exist_ok=True)
+                self.indexes[target_id] = open(os.path.join(target_directory, f'{self.session}{INDEX_SUFFIX}'),
+                                               'a', encoding='utf-8')
+                self.segments[target_id] = segments
+            return segments
+
+    def append(self, flow: mitmproxy_flow.Flow, target_id: int) -> str:
+        """Append a flow to the current session of a target.
+
+        Args:
+            flow: The flow to archive.
+            target_id (int): The target the flow belongs to.
+
+        Returns:
+            The reference of the archived flow.
+        """
+        return self.append_state(flow_state(flow), target_id)
+
+    def append_state(self, state: dict, target_id: int) -> str:
+        """Append a flow from its state, as returned by `flow_state`.
+
+        Args:
+            state (dict): The state of the flow to archive.
+            target_id (int): The target the flow belongs to.
+
+        Returns:
+            The reference of the archived flow.
+        """
+        data = tnetstring.dumps(state)
+        ref = self._target_segments(target_id).append(data)
+        with self.lock:
+            index = self.indexes[target_id]
+            index.write(f"{state['id']}\t{ref.segment}\t{ref.offset}\t{ref.length}\n")
+            index.flush()
+            self.archived_count += 1
+        return f"target-{target_id}/{ref.segment}:{ref.offset}:{ref.length}"
+
+    def close(self) -> None:
+        """Close the open segments and indexes."""
+        with self.lock:
+            for segments in self.segments.values():
+                segments.close()
+            for index in self.indexes.values():
+                index.close()
+            self.segments = {}
+            self.indexes = {}
+
+    @staticmethod
+    def read(reference: str, directory: str = FLOW_ARCHIVE_PATH) -> mitmproxy_flow.Flow:
+        """Read one archived flow.
+
+        Args:
+            reference (str): The reference returned by `append`.
+            directory (str): The archive directory.
+
+        Returns:
+            The flow.
+        """
+        path, offset, length = reference.rsplit(':', 2)
+        target_directory, segment = os.path.split(path)
+        data = read_segment(os.path.join(directory, os.path.basename(target_directory)), segment, int(offset), int(length))
+        return mitmproxy_flow.Flow.from_state(compat.migrate_flow(tnetstring.loads(data)))
+
+    @staticmethod
+    def read_index(path: str) -> dict[str, tuple[str, int, int]]:
+        """Read a session index.
+
+        Args:
+            path (str): The path of the index file.
+
+        Returns:
+            {flow id: (segment, offset, length)}
+        """
+        index = {}
+        with open(path, 'r', encoding='utf-8') as index_file:
+            for line in index_file:
+                parts = line.rstrip('\n').split('\t')
+                if len(parts) == 4:
+                    index[parts[0]] = (parts[1], int(parts[2]), int(parts[3]))
+        return index
+
+    @staticmethod
+    def scan(path: str) -> Iterator[mitmproxy_flow.Flow]:
+        """Read every flow of a segment in order.
+
+        Args:
+            path (str): The path of the segment file.
+
+        Returns:
+            An iterator of flows.
+        """
+        with open(path, 'rb') as segment_file:
+            yield from FlowReader(segment_file).stream()
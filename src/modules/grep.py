@@ -0,0 +1,213 @@
+"""grep.py"""
+import multiprocessing
+import os
+import re
+import signal
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from functools import lru_cache
+from typing import Iterable, Iterator, List, NamedTuple
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from dotenv import load_dotenv
+from modules.bodystore import BODY_SEGMENT_PATH, BodyStore
+from modules.database import Database
+from models import BodyModel, ProxyModel
+
+load_dotenv()
+
+GREP_WORKERS = int(os.environ.get('PROXY_GREP_WORKERS', str(os.cpu_count() or 1)))
+GREP_TASK_BYTES = int(os.environ.get('PROXY_GREP_TASK_BYTES', str(8 * 1024 * 1024)))
+GREP_STREAM_SIZE = 200
+GREP_MAX_MATCHES = 100
+GREP_MATCH_LENGTH = 200
+# Forking a process running the writer, pipeline and event loop threads can copy a held lock into the workers.
+GREP_START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+
+class BodyRow(NamedTuple):
+    """The storage columns of a `BodyModel` row, as `BodyStore.decode` reads them."""
+    content: str | None
+    data: bytes | None
+    encoding: str | None
+    segment: str | None
+    segment_offset: int | None
+    segment_length: int | None
+
+
+class GrepDocument(NamedTuple):
+    """Text to scan: a raw request, an inline response body or a stored body.
+
+    `key` is the proxy id, or the body hash for stored bodies, which are scanned
+    once however many proxy rows share them. Stored bodies are decoded by the
+    worker that scans them.
+    """
+    key: int | str
+    part: str
+    text: str | None = None
+    body: BodyRow | None = None
+
+    def size(self) -> int:
+        """Approximate number of bytes to read."""
+        if self.body is None:
+            return len(self.text)
+        if self.body.segment is not None:
+            return self.body.segment_length or 0
+        return len(self.body.data if self.body.data is not None else self.body.content or '')
+
+
+class GrepMatch(NamedTuple):
+    """A match of `proxy grep`."""
+    proxy_id: int
+    flow_id: str | None
+    part: str
+    offset: int
+    text: str
+    others: int = 0
+
+
+def _ignore_interrupt() -> None:
+    """Leave Ctrl+C to the parent process, which cancels the scan."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+@lru_cache(maxsize=8)
+def _compile(pattern: str) -> re.Pattern:
+    return re.compile(pattern)
+
+
+def scan(pattern: str, documents: List[GrepDocument], segment_path: str = BODY_SEGMENT_PATH,
+         max_matches: int = GREP_MAX_MATCHES) -> List[tuple]:
+    """Find the matches of a regular expression in documents; runs in a worker process.
+
+    Args:
+        pattern (str): The regular expression.
+        documents: The documents of the task.
+        segment_path (str): The directory of the body segments.
+        max_matches (int): The maximum number of matches per document.
+
+    Returns:
+        (key, part, byte offset, matched text) tuples.
+    """
+    regex = _compile(pattern)
+    body_store = BodyStore(segment_path=segment_path)
+    results = []
+    for document in documents:
+        text = document.text if document.body is None else body_store.decode(document.body)
+        if not text:
+            continue
+        position = 0
+        offset = 0
+        for count, match in enumerate(regex.finditer(text)):
+            if count == max_matches:
+                break
+            offset += len(text[position:match.start()].encode('utf-8', 'surrogatepass'))
+            position = match.start()
+            results.append((document.key, document.part, offset, match.group(0)[:GREP_MATCH_LENGTH]))
+    return results
+
+
+class BodyGrep:
+    """Regular expression search over the captured requests and response bodies.
+
+    Proxy rows and stored bodies are streamed from the database with a
+    server-side cursor, grouped into tasks of about `task_bytes` and scanned by
+    a pool of worker processes, so a scan uses every core. Compressed and spilled
+    bodies are decoded by the workers. At most two tasks per worker are in
+    flight, which bounds the memory used, and matches are yielded as tasks
+    finish, so they come in no particular order. The workers are started with
+    `GREP_START_METHOD` rather than forked from the proxy process, so they
+    only get the picklable `scan` tasks and none of its threads or locks.
+    """
+
+    def __init__(self, workers: int = GREP_WORKERS, task_bytes: int = GREP_TASK_BYTES,
+                 max_matches: int = GREP_MAX_MATCHES, segment_path: str = BODY_SEGMENT_PATH) -> None:
+        self.workers = max(1, workers)
+        self.task_bytes = task_bytes
+        self.max_matches = max_matches
+        self.segment_path = segment_path
+
+    def grep(self, pattern: str, target_id: int = None) -> Iterator[GrepMatch]:
+        """Scan the captured traffic.
+
+        Args:
+            pattern (str): The regular expression.
+            target_id (int): Only scan the traffic of this target.
+
+        Returns:
+            The matches, as they are found.
+
+        Raises:
+            re.error: If the pattern is not a valid regular expression.
+        """
+        re.compile(pattern)
+        pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context(GREP_START_METHOD),
+                                   initializer=_ignore_interrupt)
+        pending: set[Future] = set()
+        try:
+            with Database._get_db() as db:
+                for task in self._tasks(db, target_id):
+                    while len(pending) >= self.workers * 2:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        yield from self._resolve(done, target_id)
+                    pending.add(pool.submit(scan, pattern, task, self.segment_path, self.max_matches))
+            while len(pending) > 0:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                yield from self._resolve(done, target_id)
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def _tasks(self, db: Session, target_id: int = None) -> Iterator[List[GrepDocument]]:
+        task: List[GrepDocument] = []
+        size = 0
+        for document in self._documents(db, target_id):
+            task.append(document)
+            size += document.size()
+            if size >= self.task_bytes:
+                yield task
+                task = []
+                size = 0
+        if len(task) > 0:
+            yield task
+
+    @staticmethod
+    def _documents(db: Session, target_id: int = None) -> Iterator[GrepDocument]:
+        """Stream the raw requests, the response bodies left inline and the stored bodies."""
+        rows = select(ProxyModel.id, ProxyModel.raw_request, ProxyModel.response_text).order_by(ProxyModel.id)
+        bodies = select(BodyModel.hash, BodyModel.content, BodyModel.data, BodyModel.encoding, BodyModel.segment,
+                        BodyModel.segment_offset, BodyModel.segment_length)
+        if target_id is not None:
+            rows = rows.where(ProxyModel.target_id == target_id)
+            bodies = bodies.where(BodyModel.hash.in_(
+                select(ProxyModel.response_body_hash).where(ProxyModel.target_id == target_id)))
+        for row in db.execute(rows.execution_options(stream_results=True, yield_per=GREP_STREAM_SIZE)):
+            if row.raw_request:
+                yield GrepDocument(row.id, 'request', row.raw_request)
+            if row.response_text:
+                yield GrepDocument(row.id, 'response', row.response_text)
+        for row in db.execute(bodies.execution_options(stream_results=True, yield_per=GREP_STREAM_SIZE)):
+            yield GrepDocument(row.hash, 'response', body=BodyRow(*row[1:]))
+
+    @staticmethod
+    def _resolve(futures: Iterable[Future], target_id: int = None) -> Iterator[GrepMatch]:
+        """Turn the results of finished tasks into matches, finding the proxy rows of the stored bodies of the target."""
+        results = [result for future in futures for result in future.result()]
+        if len(results) == 0:
+            return
+        ids = {key for key, _, _, _ in results if isinstance(key, int)}
+        hashes = {key for key, _, _, _ in results if isinstance(key, str)}
+        rows: dict = {}
+        with Database._get_db() as db:
+            if len(ids) > 0:
+                for proxy_id, flow_id in db.execute(select(ProxyModel.id, ProxyModel.flow_id).where(ProxyModel.id.in_(ids))):
+                    rows[proxy_id] = [(proxy_id, flow_id)]
+            if len(hashes) > 0:
+                body_rows = select(ProxyModel.response_body_hash, ProxyModel.id, ProxyModel.flow_id).where(
+                    ProxyModel.response_body_hash.in_(hashes))
+                if target_id is not None:
+                    body_rows = body_rows.where(ProxyModel.target_id == target_id)
+                for body_hash, proxy_id, flow_id in db.execute(body_rows.order_by(ProxyModel.id.desc())):
+                    rows.setdefault(body_hash, []).append((proxy_id, flow_id))
+        for key, part, offset, text in results:
+            if key in rows:
+                proxy_id, flow_id = rows[key][0]
+                yield GrepMatch(proxy_id, flow_id, part, offset, text, len(rows[key]) - 1)
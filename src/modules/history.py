@@ -0,0 +1,393 @@
+"""history.py"""
+import os
+import re
+from collections import OrderedDict
+from typing import List, NamedTuple
+from sqlalchemy import Select, desc, func, select, tuple_
+from sqlalchemy.orm import Session
+from dotenv import load_dotenv
+from modules.bodystore import BodyStore
+from modules.database import Database
+from modules.querycache import EVERYTHING, QUERY_CACHE, CachedView, QueryCache, merge_rows
+from modules.search import SearchIndex
+from modules.searchquery import SearchTerm
+from models import BodyModel, ProxyModel
+
+load_dotenv()
+
+# pylint: disable=W0718
+
+HISTORY_PAGE_SIZE = int(os.environ.get('PROXY_HISTORY_PAGE_SIZE', '25'))
+HISTORY_CACHED_PAGES = int(os.environ.get('PROXY_HISTORY_CACHED_PAGES', '8'))
+
+
+class ProxyRow(NamedTuple):
+    """The columns of a proxy row shown in the history list."""
+    id: int
+    timestamp_start: int
+    action: str
+    method: str
+    response_status_code: int
+    full_url: str
+
+
+LIST_COLUMNS = [getattr(ProxyModel, column) for column in ProxyRow._fields]
+
+
+def approximate_count(db: Session, statement: Select) -> int:
+    """Count the rows of a query cheaply.
+
+    On PostgreSQL this is the planner's row estimate, which needs no scan;
+    other backends count exactly.
+
+    Args:
+        db (Session): The current session to connect to the database.
+        statement (Select): The query.
+
+    Returns:
+        The (estimated) number of rows.
+    """
+    statement = statement.order_by(None)
+    if db.bind.dialect.name == 'postgresql':
+        try:
+            compiled = statement.compile(dialect=db.bind.dialect)
+            plan = db.connection().exec_driver_sql(f"EXPLAIN (FORMAT JSON) {compiled}", compiled.params).scalar()
+            return int(plan[0]['Plan']['Plan Rows'])
+        except Exception:
+            db.rollback()
+    return db.scalar(select(func.count()).select_from(statement.subquery()))
+
+
+def explain(db: Session, statement: Select) -> List[str]:
+    """Get the query plan of a statement.
+
+    On PostgreSQL sequential scans are disabled for the explain, so the plan
+    shows whether an index can serve the query even when the table is still
+    small enough for the planner to prefer scanning it.
+
+    Args:
+        db (Session): The current session to connect to the database.
+        statement (Select): The query.
+
+    Returns:
+        The lines of the plan.
+    """
+    compiled = statement.compile(dialect=db.bind.dialect)
+    connection = db.connection()
+    if db.bind.dialect.name == 'postgresql':
+        connection.exec_driver_sql("SET LOCAL enable_seqscan = off")
+        lines = [row[0] for row in connection.exec_driver_sql(f"EXPLAIN {compiled}", compiled.params)]
+        db.rollback()
+        return lines
+    parameters = tuple(compiled.params[name] for name in compiled.positiontup)
+    return [row[3] for row in connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}", parameters)]
+
+
+def plan_indexes(plan: List[str]) -> tuple[List[str], bool]:
+    """Get the indexes a query plan uses and whether it scans the whole proxy table.
+
+    Args:
+        plan: The lines returned by `explain`.
+
+    Returns:
+        (index names, full scan)
+    """
+    indexes = []
+    for line in plan:
+        match = re.search(r'(?:Index (?:Only )?Scan(?: Backward)? using|Bitmap Index Scan on|USING (?:COVERING )?INDEX) (\w+)', line)
+        if match is not None and match.group(1) not in indexes:
+            indexes.append(match.group(1))
+    full_scan = any(re.search(r'Seq Scan on proxy\b|^SCAN proxy(?! USING)', line.strip()) for line in plan)
+    return indexes, full_scan
+
+
+def planned_queries(target_id: int = None) -> List[tuple[str, Select]]:
+    """Get the first page query of the history views, to check their plans.
+
+    Args:
+        target_id (int): The selected target, if any.
+
+    Returns:
+        (command, query) pairs.
+    """
+    target = [ProxyModel.target_id == target_id] if target_id is not None else []
+    responses = [ProxyModel.response_status_code.isnot(None), *target]
+    views = [
+        ('proxy history', target),
+        ('proxy responses', responses),
+        ('proxy responses get', [*responses, ProxyModel.method == 'GET']),
+        ('proxy responses 200', [*responses, ProxyModel.response_status_code == 200]),
+        ('proxy responses 200 get', [*responses, ProxyModel.response_status_code == 200, ProxyModel.method == 'GET']),
+        ('proxy requests js', [ProxyModel.path.endswith('.js'), *target])
+    ]
+    queries = [(command, HistoryPages(criteria, cache=None).page_statement()) for command, criteria in views]
+    queries.append(('proxy history (next page)', HistoryPages(target, cache=None).page_statement((1700000000, 1))))
+    return queries
+
+
+class HistoryPages:
+    """Proxy history rows matching some criteria, read from the database a page at a time.
+
+    Rows are ordered newest first on (`timestamp_start`, `id`). Each page is
+    read with a keyset condition on the last row of the page before it, so the
+    database seeks straight to it instead of skipping all earlier rows. The
+    cursors of the pages visited are kept, so moving back and forth reuses them,
+    and the last `HISTORY_CACHED_PAGES` pages are cached. Indexing and `len`
+    make it usable like the list of rows it replaces; `len` is approximate.
+
+    Only the list columns are read, as `ProxyRow` tuples; the bodies of a row
+    are loaded by id with `get_proxy_record` when it is opened.
+
+    The newest rows of a view are kept in the `QueryCache`, keyed by target and
+    criteria, so opening the same view again reads nothing until new flows are
+    captured, and then only the rows that changed.
+    """
+
+    def __init__(self, criteria: list = None, outerjoin_bodies: bool = False, distinct_url: bool = False,
+                 page_size: int = HISTORY_PAGE_SIZE, target_id: int = None, cache: QueryCache = QUERY_CACHE) -> None:
+        """Build the query.
+
+        Args:
+            criteria (list): Filter criteria on `ProxyModel` (and `BodyModel`).
+            outerjoin_bodies (bool): Join the stored bodies, for criteria on `BodyModel`.
+            distinct_url (bool): Only keep the latest row of each `full_url`.
+            page_size (int): The number of rows per page.
+            target_id (int): Only show the rows of this target.
+            cache (QueryCache): The cache of the view, None to always read the database.
+        """
+        criteria = [ProxyModel.timestamp_start.isnot(None), *(criteria or [])]
+        if target_id is not None:
+            criteria.append(ProxyModel.target_id == target_id)
+        if distinct_url:
+            latest = select(func.max(ProxyModel.id))
+            if outerjoin_bodies:
+                latest = latest.outerjoin(BodyModel, BodyModel.hash == ProxyModel.response_body_hash)
+            statement = select(*LIST_COLUMNS).where(ProxyModel.id.in_(latest.where(*criteria).group_by(ProxyModel.full_url)))
+        else:
+            statement = select(*LIST_COLUMNS)
+            if outerjoin_bodies:
+                statement = statement.outerjoin(BodyModel, BodyModel.hash == ProxyModel.response_body_hash)
+            statement = statement.where(*criteria)
+        self.statement = statement
+        self.page_size = max(1, page_size)
+        self.cursors: List[tuple | None] = [None]
+        self.pages: OrderedDict[int, List[ProxyRow]] = OrderedDict()
+        self.total = None
+        self.target_id = target_id
+        self.distinct_url = distinct_url
+        self.cache = cache
+        self.cache_key = self._cache_key(criteria, outerjoin_bodies, distinct_url) if cache is not None else None
+        self.view: CachedView | None = None
+
+    def _cache_key(self, criteria: list, outerjoin_bodies: bool, distinct_url: bool) -> tuple | None:
+        """Normalize the view to a cache key, None if its criteria cannot be rendered."""
+        try:
+            rendered = sorted(str(criterion.compile(compile_kwargs={'literal_binds': True})) for criterion in criteria)
+        except Exception:
+            return None
+        return (self.target_id, tuple(rendered), outerjoin_bodies, distinct_url)
+
+    def _cached_view(self) -> CachedView | None:
+        """Get the newest rows of the view from the cache, reading what changed since they were cached."""
+        if self.view is not None or self.cache_key is None:
+            return self.view
+        view = self.cache.get(self.cache_key)
+        low = EVERYTHING if view is None else self.cache.refresh_from(self.target_id, view.sequence)
+        if low is None:
+            self.view = view
+            return view
+        sequence = self.cache.sequence(self.target_id)
+        max_rows = self.cache.max_rows
+        order = (desc(ProxyModel.timestamp_start), desc(ProxyModel.id))
+        with Database._get_db() as db:
+            if low == EVERYTHING or self.distinct_url or (not view.complete and low <= view.rows[-1].timestamp_start):
+                rows = [ProxyRow(*row) for row in db.execute(self.statement.order_by(*order).limit(max_rows + 1))]
+                self.view = CachedView(rows[:max_rows], len(rows) <= max_rows, sequence)
+            else:
+                fetched = [ProxyRow(*row) for row in db.execute(
+                    self.statement.where(ProxyModel.timestamp_start >= low).order_by(*order).limit(max_rows))]
+                rows, truncated = merge_rows(view.rows, fetched, low, max_rows)
+                count = None
+                if view.count is not None and len(fetched) < max_rows:
+                    count = view.count + len(fetched) - sum(1 for row in view.rows if row.timestamp_start >= low)
+                self.view = CachedView(rows, view.complete and not truncated, sequence, count)
+        self.cache.put(self.cache_key, self.view)
+        return self.view
+
+    def page_statement(self, cursor: tuple | None = None) -> Select:
+        """Get the query of the page after a cursor, the first page without one."""
+        statement = self.statement
+        if cursor is not None:
+            statement = statement.where(tuple_(ProxyModel.timestamp_start, ProxyModel.id) < tuple_(*cursor))
+        return statement.order_by(desc(ProxyModel.timestamp_start), desc(ProxyModel.id)).limit(self.page_size)
+
+    def _read_page(self, number: int) -> List[ProxyRow]:
+        view = self._cached_view()
+        start = number * self.page_size
+        if view is not None and (view.complete or start + self.page_size <= len(view.rows)):
+            return view.rows[start:start + self.page_size]
+        with Database._get_db() as db:
+            return [ProxyRow(*row) for row in db.execute(self.page_statement(self.cursors[number]))]
+
+    def page(self, number: int) -> List[ProxyRow]:
+        """Get a page of rows.
+
+        Args:
+            number (int): The page, starting at 0.
+
+        Returns:
+            The rows of the page, empty past the last page.
+        """
+        if number < 0:
+            return []
+        if number in self.pages:
+            self.pages.move_to_end(number)
+            return self.pages[number]
+        while len(self.cursors) <= number:
+            if len(self.page(len(self.cursors) - 1)) < self.page_size:
+                return []
+        rows = self._read_page(number)
+        if len(rows) == self.page_size and len(self.cursors) == number + 1:
+            self.cursors.append((rows[-1].timestamp_start, rows[-1].id))
+        self.pages[number] = rows
+        if len(self.pages) > HISTORY_CACHED_PAGES:
+            self.pages.popitem(last=False)
+        return rows
+
+    def count(self) -> int:
+        """Get the approximate number of rows, counted once."""
+        if self.total is None:
+            view = self._cached_view()
+            if view is not None and view.complete:
+                self.total = len(view.rows)
+            elif view is not None and view.count is not None:
+                self.total = view.count
+            else:
+                with Database._get_db() as db:
+                    self.total = approximate_count(db, self.statement)
+                if view is not None:
+                    view.count = self.total
+        return self.total
+
+    def __len__(self) -> int:
+        return self.count()
+
+    def __getitem__(self, index: int) -> ProxyRow:
+        if index < 0:
+            raise IndexError(index)
+        number, offset = divmod(index, self.page_size)
+        rows = self.page(number)
+        if offset >= len(rows):
+            raise IndexError(index)
+        return rows[offset]
+
+
+class SearchRow(NamedTuple):
+    """A proxy row found by `proxy search`, with where it matched."""
+    id: int
+    timestamp_start: int
+    action: str
+    method: str
+    response_status_code: int
+    full_url: str
+    snippet: str | None
+
+
+class SearchPages:
+    """Ranked `proxy search` results, read from the database a page at a time.
+
+    The search index returns the ids of the best matches up front; the list
+    columns and match snippets are read for the page shown only. It is used
+    like `HistoryPages`.
+    """
+
+    def __init__(self, terms: List[SearchTerm], target_id: int = None, requests: bool = True,
+                 responses: bool = True, page_size: int = HISTORY_PAGE_SIZE) -> None:
+        """Run the search.
+
+        Args:
+            terms: The parsed query.
+            target_id (int): Only search the rows of this target.
+            requests (bool): Search the requests.
+            responses (bool): Search the responses.
+            page_size (int): The number of rows per page.
+        """
+        self.terms = terms
+        self.requests = requests
+        self.responses = responses
+        self.page_size = max(1, page_size)
+        self.search_index = SearchIndex()
+        with Database._get_db() as db:
+            self.ids = self.search_index.search(db, terms, target_id, requests, responses)
+        self.pages: OrderedDict[int, List[SearchRow]] = OrderedDict()
+
+    def page(self, number: int) -> List[SearchRow]:
+        """Get a page of rows.
+
+        Args:
+            number (int): The page, starting at 0.
+
+        Returns:
+            The rows of the page, empty past the last page.
+        """
+        if number < 0:
+            return []
+        if number in self.pages:
+            self.pages.move_to_end(number)
+            return self.pages[number]
+        ids = self.ids[number * self.page_size:(number + 1) * self.page_size]
+        if len(ids) == 0:
+            return []
+        with Database._get_db() as db:
+            rows = {row.id: row for row in db.execute(select(*LIST_COLUMNS).where(ProxyModel.id.in_(ids)))}
+            snippets = self.search_index.snippets(db, self.terms, ids, self.requests, self.responses)
+        page = [SearchRow(*rows[proxy_id], snippets.get(proxy_id)) for proxy_id in ids if proxy_id in rows]
+        self.pages[number] = page
+        if len(self.pages) > HISTORY_CACHED_PAGES:
+            self.pages.popitem(last=False)
+        return page
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __getitem__(self, index: int) -> SearchRow:
+        if index < 0:
+            raise IndexError(index)
+        number, offset = divmod(index, self.page_size)
+        rows = self.page(number)
+        if offset >= len(rows):
+            raise IndexError(index)
+        return rows[offset]
+
+
+def get_proxy_record(record_id: int) -> ProxyModel | None:
+    """Load every column of a proxy row, with the response body from the body store.
+
+    Args:
+        record_id (int): The id of the row.
+
+    Returns:
+        The detached row, or None if it does not exist.
+    """
+    with Database._get_db() as db:
+        record = db.get(ProxyModel, record_id)
+        if record is None:
+            return None
+        db.expunge(record)
+        if record.response_text is None and record.response_body_hash is not None:
+            record.response_text = BodyStore().get_text(db, record.response_body_hash)
+    return record
+
+
+def load_proxy_record(row: ProxyRow | SearchRow | ProxyModel) -> ProxyModel | None:
+    """Get the full proxy row of a history or search result.
+
+    Args:
+        row: A list row, or an already loaded `ProxyModel`.
+
+    Returns:
+        The `ProxyModel`, or None if the row no longer exists.
+    """
+    if isinstance(row, ProxyModel):
+        return row
+    return get_proxy_record(row.id)
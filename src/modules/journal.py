@@ -0,0 +1,176 @@
+"""journal.py"""
+import json
+import os
+import threading
+import time
+from typing import List
+from dotenv import load_dotenv
+from modules.segments import DATA_PATH
+
+load_dotenv()
+
+# pylint: disable=R0902
+
+JOURNAL_PATH = os.path.join(DATA_PATH, 'journal')
+JOURNAL_FSYNC_INTERVAL = float(os.environ.get('JOURNAL_FSYNC_INTERVAL', '0.2'))
+
+
+def journal_owner(path: str) -> int | None:
+    """Get the process id in the name of a journal.
+
+    Journals are named after `session_prefix`, `<kind>-<date>-<time>-<pid>`,
+    optionally followed by a sequence number.
+
+    Args:
+        path (str): The journal file.
+
+    Returns:
+        The process id, or None if the name has none.
+    """
+    parts = os.path.splitext(os.path.basename(path))[0].split('-')
+    if len(parts) >= 4 and parts[3].isdigit():
+        return int(parts[3])
+    return None
+
+def held_by_other_process(path: str) -> bool:
+    """Check whether the process that wrote a journal is still running, so it may still be appending to it.
+
+    Args:
+        path (str): The journal file.
+
+    Returns:
+        True if another live process owns the journal.
+    """
+    pid = journal_owner(path)
+    if pid is None or pid == os.getpid():
+        return False
+    if os.name == 'nt':
+        # os.kill cannot probe a process on Windows, so leave the journal alone.
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class Journal:
+    """Append-only JSON lines file of proxy records.
+
+    Appends are flushed to the operating system right away and fsynced at most
+    every `fsync_interval` seconds (call `sync` to force it). Records are read
+    back from a byte offset, so a reader can resume where it stopped.
+    """
+
+    def __init__(self, path: str, fsync_interval: float = JOURNAL_FSYNC_INTERVAL) -> None:
+        self.path = path
+        self.fsync_interval = fsync_interval
+        self.lock = threading.RLock()
+        self.file = None
+        self.synced = time.monotonic()
+        self.dirty = False
+
+    def _open(self):
+        if self.file is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self.file = open(self.path, 'ab')
+        return self.file
+
+    def append(self, records: dict | List[dict]) -> int:
+        """Append one or more records.
+
+        Args:
+            records: A record or a list of records of JSON serializable values.
+
+        Returns:
+            The size of the journal after the append.
+        """
+        if isinstance(records, dict):
+            records = [records]
+        data = b''.join(json.dumps(record, separators=(',', ':')).encode('utf-8') + b'\n' for record in records)
+        with self.lock:
+            journal_file = self._open()
+            journal_file.write(data)
+            journal_file.flush()
+            self.dirty = True
+            if time.monotonic() - self.synced >= self.fsync_interval:
+                self._sync()
+            return journal_file.tell()
+
+    def _sync(self) -> None:
+        if self.file is not None and self.dirty:
+            os.fsync(self.file.fileno())
+        self.dirty = False
+        self.synced = time.monotonic()
+
+    def sync(self) -> None:
+        """Fsync the appended records."""
+        with self.lock:
+            self._sync()
+
+    def size(self) -> int:
+        """Size of the journal in bytes."""
+        with self.lock:
+            if self.file is not None:
+                return self.file.tell()
+        try:
+            return os.path.getsize(self.path)
+        except FileNotFoundError:
+            return 0
+
+    def read(self, offset: int = 0, limit: int = None) -> tuple[List[dict], int]:
+        """Read records from a byte offset.
+
+        A partly written last line, e.g. after a crash, is left for the next read.
+
+        Args:
+            offset (int): The byte offset to start from.
+            limit (int): The maximum number of records to read.
+
+        Returns:
+            (records, offset after the last record read)
+        """
+        records: List[dict] = []
+        try:
+            with open(self.path, 'rb') as journal_file:
+                journal_file.seek(offset)
+                while limit is None or len(records) < limit:
+                    line = journal_file.readline()
+                    if not line.endswith(b'\n'):
+                        break
+                    offset += len(line)
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        continue
+        except FileNotFoundError:
+            pass
+        return records, offset
+
+    def reset(self, offset: int = None) -> bool:
+        """Empty the journal.
+
+        Args:
+            offset (int): Only empty it if nothing was appended after this offset.
+
+        Returns:
+            True if the journal was emptied.
+        """
+        with self.lock:
+            journal_file = self._open()
+            if offset is not None and journal_file.tell() != offset:
+                return False
+            journal_file.truncate(0)
+            journal_file.seek(0)
+            self._sync()
+            return True
+
+    def close(self) -> None:
+        """Fsync and close the journal."""
+        with self.lock:
+            self._sync()
+            if self.file is not None:
+                self.file.close()
+                self.file = None
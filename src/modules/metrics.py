@@ -0,0 +1,162 @@
+"""metrics.py"""
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Iterator
+from dotenv import load_dotenv
+
+load_dotenv()
+
+HISTOGRAM_SAMPLES = 2048
+METRICS_FILE = os.environ.get('PROXY_METRICS_FILE', '')
+METRICS_INTERVAL = float(os.environ.get('PROXY_METRICS_INTERVAL', '15'))
+METRICS_PREFIX = 'w3bt00lkit_proxy'
+PERCENTILES = (50, 95, 99)
+
+
+class Histogram:
+    """Latency histogram over a sliding window of the most recent samples.
+
+    The count and sum cover every sample; the percentiles are computed from the
+    last `size` samples so they follow the current load.
+    """
+
+    def __init__(self, size: int = HISTOGRAM_SAMPLES) -> None:
+        self.samples: deque = deque(maxlen=max(1, size))
+        self.count = 0
+        self.total = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        """Add a sample.
+
+        Args:
+            value (float): The sample, in seconds for timers.
+
+        Returns:
+            None
+        """
+        with self.lock:
+            self.samples.append(value)
+            self.count += 1
+            self.total += value
+
+    def percentiles(self, percentiles: tuple = PERCENTILES) -> dict[int, float]:
+        """Get percentiles of the recent samples with the nearest-rank method.
+
+        Args:
+            percentiles: The percentiles to compute.
+
+        Returns:
+            {percentile: value}, empty when there are no samples.
+        """
+        with self.lock:
+            samples = sorted(self.samples)
+        if len(samples) == 0:
+            return {}
+        return {percentile: samples[max(0, -(-percentile * len(samples) // 100) - 1)] for percentile in percentiles}
+
+
+class Metrics:
+    """Timers, counters and gauges of the proxy capture path."""
+
+    def __init__(self, histogram_size: int = HISTOGRAM_SAMPLES) -> None:
+        self.histogram_size = histogram_size
+        self.timers: dict[str, Histogram] = {}
+        self.counters: dict[str, int] = {}
+        self.gauges: dict[str, Callable[[], float]] = {}
+        self.lock = threading.Lock()
+        self.started = time.time()
+
+    def _histogram(self, name: str) -> Histogram:
+        histogram = self.timers.get(name)
+        if histogram is None:
+            with self.lock:
+                histogram = self.timers.setdefault(name, Histogram(self.histogram_size))
+        return histogram
+
+    def observe(self, name: str, seconds: float) -> None:
+        """Record the duration of a stage."""
+        self._histogram(name).observe(seconds)
+
+    @contextmanager
+    def timer(self, name: str) -> Iterator[None]:
+        """Time the body of a `with` block as a stage.
+
+        Args:
+            name (str): The stage name.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def inc(self, name: str, value: int = 1) -> None:
+        """Increase a counter."""
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def gauge(self, name: str, callback: Callable[[], float]) -> None:
+        """Register a gauge read when the metrics are reported."""
+        self.gauges[name] = callback
+
+    def snapshot(self) -> dict:
+        """Get the current value of every metric.
+
+        Returns:
+            {'timers': {name: {'count', 'sum', 50, 95, 99}}, 'counters': {...}, 'gauges': {...}}
+        """
+        timers = {}
+        for name, histogram in sorted(self.timers.items()):
+            timers[name] = {'count': histogram.count, 'sum': histogram.total, **histogram.percentiles()}
+        gauges = {}
+        for name, callback in sorted(self.gauges.items()):
+            try:
+                gauges[name] = callback()
+            except Exception: # pylint: disable=W0718
+                gauges[name] = float('nan')
+        with self.lock:
+            counters = dict(sorted(self.counters.items()))
+        return {'timers': timers, 'counters': counters, 'gauges': gauges}
+
+    def to_prometheus(self, prefix: str = METRICS_PREFIX) -> str:
+        """Format the metrics in the Prometheus text exposition format.
+
+        Args:
+            prefix (str): The metric name prefix.
+
+        Returns:
+            str
+        """
+        snapshot = self.snapshot()
+        lines = [f"# TYPE {prefix}_stage_seconds summary"]
+        for name, timer in snapshot['timers'].items():
+            for percentile in PERCENTILES:
+                if percentile in timer:
+                    lines.append(f'{prefix}_stage_seconds{{stage="{name}",quantile="{percentile / 100}"}} {timer[percentile]:.9f}')
+            lines.append(f'{prefix}_stage_seconds_sum{{stage="{name}"}} {timer["sum"]:.9f}')
+            lines.append(f'{prefix}_stage_seconds_count{{stage="{name}"}} {timer["count"]}')
+        for name, value in snapshot['counters'].items():
+            lines.append(f"# TYPE {prefix}_{name}_total counter")
+            lines.append(f"{prefix}_{name}_total {value}")
+        for name, value in snapshot['gauges'].items():
+            lines.append(f"# TYPE {prefix}_{name} gauge")
+            lines.append(f"{prefix}_{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str) -> None:
+        """Write the metrics to a file, replacing it atomically so scrapers never read a partial file.
+
+        Args:
+            path (str): The metrics file.
+
+        Returns:
+            None
+        """
+        temporary_path = f"{path}.tmp"
+        with open(temporary_path, 'w', encoding='utf-8') as metrics_file:
+            metrics_file.write(self.to_prometheus())
+        os.replace(temporary_path, path)
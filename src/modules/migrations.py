@@ -0,0 +1,143 @@
+"""migrations.py"""
+from typing import Callable, List, NamedTuple
+from sqlalchemy import Connection, func, insert, inspect, select, text
+from sqlalchemy.orm import Session
+from models import Base, SchemaVersionModel, TrafficSummaryModel
+from modules.querycache import QUERY_CACHE
+from modules.search import SEARCH_TABLE, SearchIndex
+from modules.summarytable import SummaryTable
+
+MERGE_LEGACY_PROXY_ROWS = """
+DELETE FROM proxy
+WHERE action = 'Request' AND flow_id IS NULL AND EXISTS (
+    SELECT 1 FROM proxy AS response_row
+    WHERE response_row.action = 'Response' AND response_row.flow_id IS NULL
+    AND response_row.target_id = proxy.target_id AND response_row.timestamp_start = proxy.timestamp_start
+    AND response_row.method = proxy.method AND response_row.full_url = proxy.full_url
+)
+"""
+KEY_LEGACY_PROXY_ROWS = "UPDATE proxy SET flow_id = 'legacy-' || CAST(id AS VARCHAR) WHERE flow_id IS NULL"
+
+
+class Migration(NamedTuple):
+    """A versioned change of the database schema.
+
+    `function` runs inside the migration transaction and returns the messages
+    to show, e.g. the number of rows it changed.
+    """
+    version: int
+    description: str
+    function: Callable[[Connection], List[str]]
+
+
+def _fold_legacy_proxy_rows(connection: Connection) -> List[str]:
+    """Fold the legacy `Request`/`Response` row pairs of the proxy table into one row per flow."""
+    merged = connection.execute(text(MERGE_LEGACY_PROXY_ROWS)).rowcount
+    keyed = connection.execute(text(KEY_LEGACY_PROXY_ROWS)).rowcount
+    return [f"Merged {merged} legacy request row(s) into their response row.",
+            f"Assigned a flow id to {keyed} legacy proxy row(s)."]
+
+
+def _create_indexes(*names: str) -> Callable[[Connection], List[str]]:
+    """Get a migration function creating the model indexes with these names."""
+    def create_indexes(connection: Connection) -> List[str]:
+        created = []
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                if index.name in names:
+                    index.create(connection, checkfirst=True)
+                    created.append(index.name)
+        return [f"Created index {name} (if missing)." for name in created]
+    return create_indexes
+
+
+def _build_traffic_summary(connection: Connection) -> List[str]:
+    """Create the traffic summary table and count the proxy rows already stored."""
+    TrafficSummaryModel.__table__.create(connection, checkfirst=True)
+    with Session(bind=connection) as db:
+        counted = SummaryTable().rebuild(db)
+    return [f"Counted {counted} proxy row(s) in the traffic summary."]
+
+
+def _index_bodies_once(connection: Connection) -> List[str]:
+    """Create the body search table and clear the row documents holding whole bodies, for `backfill` to index again."""
+    messages = SearchIndex.ensure(connection) + _create_indexes('ix_body_search_ind')(connection)
+    if connection.dialect.name == 'postgresql':
+        cleared = connection.execute(text(f"SELECT count(*) FROM {SEARCH_TABLE}")).scalar()
+        connection.execute(text(f"TRUNCATE {SEARCH_TABLE}"))
+    else:
+        cleared = connection.execute(text(f"DELETE FROM {SEARCH_TABLE}")).rowcount
+    return [*messages, f"Cleared {cleared} search document(s), the backfill of 'database migrate' indexes them again."]
+
+
+MIGRATIONS: List[Migration] = [
+    Migration(1, 'Fold the legacy proxy rows', _fold_legacy_proxy_rows),
+    Migration(2, 'Create the model indexes', _create_indexes(
+        'ix_body_comments_ind',
+        'ux_name_version_item',
+        'ix_comment_body_hash',
+        'ix_proxy_flow_id',
+        'ix_proxy_response_body_hash',
+        'ix_proxy_target_id_timestamp_start_id',
+        'ix_synackmission_id',
+        'ix_synacktarget_id',
+        'ix_synacktarget_target_codename',
+        'ix_synacktarget_target_id',
+        'ix_target_id',
+        'ix_target_name',
+        'ix_capturepolicy_id',
+        'ix_capturepolicy_target_id',
+        'ix_targetnote_id',
+        'ix_targetnote_target_id',
+        'ix_targetscope_id',
+        'ix_targetscope_target_id',
+        'ux_target_id_fqdn_path')),
+    Migration(3, 'Create the proxy search index', SearchIndex.ensure),
+    Migration(4, 'Add the proxy history indexes', _create_indexes(
+        'ix_proxy_timestamp_start_id',
+        'ix_proxy_target_id_response_status_code_timestamp_start_id',
+        'ix_proxy_responses_target_id_timestamp_start_id',
+        'ix_proxy_responses_target_id_method_timestamp_start_id',
+        'ix_proxy_target_id_host_path')),
+    Migration(5, 'Build the traffic summary', _build_traffic_summary),
+    Migration(6, 'Index the response bodies once per body', _index_bodies_once)
+]
+
+
+def schema_version(connection: Connection) -> int:
+    """Get the version of the last migration applied to the database, 0 if none."""
+    if not inspect(connection).has_table(SchemaVersionModel.__tablename__):
+        return 0
+    return connection.execute(select(func.max(SchemaVersionModel.version))).scalar() or 0
+
+
+def pending_migrations(connection: Connection) -> List[Migration]:
+    """Get the migrations not applied to the database yet."""
+    version = schema_version(connection)
+    return [migration for migration in MIGRATIONS if migration.version > version]
+
+
+def apply_migrations(connection: Connection) -> List[tuple[Migration, List[str]]]:
+    """Apply the pending migrations in order and record their versions.
+
+    Every migration is written so that it can run on a database already in
+    the state it produces, as databases migrated before versions were recorded
+    start at version 0.
+
+    Args:
+        connection (Connection): A connection inside a transaction.
+
+    Returns:
+        The migrations applied, with their messages.
+    """
+    pending = pending_migrations(connection)
+    SchemaVersionModel.__table__.create(connection, checkfirst=True)
+    applied = []
+    for migration in pending:
+        messages = migration.function(connection)
+        connection.execute(insert(SchemaVersionModel).values(version=migration.version,
+                                                             description=migration.description))
+        applied.append((migration, messages))
+    if len(applied) > 0:
+        QUERY_CACHE.clear()
+    return applied
@@ -1,11 +1,13 @@
 """owaspwstg.py"""
 from prompt_toolkit import PromptSession
 from prompt_toolkit.completion import WordCompleter
+from prompt_toolkit.key_binding import KeyBindings
+from prompt_toolkit.keys import Keys
 from sqlalchemy.orm.session import Session
 from typing import Any, Generator, List, Literal
-import pandas as pd
-from tabulate import tabulate
+from rich.table import Table
 from modules.database import Database
+from modules.pager import Pager
 from models import ChecklistModel
 from .common import word_completer
 
@@ -56,50 +58,57 @@ class OWASPWSTGz():
             self.select_an_item = False
             raise KeyboardInterrupt
 
+    @staticmethod
+    def _checklist_table(rows: List[dict], start_index: int) -> Table:
+        """Build the table of a page of checklist items, numbering its rows from `start_index`."""
+        table = Table()
+        table.add_column('#')
+        for key in rows[0]:
+            table.add_column(key)
+        for local_counter, record in enumerate(rows, start_index):
+            table.add_row(str(local_counter), *[str(value) for value in record.values()])
+        return table
+
     def _paginated_print_x(self, data, page_size=25):
         """Prints data in paginated format.
 
+        The left and right keys move between pages; columns too wide for the
+        console are printed in a second table.
+
         Args:
-            data: A list of lists or a 2D array representing the data to be printed.
+            data: The checklist items to print, as dicts.
             page_size: The number of records to display per page.
         """
-
-        start_index = 0
-        end_index = page_size
-        df = pd.DataFrame(data)
-        df.index.name = '#'
+        pager = Pager(data, self._checklist_table, page_size)
         running = True
-        while running and start_index < len(data):
+        while running and len(pager.show()) > 0:
             global prompt_user
             prompt_user = True
-            page_data = df.iloc[start_index:end_index]
-            print(tabulate(page_data, headers='keys', tablefmt='psql'))
-            print("zzWhat would you like to do next ([enter]=select an item, [n + enter]=next page)?")
+            self.press_left = False
+            self.press_right = False
+            print("zzWhat would you like to do next ([enter]=select an item, [n + enter]=next page, left, right)?")
             prompt_session = PromptSession(key_bindings=self.kb)
 
             while prompt_user:
-                text = prompt_session.prompt(' > ')
+                try:
+                    text = prompt_session.prompt(' > ')
+                except KeyboardInterrupt:
+                    if not self.press_left and not self.press_right:
+                        return
+                    break
                 if '' == text:
                     prompt_user = False
                     running = False
-                    self.press_right = True
-                    self.press_left = False
                 elif 'n' == text:
                     prompt_user = False
-                    running = True
-
-            self.previous_start_index = self.start_index
-            self.previous_end_index = self.end_index
+                    self.press_right = True
 
             if self.press_right:
-                self.start_index += page_size
-                self.end_index += page_size
+                pager.number += 1
             elif self.press_left:
-                if self.start_index > 0:
-                    self.start_index -= page_size
-                    self.end_index -= page_size
-                else:
+                if pager.number == 0:
                     return
+                pager.number -= 1
 
     def _classhelp(self):
         """Help for Web Security Testing Guide (WSTG).
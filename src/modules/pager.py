@@ -0,0 +1,153 @@
+"""pager.py"""
+import copy
+import dataclasses
+from typing import Any, Callable, List, Protocol, Sequence
+from rich.console import Console
+from rich.measure import Measurement
+from rich.table import Table
+
+PAGE_SIZE = 25
+CONSOLE = Console()
+
+
+class PageSource(Protocol):
+    """Rows read a page at a time, such as `HistoryPages`, `SearchPages` or `ListPages`."""
+    page_size: int
+
+    def page(self, number: int) -> List[Any]:
+        """Get a page of rows, empty past the last page."""
+
+    def __len__(self) -> int:
+        """Get the (approximate) number of rows."""
+
+
+class ListPages:
+    """A list of rows served a page at a time, like the database backed page sources."""
+
+    def __init__(self, rows: Sequence, page_size: int = PAGE_SIZE) -> None:
+        self.rows = rows
+        self.page_size = max(1, page_size)
+
+    def page(self, number: int) -> List[Any]:
+        """Get a page of rows.
+
+        Args:
+            number (int): The page, starting at 0.
+
+        Returns:
+            The rows of the page, empty past the last page.
+        """
+        if number < 0:
+            return []
+        start = number * self.page_size
+        return list(self.rows[start:start + self.page_size])
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def __getitem__(self, index: int) -> Any:
+        return self.rows[index]
+
+
+class Pager:
+    """Prints the rows of a page source one page at a time.
+
+    Only the page shown is read from the source and turned into a table, so
+    the first page of a large history prints as soon as it is read. All pagers
+    print with the shared `CONSOLE`.
+
+    Unless `split_columns` is off, a table too wide for the console is printed
+    as several tables, each with as many columns as fit, and the first column,
+    the row numbers, repeated on every one of them.
+    """
+
+    def __init__(self, source: PageSource | Sequence, render: Callable[[List[Any], int], Table],
+                 page_size: int = PAGE_SIZE, console: Console = None, split_columns: bool = True) -> None:
+        """Set up the pager.
+
+        Args:
+            source: A `PageSource`, or a list to page through.
+            render: Builds the table of a page from its rows and the index of its first row.
+            page_size (int): The number of rows per page of a list.
+            console (Console): The console to print to, `CONSOLE` by default.
+            split_columns (bool): Print the columns that do not fit the console in another table.
+        """
+        self.source: PageSource = source if hasattr(source, 'page') else ListPages(source, page_size)
+        self.render = render
+        self.console = console if console is not None else CONSOLE
+        self.split = split_columns
+        self.number = 0
+
+    @property
+    def page_size(self) -> int:
+        """The number of rows per page."""
+        return self.source.page_size
+
+    @property
+    def start_index(self) -> int:
+        """The index of the first row of the current page."""
+        return self.number * self.page_size
+
+    def show(self, number: int = None) -> List[Any]:
+        """Print a page, the current one by default, and make it current.
+
+        Args:
+            number (int): The page, starting at 0.
+
+        Returns:
+            The rows printed, empty (and nothing printed) past the last page.
+        """
+        number = self.number if number is None else number
+        rows = self.source.page(number)
+        if len(rows) == 0:
+            return rows
+        self.number = number
+        table = self.render(rows, self.start_index)
+        for part in self.split_columns(table) if self.split else [table]:
+            self.console.print(part)
+        return rows
+
+    def split_columns(self, table: Table) -> List[Table]:
+        """Split a table into tables that fit the width of the console, each starting with its first column.
+
+        Args:
+            table (Table): The table of a page.
+
+        Returns:
+            The tables to print, just `table` when it fits.
+        """
+        widths = [self._column_width(table, column, index == 0) for index, column in enumerate(table.columns)]
+        if len(widths) <= 2 or sum(widths) + 1 <= self.console.width:
+            return [table]
+        groups: List[List[int]] = [[0]]
+        total = 1 + widths[0]
+        for index in range(1, len(widths)):
+            if total + widths[index] > self.console.width and len(groups[-1]) > 1:
+                groups.append([0])
+                total = 1 + widths[0]
+            groups[-1].append(index)
+            total += widths[index]
+        tables = []
+        for group in groups:
+            part = copy.copy(table)
+            part.columns = [dataclasses.replace(table.columns[index], _index=position) for position, index in enumerate(group)]
+            tables.append(part)
+        return tables
+
+    def _column_width(self, table: Table, column, first: bool) -> int:
+        """Get the narrowest width a column can have without breaking words, with its padding and divider."""
+        options = self.console.options
+        width = max(Measurement.get(self.console, options, cell).minimum for cell in [column.header, *column.cells])
+        padding = table.padding[1] + table.padding[3] if table.pad_edge or not first else 0
+        return width + padding + 1
+
+    def next(self) -> List[Any]:
+        """Print the page after the current one."""
+        return self.show(self.number + 1)
+
+    def previous(self) -> List[Any]:
+        """Print the page before the current one, nothing on the first page."""
+        return self.show(self.number - 1) if self.number > 0 else []
+
+    def __len__(self) -> int:
+        return len(self.source)
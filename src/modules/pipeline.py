@@ -0,0 +1,210 @@
+"""pipeline.py"""
+import asyncio
+import inspect
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, List, NamedTuple
+from mitmproxy import http
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# pylint: disable=R0902,R0913,R0917,W0718
+
+PIPELINE_WORKERS = int(os.environ.get('PROXY_PIPELINE_WORKERS', str(min(4, os.cpu_count() or 1))))
+PIPELINE_MAX_PENDING = int(os.environ.get('PROXY_PIPELINE_MAX_PENDING', '1000'))
+
+STAGE_FILTER = 'filter'
+STAGE_SNAPSHOT = 'snapshot'
+STAGE_ENRICH = 'enrich'
+STAGE_PERSIST = 'persist'
+STAGE_ANALYZE = 'analyze'
+STAGES = [STAGE_FILTER, STAGE_SNAPSHOT, STAGE_ENRICH, STAGE_PERSIST, STAGE_ANALYZE]
+
+
+class FlowSnapshot(NamedTuple):
+    """Copy of a flow taken on the event loop for the stages that run after the hook returned.
+
+    The request and response are kept as mitmproxy state, which only holds
+    immutable values, and rebuilt with `get_request` and `get_response`.
+    """
+    flow_id: str
+    target_id: int | None
+    request: dict
+    response: dict | None = None
+    state: dict | None = None
+    capture_mode: str | None = None
+    dynamic_host: str | None = None
+    captured: bool = False
+    spilled_body: Any = None
+
+    def get_request(self) -> http.Request:
+        """Rebuild the request of the flow."""
+        return http.Request.from_state(dict(self.request))
+
+    def get_response(self) -> http.Response | None:
+        """Rebuild the response of the flow, if there was one."""
+        if self.response is None:
+            return None
+        return http.Response.from_state(dict(self.response))
+
+
+class FlowContext:
+    """What the stages of one hook call hand to each other.
+
+    `flow` is the live mitmproxy flow and must only be used by the stages that
+    run on the event loop; offloaded stages read `snapshot`. `values` holds the
+    results of earlier stages and `stop` ends the pipeline after the current
+    stage.
+    """
+
+    def __init__(self, flow: http.HTTPFlow) -> None:
+        self.flow = flow
+        self.flow_id = flow.id
+        self.snapshot: FlowSnapshot | None = None
+        self.values: dict = {}
+        self.stopped = False
+
+    def stop(self) -> None:
+        """Skip the remaining stages."""
+        self.stopped = True
+
+
+class Stage(NamedTuple):
+    """A step of a hook pipeline."""
+    name: str
+    function: Callable[[FlowContext], Any]
+    offload: bool = False
+
+
+class Pipeline:
+    """Ordered stages of the proxy hooks.
+
+    Each hook runs its stages in order: filter, snapshot, enrich, persist and
+    analyze. The filter and snapshot stages run inside the hook, so mitmproxy
+    forwards the flow as soon as a snapshot of it was taken; the later stages run
+    in a background task. Stages added with `offload` run in a worker thread, the
+    rest on the event loop, where they may be coroutines. Offloading keeps a
+    stage off the event loop, so the hooks of other flows are not held up while
+    it runs; the worker threads share the GIL, so CPU-bound stages do not run
+    on several cores at once. The background stages
+    of a flow wait for the ones its previous hook scheduled, so its response is
+    never persisted before its request. At most `max_pending` flows wait for
+    their background stages; a hook waits for a free slot when there are more.
+
+    Every stage is timed as `{hook}_{stage}` in `metrics`, the `Metrics` of the
+    proxy writer.
+    """
+
+    def __init__(self, metrics, workers: int = PIPELINE_WORKERS, max_pending: int = PIPELINE_MAX_PENDING,
+                 on_error: Callable[[str], None] = print) -> None:
+        self.metrics = metrics
+        self.workers = workers
+        self.executor = None
+        self.max_pending = max(1, max_pending)
+        self.semaphore = None
+        self.on_error = on_error
+        self.hooks: dict[str, List[Stage]] = {}
+        self.chains: dict[str, asyncio.Task] = {}
+        self.tasks: set[asyncio.Task] = set()
+
+    def stage(self, hook: str, name: str, function: Callable[[FlowContext], Any], offload: bool = False) -> None:
+        """Add a stage to the pipeline of a hook.
+
+        Args:
+            hook (str): The hook, e.g. `request`.
+            name (str): One of `STAGES`, in order.
+            function: Called with the `FlowContext`; a coroutine function unless offloaded.
+            offload (bool): Run the stage in a worker thread.
+
+        Returns:
+            None
+        """
+        stages = self.hooks.setdefault(hook, [])
+        if len(stages) > 0 and STAGES.index(name) < STAGES.index(stages[-1].name):
+            raise ValueError(f"stage {name} of {hook} added after {stages[-1].name}")
+        stages.append(Stage(name, function, offload))
+
+    async def run(self, hook: str, context: FlowContext) -> None:
+        """Run the inline stages of a hook and schedule the background ones.
+
+        Args:
+            hook (str): The hook.
+            context (FlowContext): The context of the flow.
+
+        Returns:
+            None
+        """
+        stages = self.hooks.get(hook, [])
+        split = next((index + 1 for index, stage in enumerate(stages) if stage.name == STAGE_SNAPSHOT), len(stages))
+        if not await self._run_stages(hook, stages[:split], context) or split == len(stages):
+            return
+
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.max_pending)
+        if self.semaphore.locked():
+            self.metrics.inc('pipeline_waits')
+        await self.semaphore.acquire()
+        previous = self.chains.get(context.flow_id)
+        task = asyncio.create_task(self._run_background(hook, stages[split:], context, previous))
+        self.chains[context.flow_id] = task
+        self.tasks.add(task)
+        task.add_done_callback(partial(self._done, context.flow_id))
+
+    def _done(self, flow_id: str, task: asyncio.Task) -> None:
+        """Release the slot of a finished background task and end the chain of its flow if it was the last."""
+        self.tasks.discard(task)
+        self.semaphore.release()
+        if self.chains.get(flow_id) is task:
+            del self.chains[flow_id]
+
+    async def _run_background(self, hook: str, stages: List[Stage], context: FlowContext,
+                              previous: asyncio.Task | None) -> None:
+        """Run the background stages once those of the previous hook of the flow have finished."""
+        if previous is not None:
+            await asyncio.wait([previous])
+        await self._run_stages(hook, stages, context)
+
+    async def _run_stages(self, hook: str, stages: List[Stage], context: FlowContext) -> bool:
+        """Run stages until one stops the pipeline.
+
+        Returns:
+            False if the pipeline was stopped.
+        """
+        for stage in stages:
+            start = time.perf_counter()
+            try:
+                if stage.offload and self.workers > 0:
+                    if self.executor is None:
+                        self.executor = ThreadPoolExecutor(self.workers, thread_name_prefix='proxy-pipeline')
+                    await asyncio.get_running_loop().run_in_executor(self.executor, stage.function, context)
+                else:
+                    result = stage.function(context)
+                    if inspect.isawaitable(result):
+                        await result
+            except Exception as exc:
+                context.stop()
+                self.metrics.inc('pipeline_errors')
+                self.on_error(f"{hook.upper()}: {stage.name} - {exc}")
+            finally:
+                self.metrics.observe(f"{hook}_{stage.name}", time.perf_counter() - start)
+            if context.stopped:
+                return False
+        return True
+
+    def pending(self) -> int:
+        """Number of flows whose background stages have not finished."""
+        return len(self.tasks)
+
+    async def drain(self) -> None:
+        """Wait for every scheduled background stage to finish."""
+        while len(self.tasks) > 0:
+            await asyncio.wait(list(self.tasks))
+
+    def close(self) -> None:
+        """Stop the worker threads."""
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
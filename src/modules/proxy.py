@@ -13,10 +13,19 @@ from mitmproxy.tools import dump
 from rich.console import Console
 from rich.table import Table
 from rich.text import Text
-from sqlalchemy import desc, or_, select, func
-import pandas as pd
+from sqlalchemy import or_, func
+from modules.capture_policy import MEDIA_CONTENT_TYPES, MEDIA_EXTENSIONS
+from modules.commentindex import CommentIndex
+from modules.proxyfind import SearchCommands
 from modules.proxyhelper import ProxyHelper
-from modules.database import Database
+from modules.proxypolicy import PolicyCommands
+from modules.proxyreports import ReportCommands
+from modules.proxytail import TailCommands
+from modules.proxywriter import ProxyWriter
+from modules.database import Database, dispose_async_engines
+from modules.history import HistoryPages, ProxyRow, SearchPages, SearchRow, load_proxy_record
+from modules.pager import Pager
+from modules.searchquery import HIGHLIGHT_START, HIGHLIGHT_STOP
 from models import ProxyModel, TargetModel
 
 BASE_CLASS_NAME = 'W3bT00lkit'
@@ -47,8 +56,12 @@ class ProxyConfig: # pylint: disable=R0902,R0903
         print("Config:")
         print(self.configurations)
 
-class Proxy(): # pylint: disable=R0902
-    """Proxy."""
+class Proxy(PolicyCommands, ReportCommands, TailCommands, SearchCommands): # pylint: disable=R0902
+    """Proxy.
+
+    The `proxy` commands not about the history view live in their own command
+    groups: `PolicyCommands`, `ReportCommands`, `TailCommands` and `SearchCommands`.
+    """
 
     def __init__(self, app_obj, args) -> None:
         self.app_obj = app_obj
@@ -62,9 +75,10 @@ class Proxy(): # pylint: disable=R0902
         self.proxyconfig_obj = ProxyConfig(app_obj, args)
         self.stopping = False
         self.master = None
+        self.writer = None
         self.prompt_user = False
         self.page_counter = 0
-        self.proxy_records: List[ProxyModel] = []
+        self.proxy_records: HistoryPages | List[ProxyRow] = []
         self.select_an_item = False
         self.selected_no = None
         self.previous_start_index = 0
@@ -282,6 +296,10 @@ class Proxy(): # pylint: disable=R0902
                 with_dumper=False
             )
 
+            if self.writer is None:
+                self.writer = ProxyWriter(callback_proxy_message)
+            self.writer.start()
+
             running = False
             global stop_flag # pylint: disable=W0602
             while not stop_flag:
@@ -290,7 +308,7 @@ class Proxy(): # pylint: disable=R0902
                     try:
                         self.app_obj.proxy_running = True
                         callback_proxy_message("SYSTEM: PROXY STARTED")
-                        self.master.addons.add(ProxyHelper(self.app_obj, target, in_scope, callback_proxy_message))
+                        self.master.addons.add(ProxyHelper(self.app_obj, target, in_scope, callback_proxy_message, self.writer))
                         await self.master.run()
                     except asyncio.CancelledError:
                         self.app_obj.proxy_running = False
@@ -309,6 +327,7 @@ class Proxy(): # pylint: disable=R0902
             print("*** PROXY EXCEPTION ***")
             print(exc)
         finally:
+            await dispose_async_engines()
             self.app_obj._callback_proxy_message("SYSTEM: PROXY STOPPED")
             print("*** Proxy has exited. ***")
 
@@ -330,8 +349,22 @@ class Proxy(): # pylint: disable=R0902
                 self.app_obj.proxy_running = False
             except Exception as exc: # pylint: disable=W0718
                 print(exc)
+            self._stop_writer()
             print()
 
+    def _stop_writer(self) -> None:
+        """Flush the captured records still queued for the database."""
+        if self.writer is None:
+            return
+        pending = self.writer.pending()
+        if pending > 0:
+            print(f"Saving {pending} queued proxy record(s)...")
+        try:
+            self.writer.stop()
+        except Exception as exc: # pylint: disable=W0718
+            print(exc)
+        self.writer = None
+
     def options(self) -> None:
         """Proxy options.
         
@@ -342,49 +375,73 @@ class Proxy(): # pylint: disable=R0902
         print("- Only store requests that are `in scope` for the selected `target`.")
         print("")
 
-    def _paginated_print(self, data, page_size=25):
-        """Prints data in paginated format.
+    @staticmethod
+    def _highlight_snippet(snippet: str | None) -> Text:
+        """Style the matches of a search snippet."""
+        highlighted = Text(overflow="ellipsis", no_wrap=False)
+        if snippet is None:
+            return highlighted
+        parts = snippet.replace('\r', ' ').replace('\n', ' ').split(HIGHLIGHT_START)
+        highlighted.append(parts[0])
+        for part in parts[1:]:
+            match, _, rest = part.partition(HIGHLIGHT_STOP)
+            highlighted.append(match, style="bold yellow")
+            highlighted.append(rest)
+        return highlighted
+
+    def _history_table(self, data: HistoryPages | SearchPages, rows: List[ProxyRow], start_index: int) -> Table:
+        """Build the table of a page of proxy history, numbering its rows from `start_index`."""
+        table = Table(caption=f"{start_index}-{start_index + len(rows) - 1} of ~{len(data)}")
+        table.add_column('#')
+        table.add_column('created')
+        table.add_column('action')
+        table.add_column('method')
+        table.add_column('status')
+        table.add_column('full_url')
+        if isinstance(data, SearchPages):
+            table.add_column('match')
+
+        for local_counter, record in enumerate(rows, start_index):
+            start_timestamp_obj = datetime.fromtimestamp(record.timestamp_start)
+            start_timestamp = start_timestamp_obj.strftime("%m/%d/%Y %H:%M:%S")
+            tmp_status_code = None
+            if record.response_status_code is None:
+                tmp_status_code = ''
+            else:
+                tmp_status_code = str(record.response_status_code)
+
+            columns = [str(local_counter), start_timestamp, record.action, record.method, tmp_status_code,
+                       Text(record.full_url, overflow="clip", no_wrap=False)]
+            if isinstance(data, SearchPages):
+                columns.append(self._highlight_snippet(record.snippet))
+            table.add_row(*columns)
+        return table
+
+    def _paginated_print(self, data: HistoryPages | SearchPages):
+        """Prints proxy history one page at a time.
+
+        Only the page shown is read from the database; the left and right keys
+        move between pages. Search results get a column showing where they matched.
+        Long URLs are clipped rather than moved to a table of their own.
 
         Args:
-            data: A list of lists or a 2D array representing the data to be printed.
-            page_size: The number of records to display per page.
+            data (HistoryPages | SearchPages): The rows to print.
         """
-        self.start_index = 0
-        self.end_index = page_size
-        df = pd.DataFrame(data)
-        df.index.name = '#'
+        pager = Pager(data, lambda rows, start_index: self._history_table(data, rows, start_index), split_columns=False)
+        page_number = 0
         running = True
-        while running and self.start_index < len(data):
+        while running:
             self.prompt_user = True
             try:
-                page_data = df.iloc[self.start_index:self.end_index]
-                local_counter = self.start_index
-                table = Table()
-                table.add_column('#')
-                table.add_column('created')
-                table.add_column('action')
-                table.add_column('method')
-                table.add_column('status')
-                table.add_column('full_url')
-
-                for record in page_data[0]:
-                    start_timestamp_obj = datetime.fromtimestamp(record.timestamp_start)
-                    start_timestamp = start_timestamp_obj.strftime("%m/%d/%Y %H:%M:%S")
-                    tmp_status_code = None
-                    if record.response_status_code is None:
-                        tmp_status_code = ''
-                    else:
-                        tmp_status_code = str(record.response_status_code)
-
-                    table.add_row(str(local_counter), start_timestamp, record.action, record.method, tmp_status_code, Text(record.full_url, overflow="clip", no_wrap=False))
-                    #self.page_counter += 1
-                    local_counter += 1
-                    self.page_counter = local_counter
-
-                console = Console()
-                console.print(table)
+                page_data = pager.show(page_number)
+                if len(page_data) == 0:
+                    return
+                self.start_index = pager.start_index
+                self.end_index = self.start_index + pager.page_size
+                self.page_counter = self.start_index + len(page_data)
             except Exception as exc:
                 print(exc)
+                return
 
             print("What would you like to do next ([enter]=next page; [# + enter]=select an item, [f + enter]=mark as favorite, [x + enter]=stop, left, right)?")
             prompt_session = PromptSession(key_bindings=self.kb)
@@ -420,17 +477,19 @@ class Proxy(): # pylint: disable=R0902
             self.previous_end_index = self.end_index
 
             if self.press_right:
-                self.start_index += page_size
-                self.end_index += page_size
+                page_number += 1
             elif self.press_left:
-                if self.start_index > 0:
-                    self.start_index -= page_size
-                    self.end_index -= page_size
+                if page_number > 0:
+                    page_number -= 1
                 else:
                     return
 
-    def _select_proxy_record(self, selected_no: int, proxy_record: ProxyModel):
+    def _select_proxy_record(self, selected_no: int, proxy_record: ProxyRow | SearchRow | ProxyModel):
         """View Proxy Record"""
+        proxy_record = load_proxy_record(proxy_record)
+        if proxy_record is None:
+            print("\nThe proxy record no longer exists.\n")
+            return
         self.app_obj._clear()
         print("\nPROXY RECORD DETAILS:\n")
 
@@ -571,8 +630,6 @@ class Proxy(): # pylint: disable=R0902
                 selected_no = int(self.selected_no)
                 selected_no += 1
                 self.selected_no = selected_no
-                if (self.selected_no +1) > len(self.proxy_records):
-                    return
                 self._select_proxy_record(self.selected_no, self.proxy_records[self.selected_no])
             except ValueError:
                 print("ERROR: Invalid input. Input a valid number.")
@@ -594,56 +651,32 @@ class Proxy(): # pylint: disable=R0902
             except Exception:
                 return
 
+    def _no_media_filter(self):
+        """Filter criteria that leave out images, fonts, audio and video."""
+        media_paths = [func.lower(ProxyModel.path).like(f'%.{extension}') for extension in MEDIA_EXTENSIONS]
+        media_headers = [func.lower(func.coalesce(ProxyModel.response_headers, '')).like(f"%content-type: {content_type.replace('*', '%')}%")
+                         for content_type in MEDIA_CONTENT_TYPES]
+        return ~or_(*media_paths, *media_headers)
+
+    def _api_filter(self):
+        """Filter criteria for API paths."""
+        return or_(ProxyModel.path.contains('/api/'),
+                   ProxyModel.path.contains('/rest/'),
+                   ProxyModel.path.contains('/v1/'),
+                   ProxyModel.path.contains('/v2/'),
+                   ProxyModel.path.contains('/v3/'))
+
     def _requests(self, args=None) -> None:
-        self.proxy_records = []
-        filtered_records: List[ProxyModel] = []
         if args is None:
-            with Database._get_db() as db:
-                if self.app_obj.selected_target is not None:
-                    filtered_records: List[ProxyModel] = db.query(ProxyModel)\
-                        .filter(ProxyModel.target_id==self.app_obj.selected_target.id)\
-                        .filter(ProxyModel.action=='Request').order_by(desc(ProxyModel.timestamp_start)).all()
-                else:
-                    filtered_records: List[ProxyModel] = db.query(ProxyModel)\
-                        .filter(ProxyModel.action=='Request').order_by(desc(ProxyModel.timestamp_start)).all()    
-                for record in filtered_records:
-                    proxy_record = ProxyModel(
-                        id=record.id,
-                        action=record.action,
-                        timestamp_start=record.timestamp_start,
-                        method=record.method,
-                        response_status_code=record.response_status_code,
-                        full_url=record.full_url,
-                        raw_request=record.raw_request,
-                        raw_response=record.raw_response
-                    )
-                    self.proxy_records.append(proxy_record)
-            self.history(filtered_records)
+            self.history(HistoryPages(target_id=self._target_id()))
         else:
             match args[0]:
                 case 'js':
-                    with Database._get_db() as db:
-                        filtered_records: List[ProxyModel] = db.query(ProxyModel)\
-                            .filter(ProxyModel.action=='Request')\
-                            .filter(ProxyModel.path.endswith('.js'))\
-                            .order_by(desc(ProxyModel.timestamp_start)).all()
-                        for record in filtered_records:
-                            proxy_record = ProxyModel(
-                                id=record.id,
-                                action=record.action,
-                                timestamp_start=record.timestamp_start,
-                                method=record.method,
-                                response_status_code=record.response_status_code,
-                                full_url=record.full_url,
-                                raw_request=record.raw_request,
-                                raw_response=record.raw_response
-                            )
-                            self.proxy_records.append(proxy_record)
-                    self.history(filtered_records)
+                    self.history(HistoryPages([ProxyModel.path.endswith('.js')], target_id=self._target_id()))
                 case 'params':
                     pass
                 case 'no-media':
-                    pass
+                    self.history(HistoryPages([self._no_media_filter()], target_id=self._target_id()))
                 case _:
                     return
 
@@ -652,27 +685,12 @@ class Proxy(): # pylint: disable=R0902
         actions = args[2:]
 
         http_methods = ['CONNECT','DELETE','FOOBAR','GET','HEAD','OPTIONS','PATCH','POST','PUT','TRACE']
-        allowed_strings = ['ASC','DESC','DISTINCT']
         filter_criteria_and = []
-        filter_criteria_or = []
         filter_criteria_numbers_or = []
         filter_criteria_methods_or = []
-        or_conditions = []
-        #order_by_init_list = [ProxyModel.timestamp_start]
-        order_by_list = [ProxyModel.full_url]
-        distinct_list = [ProxyModel.full_url]
         methods_list = set()
         numbers_list = set()
         use_distinct = False
-        use_api_filter = False
-
-        filter_criteria_api_or = []
-        filter_criteria_api_or.append(ProxyModel.path.contains('/api/'))
-        filter_criteria_api_or.append(ProxyModel.path.contains('/rest/'))
-        filter_criteria_api_or.append(ProxyModel.path.contains('/v1/'))
-        filter_criteria_api_or.append(ProxyModel.path.contains('/v2/'))
-        filter_criteria_api_or.append(ProxyModel.path.contains('/v3/'))
-        filter_criteria_api_or = or_(*filter_criteria_api_or)
 
         # TODO - filter for `.js`
         # TODO - filter for json
@@ -689,7 +707,9 @@ class Proxy(): # pylint: disable=R0902
                     elif 'DISTINCT' == action.upper():
                         use_distinct = True
                     elif 'API' == action.upper():
-                        use_api_filter = True
+                        filter_criteria_and.append(self._api_filter())
+                    elif 'NO-MEDIA' == action.upper():
+                        filter_criteria_and.append(self._no_media_filter())
 
             if len(numbers_list) == 1:
                 filter_criteria_and.append(ProxyModel.response_status_code==list(numbers_list)[0])
@@ -703,238 +723,44 @@ class Proxy(): # pylint: disable=R0902
                 for item in methods_list:
                     filter_criteria_methods_or.append(ProxyModel.method==item)
 
-            filter_criteria_or = or_(*filter_criteria_methods_or,*filter_criteria_numbers_or)
-
-            #filter_criteria_or = or_(*or_conditions)
-            filter_criteria_and.append(ProxyModel.action=='Response')
+            if len(filter_criteria_methods_or) > 0 or len(filter_criteria_numbers_or) > 0:
+                filter_criteria_and.append(or_(*filter_criteria_methods_or,*filter_criteria_numbers_or))
+            filter_criteria_and.append(ProxyModel.response_status_code.isnot(None))
 
         except Exception as exc:
             print("criteria exception:",exc)
 
-        with Database._get_db() as db:
-
-            filtered_records: List[ProxyModel] = []
-
-            try:
-                if self.app_obj.selected_target is not None:
-                    filter_criteria_and.append(ProxyModel.target_id==self.app_obj.selected_target.id) 
-
-                query = db.query(ProxyModel)\
-                    .order_by(desc(*order_by_list))
-
-                if use_api_filter:
-                    query = db.query(ProxyModel)\
-                        .filter(*filter_criteria_and,filter_criteria_or,filter_criteria_api_or)
-                else:
-                    query = db.query(ProxyModel)\
-                        .filter(*filter_criteria_and,filter_criteria_or)
-
-                if use_distinct:
-                    filtered_records = query.distinct(*distinct_list).all()
-                else:
-                    filtered_records = query.all()
-            except Exception as exc:
-                print(exc)
-
-            for record in filtered_records:
-                proxy_record = ProxyModel(
-                    id=record.id,
-                    target_id=record.target_id,
-                    action=record.action,
-                    timestamp_start=record.timestamp_start,
-                    method=record.method,
-                    response_status_code=record.response_status_code,
-                    full_url=record.full_url,
-                    raw_request=record.raw_request,
-                    raw_response=record.raw_response
-                )
-                self.proxy_records.append(proxy_record)
-        self.history(filtered_records)
+        self.history(HistoryPages(filter_criteria_and, distinct_url=use_distinct,
+                                  target_id=self._target_id()))
 
     def _responses(self, args=None) -> None:
         print("responses...")
-        self.proxy_records = []
-        filtered_records: List[ProxyModel] = []
+        criteria = [ProxyModel.response_status_code.isnot(None)]
         if args is None:
-            with Database._get_db() as db:
-                if self.app_obj.selected_target is not None:
-                    filtered_records: List[ProxyModel] = db.query(ProxyModel)\
-                        .filter(ProxyModel.target_id==self.app_obj.selected_target.id)\
-                        .filter(ProxyModel.action=='Response')\
-                        .order_by(desc(ProxyModel.timestamp_start)).all()
-                else:
-                    filtered_records: List[ProxyModel] = db.query(ProxyModel)\
-                        .filter(ProxyModel.action=='Response')\
-                        .order_by(desc(ProxyModel.timestamp_start)).all()
-                for record in filtered_records:
-                    proxy_record = ProxyModel(
-                        id=record.id,
-                        action=record.action,
-                        timestamp_start=record.timestamp_start,
-                        method=record.method,
-                        response_status_code=record.response_status_code,
-                        full_url=record.full_url,
-                        raw_request=record.raw_request,
-                        raw_response=record.raw_response
-                    )
-                    self.proxy_records.append(proxy_record)
-            self.history(filtered_records)
+            self.history(HistoryPages(criteria, target_id=self._target_id()))
         else:
             match args:
                 case 'api':
-                    with Database._get_db() as db:
-                        if self.app_obj.selected_target is not None:
-                            filtered_records: List[ProxyModel] = db.query(ProxyModel)\
-                                .filter(ProxyModel.target_id==self.app_obj.selected_target.id)\
-                                .filter(ProxyModel.action=='Response')\
-                                .filter(
-                                    (ProxyModel.path.contains('/api/')) | 
-                                    (ProxyModel.path.contains('/rest/')) | 
-                                    (ProxyModel.path.contains('/v1/')) | 
-                                    (ProxyModel.path.contains('/v2/')) | 
-                                    (ProxyModel.path.contains('/v3/'))
-                                    )\
-                                .order_by(desc(ProxyModel.timestamp_start)).all()
-                        else:
-                            filtered_records: List[ProxyModel] = db.query(ProxyModel)\
-                                .filter(ProxyModel.action=='Response')\
-                                .filter(
-                                    (ProxyModel.path.contains('/api/')) | 
-                                    (ProxyModel.path.contains('/rest/')) | 
-                                    (ProxyModel.path.contains('/v1/')) | 
-                                    (ProxyModel.path.contains('/v2/')) | 
-                                    (ProxyModel.path.contains('/v3/'))
-                                    )\
-                                .order_by(desc(ProxyModel.timestamp_start)).all()
-
-                        for record in filtered_records:
-                            proxy_record = ProxyModel(
-                                id=record.id,
-                                action=record.action,
-                                timestamp_start=record.timestamp_start,
-                                method=record.method,
-                                response_status_code=record.response_status_code,
-                                full_url=record.full_url,
-                                raw_request=record.raw_request,
-                                raw_response=record.raw_response
-                            )
-                            self.proxy_records.append(proxy_record)
-                    self.history(filtered_records)
+                    self.history(HistoryPages([*criteria, self._api_filter()], target_id=self._target_id()))
                 case 'js':
-                    with Database._get_db() as db:
-                        if self.app_obj.selected_target is not None:
-                            filtered_records: List[ProxyModel] = db.query(ProxyModel)\
-                                .filter(ProxyModel.target_id==self.app_obj.selected_target.id)\
-                                .filter(ProxyModel.action=='Response')\
-                                .filter(ProxyModel.path.endswith('.js'))\
-                                .order_by(desc(ProxyModel.timestamp_start)).all()
-                        else:
-                            filtered_records: List[ProxyModel] = db.query(ProxyModel)\
-                                .filter(ProxyModel.action=='Response')\
-                                .filter(ProxyModel.path.endswith('.js'))\
-                                .order_by(desc(ProxyModel.timestamp_start)).all()
-
-                        for record in filtered_records:
-                            proxy_record = ProxyModel(
-                                id=record.id,
-                                action=record.action,
-                                timestamp_start=record.timestamp_start,
-                                method=record.method,
-                                response_status_code=record.response_status_code,
-                                full_url=record.full_url,
-                                raw_request=record.raw_request,
-                                raw_response=record.raw_response
-                            )
-                            self.proxy_records.append(proxy_record)
-                    self.history(filtered_records)
+                    self.history(HistoryPages([*criteria, ProxyModel.path.endswith('.js')], target_id=self._target_id()))
                 case 'json':
-                    with Database._get_db() as db:
-                        if self.app_obj.selected_target is not None:
-                            filtered_records: List[ProxyModel] = db.query(ProxyModel)\
-                                .filter(ProxyModel.target_id==self.app_obj.selected_target.id)\
-                                .filter(ProxyModel.action=='Response')\
-                                .filter((ProxyModel.path.endswith('.json')) | (ProxyModel.response_headers.contains('application/json')))\
-                                .order_by(desc(ProxyModel.timestamp_start)).all()
-                        else:
-                            filtered_records: List[ProxyModel] = db.query(ProxyModel)\
-                                .filter(ProxyModel.action=='Response')\
-                                .filter((ProxyModel.path.endswith('.json')) | (ProxyModel.response_headers.contains('application/json')))\
-                                .order_by(desc(ProxyModel.timestamp_start)).all()
-
-                        for record in filtered_records:
-                            proxy_record = ProxyModel(
-                                id=record.id,
-                                action=record.action,
-                                timestamp_start=record.timestamp_start,
-                                method=record.method,
-                                response_status_code=record.response_status_code,
-                                full_url=record.full_url,
-                                raw_request=record.raw_request,
-                                raw_response=record.raw_response
-                            )
-                            self.proxy_records.append(proxy_record)
-                    self.history(filtered_records)
+                    json_criteria = (ProxyModel.path.endswith('.json')) | (ProxyModel.response_headers.contains('application/json'))
+                    self.history(HistoryPages([*criteria, json_criteria], target_id=self._target_id()))
                 case x if x.lower() in ['delete','foobar','get','options','patch','post','put','trace']:
-                    with Database._get_db() as db:
-                        if self.app_obj.selected_target is not None:
-                            filtered_records: List[ProxyModel] = db.query(ProxyModel)\
-                                .filter(ProxyModel.target_id==self.app_obj.selected_target.id)\
-                                .filter(ProxyModel.action=='Response')\
-                                .filter(ProxyModel.method==args.upper())\
-                                .order_by(desc(ProxyModel.timestamp_start)).all()
-                        else:
-                            filtered_records: List[ProxyModel] = db.query(ProxyModel)\
-                                .filter(ProxyModel.action=='Response')\
-                                .filter(ProxyModel.method==args.upper())\
-                                .order_by(desc(ProxyModel.timestamp_start)).all()
-
-                        for record in filtered_records:
-                            proxy_record = ProxyModel(
-                                id=record.id,
-                                action=record.action,
-                                timestamp_start=record.timestamp_start,
-                                method=record.method,
-                                response_status_code=record.response_status_code,
-                                full_url=record.full_url,
-                                raw_request=record.raw_request,
-                                raw_response=record.raw_response
-                            )
-                            self.proxy_records.append(proxy_record)
-                    self.history(filtered_records)
+                    self.history(HistoryPages([*criteria, ProxyModel.method==args.upper()], target_id=self._target_id()))
                 case 'params':
                     pass
                 case 'no-media':
-                    pass
+                    self.history(HistoryPages([*criteria, self._no_media_filter()], target_id=self._target_id()))
                 case _:
                     return
 
-    def history(self, filtered_records=None) -> None:
+    def history(self, filtered_records: HistoryPages | SearchPages = None) -> None:
         """Proxy History."""
-        self.proxy_records = []
-        if filtered_records is not None:
-            self.proxy_records = filtered_records
-        else:
-            with Database._get_db() as db:
-                if self.app_obj.selected_target is not None:
-                    records: List[ProxyModel] = db.query(ProxyModel)\
-                        .filter(ProxyModel.target_id==self.app_obj.selected_target.id)\
-                        .order_by(desc(ProxyModel.timestamp_start)).all()
-                else:
-                    records: List[ProxyModel] = db.query(ProxyModel).order_by(desc(ProxyModel.timestamp_start)).all()
-                for record in records:
-                    proxy_record = ProxyModel(
-                        id=record.id,
-                        action=record.action,
-                        timestamp_start=record.timestamp_start,
-                        method=record.method,
-                        response_status_code=record.response_status_code,
-                        full_url=record.full_url,
-                        raw_request=record.raw_request,
-                        raw_response=record.raw_response,
-                        response_text=record.response_text,
-                        response_headers=record.response_headers
-                    )
-                    self.proxy_records.append(proxy_record)
+        if filtered_records is None:
+            filtered_records = HistoryPages(target_id=self._target_id())
+        self.proxy_records = filtered_records
         self.page_counter = 0
         self._paginated_print(self.proxy_records)
         if self.select_an_item and self.selected_no is not None:
@@ -946,122 +772,27 @@ class Proxy(): # pylint: disable=R0902
             except Exception:
                 return
 
-    def comments(self, filtered_records=None) -> None:
-        """Proxy history comments."""
-        self.proxy_records = []
+    def comments(self, filtered_records=None) -> None: # pylint: disable=W0613
+        """List the comments found in the captured response bodies."""
         with Database._get_db() as db:
             try:
-                #query = select(ProxyModel).where(ProxyModel.response_text.like('%//%'))
-                #records = db.execute(query).scalars().all()
-                if self.app_obj.selected_target is not None:
-                    records: List[ProxyModel] = db.query(ProxyModel)\
-                        .filter(ProxyModel.target_id==self.app_obj.selected_target.id)\
-                        .filter(ProxyModel.response_text.like('%// %'))\
-                        .order_by(desc(ProxyModel.timestamp_start)).all()
-                else:
-                    records: List[ProxyModel] = db.query(ProxyModel)\
-                    .filter(ProxyModel.response_text.like('%// %'))\
-                    .order_by(desc(ProxyModel.timestamp_start)).all()
-                for record in records:
-                    proxy_record = ProxyModel(
-                        id=record.id,
-                        action=record.action,
-                        timestamp_start=record.timestamp_start,
-                        method=record.method,
-                        response_status_code=record.response_status_code,
-                        full_url=record.full_url,
-                        raw_request=record.raw_request,
-                        raw_response=record.raw_response,
-                        response_text=record.response_text,
-                        response_headers=record.response_headers
-                    )
-                    self.proxy_records.append(proxy_record)
+                target_id = self._target_id()
+                records = CommentIndex.comments(db, target_id)
             except Exception as exc:
                 print(exc)
-
-        self.page_counter = 0
-        self._paginated_print(self.proxy_records)
-        if self.select_an_item and self.selected_no is not None:
-            try:
-                selected_no = int(self.selected_no)
-                self._select_proxy_record(selected_no, self.proxy_records[selected_no])
-            except ValueError:
-                print("ERROR: Invalid input. Input a valid number.")
-            except Exception:
                 return
 
-    def _search_requests_dynamic(self, args=None) -> None:
-        self._search_dynamic(args, True, False)
-
-    def _search_responses_dynamic(self, args=None) -> None:
-        self._search_dynamic(args, False, True)
-
-    def _search_dynamic(self, args=None, search_requests=True, search_responses=True) -> None:
-        """Proxy history search."""
-        if len(args) < 3:
-            return
-
-        filter_criteria_actions = []
-        if search_requests and search_responses == False:
-            filter_criteria_actions.append(ProxyModel.action=='Request')
-        elif search_requests == False and search_responses:
-            filter_criteria_actions.append(ProxyModel.action=='Response')
-        else:
-            filter_criteria_actions.append(ProxyModel.action=='Request')
-            filter_criteria_actions.append(ProxyModel.action=='Response')
-
-        filter_criteria_actions_or = or_(*filter_criteria_actions)
-
-        filter_criteria_search_terms_or = []
-        for arg in args[2:]:
-            print(arg)
-            # proxy_record.raw_request
-            # response_headers
-            filter_criteria_search_terms_or.append(ProxyModel.raw_request.like(f'%{arg}%'))
-            filter_criteria_search_terms_or.append(ProxyModel.response_headers.like(f'%{arg}%'))
-            filter_criteria_search_terms_or.append(ProxyModel.full_url.like(f'%{arg}%'))
-            filter_criteria_search_terms_or.append(ProxyModel.response_text.like(f'%{arg}%'))
-
-        filter_criteria_or = or_(*filter_criteria_search_terms_or)
-
-        self.proxy_records = []
-        with Database._get_db() as db:
-            try:
-                #query = select(ProxyModel).where(ProxyModel.response_text.like('%//%'))
-                #records = db.execute(query).scalars().all()
-                if self.app_obj.selected_target is not None:
-                    records: List[ProxyModel] = db.query(ProxyModel)\
-                        .filter(ProxyModel.target_id==self.app_obj.selected_target.id)\
-                        .filter(filter_criteria_actions_or, filter_criteria_or)\
-                        .order_by(desc(ProxyModel.timestamp_start)).all()
-                else:
-                    records: List[ProxyModel] = db.query(ProxyModel)\
-                    .filter(filter_criteria_actions_or, filter_criteria_or)\
-                    .order_by(desc(ProxyModel.timestamp_start)).all()
-                for record in records:
-                    proxy_record = ProxyModel(
-                        id=record.id,
-                        action=record.action,
-                        timestamp_start=record.timestamp_start,
-                        method=record.method,
-                        response_status_code=record.response_status_code,
-                        full_url=record.full_url,
-                        raw_request=record.raw_request,
-                        raw_response=record.raw_response,
-                        response_text=record.response_text,
-                        response_headers=record.response_headers
-                    )
-                    self.proxy_records.append(proxy_record)
-            except Exception as exc:
-                print(exc)
+        print()
+        table = Table(title='Comments', caption=f"{len(records)} comment(s), latest first; run 'database migrate' to scan older bodies")
+        table.add_column('#', justify='right')
+        table.add_column('kind')
+        table.add_column('comment')
+        table.add_column('bodies', justify='right')
+        table.add_column('full_url')
+        for record in records:
+            table.add_row(str(record.proxy_id), record.kind, Text(record.text, overflow="fold"), str(record.bodies),
+                          Text(record.full_url or '', overflow="clip", no_wrap=False))
 
-        self.page_counter = 0
-        self._paginated_print(self.proxy_records)
-        if self.select_an_item and self.selected_no is not None:
-            try:
-                selected_no = int(self.selected_no)
-                self._select_proxy_record(selected_no, self.proxy_records[selected_no])
-            except ValueError:
-                print("ERROR: Invalid input. Input a valid number.")
-            except Exception:
-                return
\ No newline at end of file
+        console = Console()
+        console.print(table)
+        print()
@@ -0,0 +1,21 @@
+"""proxycommand.py"""
+from typing import Any, Protocol
+from modules.history import HistoryPages, SearchPages
+from modules.proxywriter import ProxyWriter
+
+
+class ProxyCommand(Protocol):
+    """The state and methods of `Proxy` shared by the `proxy` command groups mixed into it.
+
+    `Proxy` sets the state and routes `proxy <command>` to the `_<command>` and
+    `_<command>_dynamic` methods of the groups.
+    """
+    app_obj: Any
+    writer: ProxyWriter | None
+
+    def history(self, filtered_records: HistoryPages | SearchPages = None) -> None:
+        """Print proxy history."""
+
+    def _target_id(self) -> int | None:
+        """The id of the selected target, if any."""
+        return self.app_obj.selected_target.id if self.app_obj.selected_target is not None else None
@@ -0,0 +1,115 @@
+"""proxyfind.py"""
+import re
+from rich.console import Console
+from rich.text import Text
+from sqlalchemy import and_, or_
+from modules.bodystore import BodyStore
+from modules.database import Database
+from modules.grep import BodyGrep
+from modules.history import HistoryPages, SearchPages
+from modules.proxycommand import ProxyCommand
+from modules.search import SearchIndex
+from modules.searchquery import parse_query
+from models import BodyModel, ProxyModel
+
+# pylint: disable=C0121,W0212,W0718
+
+
+class SearchCommands(ProxyCommand):
+    """The `proxy grep` and `proxy search` commands over the captured traffic."""
+
+    def _grep_dynamic(self, args=None) -> None:
+        """Search the captured requests and response bodies with a regular expression.
+
+        `proxy grep <regex>` scans the traffic of the selected target in worker
+        processes and prints the matches as they are found; Ctrl+C stops the scan.
+        """
+        if len(args) < 3:
+            return
+
+        pattern = ' '.join(args[2:])
+        target_id = self._target_id()
+        console = Console()
+        counter = 0
+        print()
+        try:
+            for match in BodyGrep().grep(pattern, target_id):
+                line = Text(f"#{match.proxy_id} {match.flow_id} {match.part}@{match.offset} ")
+                line.append(match.text.replace('\r', ' ').replace('\n', ' '), style="bold yellow")
+                if match.others > 0:
+                    line.append(f" (+{match.others} more)")
+                console.print(line)
+                counter += 1
+        except re.error as exc:
+            print(f"Invalid regular expression: {exc}")
+            return
+        except KeyboardInterrupt:
+            print("Stopped.")
+        except Exception as exc:
+            print(exc)
+            return
+        print(f"\n{counter} match(es).\n")
+
+    def _search_requests_dynamic(self, args=None) -> None:
+        self._search_dynamic(args, True, False)
+
+    def _search_responses_dynamic(self, args=None) -> None:
+        self._search_dynamic(args, False, True)
+
+    def _search_dynamic(self, args=None, search_requests=True, search_responses=True) -> None:
+        """Proxy history search.
+
+        Uses the search index when it exists: results are ranked, and the query
+        supports "phrases", prefix* and *substring terms. Otherwise the stored
+        traffic is scanned and every term is matched as a substring. Either way
+        every term has to match the same document: the request, the response
+        headers or the response body.
+        """
+        if len(args) < 3:
+            return
+
+        terms = parse_query(args[2:])
+        if len(terms) == 0:
+            return
+        target_id = self._target_id()
+        with Database._get_db() as db:
+            try:
+                indexed = SearchIndex().available(db)
+            except Exception as exc:
+                print(exc)
+                return
+        if indexed:
+            try:
+                self.history(SearchPages(terms, target_id, search_requests, search_responses))
+            except Exception as exc:
+                print(exc)
+            return
+        print("No search index yet, run 'database migrate' to create it. Falling back to a full scan.")
+
+        values = [arg.strip('*') for arg in args[2:] if arg.strip('*') != '']
+        filter_criteria_actions = []
+        if search_requests == False and search_responses:
+            filter_criteria_actions.append(ProxyModel.response_status_code.isnot(None))
+
+        documents = []
+        if search_requests:
+            documents.append([ProxyModel.raw_request, ProxyModel.full_url])
+        if search_responses:
+            documents.append([ProxyModel.response_headers])
+            documents.append([ProxyModel.response_text])
+            documents.append([BodyModel.content])
+        filter_criteria_documents_or = [
+            and_(*[or_(*[column.like(f'%{value}%') for column in columns]) for value in values]) for columns in documents]
+
+        with Database._get_db() as db:
+            try:
+                if search_responses:
+                    compressed_hashes = BodyStore().search_compressed(db, values, target_id)
+                    if len(compressed_hashes) > 0:
+                        filter_criteria_documents_or.append(ProxyModel.response_body_hash.in_(compressed_hashes))
+            except Exception as exc:
+                print(exc)
+                return
+
+        self.history(HistoryPages([*filter_criteria_actions, or_(*filter_criteria_documents_or)],
+                                  outerjoin_bodies=True, target_id=self._target_id()))
@@ -1,24 +1,31 @@
 """proxyhelper.py"""
 import os
 import json
-import re
 import random
 import requests
 import string
 import sys
 import signal
 import threading
-import traceback
 import time
 from datetime import datetime, timezone
 import warnings
 from urllib.parse import ParseResult, urlparse
-import chardet
 from mitmproxy import http
-from mitmproxy.net.http.http1.assemble import assemble_request, assemble_response
+from mitmproxy.net.http.http1.assemble import assemble_request, assemble_request_head
 from dotenv import load_dotenv
-from modules.database import Database
-from models import ProxyModel, SynackTargetModel
+from modules.bodystore import BODY_SPILL_THRESHOLD, SpilledBody
+from modules.capture_policy import CAPTURE_DROP, CAPTURE_FULL, CAPTURE_METADATA, CapturePolicy, load_capture_policy
+from modules.database import run_db
+from modules.decoding import BodyDecoder, decode_header
+from modules.flowarchive import flow_state
+from modules.pipeline import (STAGE_ANALYZE, STAGE_ENRICH, STAGE_FILTER, STAGE_PERSIST, STAGE_SNAPSHOT, FlowContext,
+                              FlowSnapshot, Pipeline)
+from modules.proxywriter import ProxyWriter
+from modules.scope_matcher import ScopeMatch, ScopeMatcher
+from modules.tail import FLOW_BROADCAST, FlowSummary
+from modules.trafficsummary import mime_class
+from models import SynackTargetModel
 
 load_dotenv()
 
@@ -28,6 +35,11 @@ warnings.filterwarnings('ignore', category=DeprecationWarning)
 warnings.filterwarnings('ignore', category=UserWarning)
 
 request_url_list = set()
+SCOPE_METADATA_KEY = 'w3bt00lkit_scope'
+CAPTURED_METADATA_KEY = 'w3bt00lkit_captured'
+SPILLED_METADATA_KEY = 'w3bt00lkit_spilled'
+POLICY_METADATA_KEY = 'w3bt00lkit_policy'
+REQUEST_METADATA_KEY = 'w3bt00lkit_request'
 
 def signal_handler(sig, frame) -> None: # pylint: disable=W0613
     """Signal handler.
@@ -52,11 +64,16 @@ class ProxyHelper: # pylint: disable=R0902
     target: str = ''
     exclusion_list: list = []
 
-    def __init__(self, app_obj, target, in_scope, parent_callback_proxy_message) -> None:
+    def __init__(self, app_obj, target, in_scope, parent_callback_proxy_message, writer: ProxyWriter) -> None:
         self.app_obj = app_obj
         self.target = target
         self.synack_target = False
         self.in_scope = in_scope
+        self.scope_matcher = None
+        self.capture_policy = None
+        self.writer = writer
+        self.metrics = writer.metrics
+        self.body_decoder = BodyDecoder()
         self._parent_callback_proxy_message = parent_callback_proxy_message
         if target is not None and target.name.lower() == 'synack' and target.platform.lower() == 'synack':
             self.synack_target = True
@@ -70,6 +87,21 @@ class ProxyHelper: # pylint: disable=R0902
         self.slack_url = os.environ.get("SLACK_URL")
         self.slack_slug = os.environ.get("SLACK_SLUG")
         self.missions_running = False
+        self.metrics.gauge('requests_seen', lambda: self.request_count)
+        self.metrics.gauge('responses_seen', lambda: self.response_count)
+        self.metrics.gauge('charset_detections', lambda: self.body_decoder.detect_count)
+        self.pipeline = Pipeline(self.metrics, on_error=self._parent_callback_proxy_message)
+        self.pipeline.stage('request', STAGE_FILTER, self._request_filter)
+        self.pipeline.stage('request', STAGE_SNAPSHOT, self._request_snapshot)
+        self.pipeline.stage('request', STAGE_ENRICH, self._request_enrich, offload=True)
+        self.pipeline.stage('request', STAGE_PERSIST, self._request_persist)
+        self.pipeline.stage('request', STAGE_ANALYZE, self._request_analyze)
+        self.pipeline.stage('response', STAGE_FILTER, self._response_filter)
+        self.pipeline.stage('response', STAGE_SNAPSHOT, self._response_snapshot)
+        self.pipeline.stage('response', STAGE_ENRICH, self._response_enrich, offload=True)
+        self.pipeline.stage('response', STAGE_PERSIST, self._response_persist)
+        self.pipeline.stage('response', STAGE_ANALYZE, self._response_analyze)
+        self.metrics.gauge('pipeline_pending', self.pipeline.pending)
 
     def random_string(self, length):
         """Generate a random string."""
@@ -401,8 +433,162 @@ class ProxyHelper: # pylint: disable=R0902
         print("Mission thread exiting...", random_string)
         self.app_obj.missions_running = False
 
-    def request(self, flow: http.HTTPFlow) -> None: # pylint: disable=R0914
+    def _match_scope(self, flow: http.HTTPFlow) -> ScopeMatch:
+        """Match the flow's host against the scope once and remember it on the flow.
+
+        Args:
+            flow: The flow object for the request or response.
+
+        Returns:
+            ScopeMatch
+        """
+        scope_match = flow.metadata.get(SCOPE_METADATA_KEY)
+        if scope_match is None:
+            with self.metrics.timer('scope_match'):
+                if self.scope_matcher is None:
+                    self.scope_matcher = ScopeMatcher(self.in_scope)
+                scope_match = self.scope_matcher.match(flow.request.host)
+            flow.metadata[SCOPE_METADATA_KEY] = scope_match
+            if scope_match.in_scope == False:
+                self.metrics.inc('flows_out_of_scope')
+        return scope_match
+
+    async def _load_capture_policy(self) -> CapturePolicy:
+        """Load the capture policy of the selected target on first use, without blocking the event loop."""
+        if self.capture_policy is None:
+            self.capture_policy = await run_db(load_capture_policy, self.target.id)
+            self.app_obj.selected_target_capture_policy = self.capture_policy
+        return self.capture_policy
+
+    def _capture_mode(self, flow: http.HTTPFlow) -> str:
+        """Get the capture mode of a flow from its request line and, once known, its response headers.
+
+        The capture policy must have been loaded with `_load_capture_policy`.
+
+        Args:
+            flow: The flow object for the request or response.
+
+        Returns:
+            The capture mode.
+        """
+        mode = flow.metadata.get(POLICY_METADATA_KEY)
+        if mode is None:
+            with self.metrics.timer('capture_policy'):
+                mode = self.capture_policy.for_request(flow.request.host, flow.request.path)
+            flow.metadata[POLICY_METADATA_KEY] = mode
+        if mode is None and flow.response is not None:
+            with self.metrics.timer('capture_policy'):
+                mode = self.capture_policy.for_response(flow.response.headers.get('content-type'), flow.request.host,
+                                                        flow.request.path) or self.capture_policy.default_mode
+            flow.metadata[POLICY_METADATA_KEY] = mode
+        return mode
+
+    def _request_record(self, flow_id: str, request: http.Request, target_id: int, dynamic_host: str = None,
+                        with_body: bool = True) -> dict:
+        """Build the request columns of a flow's `ProxyModel` record.
+
+        Args:
+            flow_id (str): The id of the flow.
+            request: The request of the flow.
+            target_id (int): The target the flow is captured for.
+            dynamic_host: The dynamic scope item matching the host, if any.
+            with_body: Include the request body, False for metadata only captures.
+
+        Returns:
+            dict
+        """
+        dynamic_full_url = None
+
+        host = request.host
+        port = request.port
+        method = request.method
+        scheme = request.scheme
+        authority = request.authority
+        path = request.path
+
+        content = None
+        try:
+            if with_body:
+                content = self.body_decoder.decode(request.get_content(strict=False),
+                                                   request.headers.get('content-type'), host).replace('\x00', '')
+        except Exception as exc:
+            content = None
+            self._parent_callback_proxy_message(f"REQUEST: clean content exception - {exc}")
+
+        timestamp_start = request.timestamp_start
+        timestamp_end = request.timestamp_end
+
+        full_url: str = f'{request.scheme}://{request.host}:{request.port}{request.path}'
+
+        if dynamic_host is not None:
+            dynamic_full_url: str = f'{request.scheme}://{dynamic_host}:{request.port}{request.path}'
+
+        try:
+            parsed: ParseResult = urlparse(full_url)
+            path: str = parsed.path
+            url: str = f'{parsed.scheme}://{parsed.netloc.replace(":443","")}{parsed.path}'
+        except Exception as exc:
+            parsed = None
+            path = None
+            url = None
+            self._parent_callback_proxy_message(f"REQUEST (CHECK EXC): {exc}")
+
+        try:
+            if with_body:
+                raw_request = decode_header(assemble_request(request))
+            else:
+                raw_request = decode_header(assemble_request_head(request))
+        except Exception as exc:
+            self._parent_callback_proxy_message(f"REQUEST: raw request - {exc}")
+            raw_request = None
+
+        try:
+            headers_string = ", ".join([f"{k}: {v}" for k, v in request.headers.items()])
+        except Exception as exc:
+            headers_string = None
+
+        return dict(
+            flow_id=flow_id,
+            target_id=target_id,
+            name=None,
+            request=None,
+            host=host,
+            port=port,
+            method=method,
+            scheme=scheme,
+            authority=authority,
+            path=path,
+            headers=headers_string,
+            content=content,
+            timestamp_start=timestamp_start,
+            timestamp_end=timestamp_end,
+            full_url=full_url,
+            parsed_full_url=str(parsed),
+            parsed_path=path,
+            parsed_url=url,
+            raw_request=self.clean_string(raw_request),
+            dynamic_host=dynamic_host,
+            dynamic_full_url=dynamic_full_url
+        )
+
+    def _request_metadata(self, request: http.Request) -> dict:
+        """Get the request columns that clear the body of a request recorded before the response decided on `metadata`.
+
+        A flow no request line rule decides is recorded with its request body,
+        so a content type rule keeping only metadata has to remove it again.
+        """
+        try:
+            raw_request = self.clean_string(decode_header(assemble_request_head(request)))
+        except Exception as exc:
+            self._parent_callback_proxy_message(f"RESPONSE: raw request - {exc}")
+            raw_request = None
+        return {'content': None, 'raw_request': raw_request}
+
+    async def request(self, flow: http.HTTPFlow) -> None:
         """Proxy request.
+
+        Runs the `request` stages of the pipeline: the filter and snapshot stages
+        before the request is forwarded, the rest in the background.
         
         Args:
             flow: The flow object for the request.
@@ -410,7 +596,11 @@ class ProxyHelper: # pylint: disable=R0902
         Returns:
             None
         """
+        with self.metrics.timer('request_hook'):
+            await self.pipeline.run('request', FlowContext(flow))
 
+    def _sniff_auth_token(self, flow: http.HTTPFlow) -> None:
+        """Keep the Synack authorization token seen in a request."""
         headers = flow.request.headers
 
         if 'synack' in flow.request.host:
@@ -450,125 +640,72 @@ class ProxyHelper: # pylint: disable=R0902
                         print(exc)
                         print("")
 
+    async def _request_filter(self, context: FlowContext) -> None:
+        """Sniff the auth token, pick up the selected target and stop for out of scope requests."""
+        flow = context.flow
+        self._sniff_auth_token(flow)
 
         self.target = self.app_obj.selected_target
         self.in_scope = self.app_obj.selected_target_in_scope
-
-        #print("target:",str(self.target.name))
-        #print("in scope:", str(self.in_scope))
-        #print()
+        self.scope_matcher = self.app_obj.selected_target_scope_matcher
+        self.capture_policy = self.app_obj.selected_target_capture_policy
 
         if self.target is None or self.in_scope is None:
+            context.stop()
             return
 
         self.request_count = self.request_count + 1
 
-        dynamic_host = None
-        dynamic_fqdn = False
-        dynamic_full_url = None
-
-        save_request = False
-        for item in self.in_scope:
-            if item['fqdn'] is not None:
-                if flow.request.host == item['fqdn']:
-                    save_request = True
-                if '*' in item['fqdn']:
-                    tmp_fqdn = item['fqdn'].replace('*','')
-                    if flow.request.host.endswith(tmp_fqdn):
-                        save_request = True
-                if '{dynamic}' in item['fqdn']:
-                    tmp_fqdn = item['fqdn']
-                    match = re.search(r"{dynamic}(.+)", item['fqdn'])
-                    if match:
-                        tmp_fqdn = match.group(1)
-                        if flow.request.host.endswith(tmp_fqdn):
-                            dynamic_host = item['fqdn']
-                            dynamic_fqdn = True
-                            save_request = True
-
-        if save_request == False:
+        scope_match = self._match_scope(flow)
+        if scope_match.in_scope == False:
+            context.stop()
             return
 
-        request = flow.request
+        await self._load_capture_policy()
+        context.values['scope_match'] = scope_match
+        context.values['capture_mode'] = self._capture_mode(flow)
 
-        host = flow.request.host
-        port = flow.request.port
-        method = flow.request.method
-        scheme = flow.request.scheme
-        authority = flow.request.authority
-        path = flow.request.path
-
-        try:
-            content = flow.request.text.replace('\x00', '')
-        except Exception as exc:
-            self._parent_callback_proxy_message(f"REQUEST: clean content exception - {exc}")
-
-        timestamp_start = flow.request.timestamp_start
-        timestamp_end = flow.request.timestamp_end
-
-        full_url: str = f'{request.scheme}://{request.host}:{request.port}{request.path}'
-
-        if dynamic_host is not None and dynamic_fqdn:
-            dynamic_full_url: str = f'{request.scheme}://{dynamic_host}:{request.port}{request.path}'
-
-        try:
-            parsed: ParseResult = urlparse(full_url)
-            path: str = parsed.path
-            url: str = f'{parsed.scheme}://{parsed.netloc.replace(":443","")}{parsed.path}'
-        except Exception as exc:
-            parsed = None
-            path = None
-            url = None
-            self._parent_callback_proxy_message(f"REQUEST (CHECK EXC): {exc}")
-
-        try:
-            raw_request = assemble_request(flow.request).decode('utf-8')
-        except Exception as exc:
-            self._parent_callback_proxy_message("REQUEST:",exc)
-            raw_request = None
-
-        try:
-            headers_string = ", ".join([f"{k}: {v}" for k, v in flow.request.headers.items()])
-        except Exception as exc:
-            headers_string = None
-
-        try:
-            new_request = ProxyModel(
-                target_id=int(self.target.id),
-                name=None,
-                request=None,
-                action='Request',
-                host=host,
-                port=port,
-                method=method,
-                scheme=scheme,
-                authority=authority,
-                path=path,
-                headers=headers_string,
-                content=content,
-                timestamp_start=timestamp_start,
-                timestamp_end=timestamp_end,
-                full_url=full_url,
-                parsed_full_url=str(parsed),
-                parsed_path=path,
-                parsed_url=url,
-                raw_request=raw_request,
-                raw_response=None,
-                decoded_content=None,
-                flow=None,
-                dynamic_host=dynamic_host,
-                dynamic_full_url=dynamic_full_url
-            )
-
-            with Database._get_db() as db:
-                db.add(new_request)
-                db.commit()
-                db.refresh(new_request)
-
-        except Exception as database_exception: # pylint: disable=W0718
-            self._parent_callback_proxy_message("REQUEST: database_exception...")
-            self._parent_callback_proxy_message(str(database_exception))
+    def _request_snapshot(self, context: FlowContext) -> None:
+        """Snapshot the request and mark the flow as captured.
 
+        The mark is set here rather than once the request record is queued, so
+        the response snapshot sees it even when the background stages of the
+        request have not run yet, and does not build the request record again.
+        If the request record is dropped after all, `_request_persist` keeps it
+        on the flow for `_response_persist`.
+        """
+        if context.values['capture_mode'] == CAPTURE_DROP:
+            return
+        context.snapshot = FlowSnapshot(
+            flow_id=context.flow_id,
+            target_id=int(self.target.id),
+            request=context.flow.request.get_state(),
+            capture_mode=context.values['capture_mode'],
+            dynamic_host=context.values['scope_match'].dynamic_host
+        )
+        context.flow.metadata[CAPTURED_METADATA_KEY] = True
+
+    def _request_enrich(self, context: FlowContext) -> None:
+        """Build the request record from the snapshot."""
+        snapshot = context.snapshot
+        if snapshot is None:
+            return
+        with self.metrics.timer('request_record'):
+            new_request = self._request_record(snapshot.flow_id, snapshot.get_request(), snapshot.target_id,
+                                               snapshot.dynamic_host, snapshot.capture_mode != CAPTURE_METADATA)
+        new_request['action'] = 'Request'
+        context.values['record'] = new_request
+
+    async def _request_persist(self, context: FlowContext) -> None:
+        """Queue the request record, keeping it on the flow for the response record if it was dropped."""
+        new_request = context.values.get('record')
+        if new_request is None or not await self.writer.enqueue_async(new_request):
+            context.flow.metadata[CAPTURED_METADATA_KEY] = False
+            if new_request is not None:
+                context.flow.metadata[REQUEST_METADATA_KEY] = new_request
+
+    def _request_analyze(self, context: FlowContext) -> None: # pylint: disable=W0613
+        """Start polling for missions once a Synack token was seen."""
         if self.auth_token is not None and self.synack_api is not None and self.auth_token != 'undefined':
             if self.app_obj.missions_running == False:
                 self.missions_running = True
@@ -584,195 +721,225 @@ class ProxyHelper: # pylint: disable=R0902
                     self._parent_callback_proxy_message(f"REQUEST: {exc}")
                     stop_event.set()
 
-    def response(self, flow: http.HTTPFlow) -> None:
-        """Proxy response.
-        
+    async def responseheaders(self, flow: http.HTTPFlow) -> None:
+        """Proxy response headers.
+
+        Passes the bodies of responses the capture policy drops or keeps metadata
+        for straight through to the client, and streams in scope responses
+        announced as larger than `BODY_SPILL_THRESHOLD` to a body segment instead
+        of buffering them.
+
         Args:
             flow: The flow object for the response.
 
         Returns:
             None
         """
-        self.response_count = self.response_count + 1
-        if self.target is None or self.in_scope is None:
-            self._parent_callback_proxy_message("RESPONSE: self in_scope is none")
+        if self.target is None or self.in_scope is None or flow.response.stream:
             return
-
-        dynamic_host = None
-        dynamic_fqdn = False
-        dynamic_full_url = None
-
-        save_response = False
-
         try:
-            for item in self.in_scope:
-                if item['fqdn'] is not None:
-                    if flow.request.host == item['fqdn']:
-                        save_response = True
-                    if '*' in item['fqdn']:
-                        tmp_fqdn = item['fqdn'].replace('*','')
-                        if flow.request.host.endswith(tmp_fqdn):
-                            save_response = True
-                    if '{dynamic}' in item['fqdn']:
-                        tmp_fqdn = item['fqdn']
-                        match = re.search(r"{dynamic}(.+)", item['fqdn'])
-                        if match:
-                            tmp_fqdn = match.group(1)
-                            if flow.request.host.endswith(tmp_fqdn):
-                                dynamic_host = item['fqdn']
-                                dynamic_fqdn = True
-                                save_response = True
-
-            if save_response == False:
+            if self._match_scope(flow).in_scope == False:
+                return
+            await self._load_capture_policy()
+            if self._capture_mode(flow) != CAPTURE_FULL:
+                flow.response.stream = True
                 return
         except Exception as exc:
-            self._parent_callback_proxy_message(f"{flow.request.pretty_url} ---> \n {exc}")
-
-        request = flow.request
+            self._parent_callback_proxy_message(f"RESPONSE: capture policy - {exc}")
+            return
+        try:
+            content_length = int(flow.response.headers.get('content-length', '-1'))
+        except ValueError:
+            return
+        if content_length <= BODY_SPILL_THRESHOLD:
+            return
+        try:
+            spilled_body = SpilledBody(self.writer.body_segments, content_length,
+                                       flow.response.headers.get('content-encoding'))
+            flow.response.stream = spilled_body
+            flow.metadata[SPILLED_METADATA_KEY] = spilled_body
+        except Exception as exc:
+            self._parent_callback_proxy_message(f"RESPONSE: spill body - {exc}")
 
-        host = flow.request.host
-        port = flow.request.port
-        method = flow.request.method
-        scheme = flow.request.scheme
-        authority = flow.request.authority
-        path = flow.request.path
+    def _response_body(self, snapshot: FlowSnapshot, request: http.Request, response: http.Response) -> dict:
+        """Get the body columns of a response record, spilling large bodies to a body segment.
 
-        headers = flow.request.headers
-        response_headers = None
+        Args:
+            snapshot (FlowSnapshot): The snapshot of the flow.
+            request: The request of the flow.
+            response: The response of the flow.
 
-        try:
-            response_string = f"HTTP/1.1 {flow.response.status_code}\n"
-            for key, value in flow.response.headers.items():
-                tmp_key = None
-                tmp_value = None
-                if isinstance(key, str):
-                    tmp_key = key
-                elif isinstance(key, bytes):
-                    encoding = chardet.detect(key)['encoding']
-                    tmp_key = key.decode(encoding)
-
-                if isinstance(value, str):
-                    tmp_value = value
-                elif isinstance(value, bytes):
-                    encoding = chardet.detect(key)['encoding']
-                    tmp_value = value.decode(encoding)
-
-                if tmp_key is not None and tmp_value is not None:
-                    response_string += f"{tmp_key}: {tmp_value}"
-                    response_string += "\n"
-                    response_headers = response_string
-        except Exception as exc:
-            self._parent_callback_proxy_message(f"RESPONSE: response headers string - {exc}")
-            response_headers = str(flow.response.headers)
+        Returns:
+            dict
+        """
+        if snapshot.capture_mode == CAPTURE_METADATA:
+            return {'response_text': None}
+        spilled_body = snapshot.spilled_body
+        raw_content = response.raw_content
+        if spilled_body is None and raw_content is not None and len(raw_content) > BODY_SPILL_THRESHOLD:
+            spilled_body = SpilledBody(self.writer.body_segments, len(raw_content),
+                                       response.headers.get('content-encoding'))
+            spilled_body(raw_content)
+        if spilled_body is not None:
+            body = spilled_body.record()
+            if body['truncated']:
+                self.metrics.inc('bodies_truncated')
+            return {'response_body': body}
+        return {'response_text': self.clean_string(self.body_decoder.decode(response.get_content(strict=False),
+                                                                            response.headers.get('content-type'),
+                                                                            request.host))}
+
+    async def response(self, flow: http.HTTPFlow) -> None:
+        """Proxy response.
 
-        try:
-            content = flow.request.text.replace('\x00', '')
-        except Exception as exc:
-            self._parent_callback_proxy_message(f"RESPONSE: clean content exception - {exc}")
-            content = None
+        Runs the `response` stages of the pipeline: the filter and snapshot stages
+        before the response is sent to the client, the rest in the background.
+        
+        Args:
+            flow: The flow object for the response.
 
-        timestamp_start = flow.request.timestamp_start
-        timestamp_end = flow.request.timestamp_end
+        Returns:
+            None
+        """
+        with self.metrics.timer('response_hook'):
+            await self.pipeline.run('response', FlowContext(flow))
 
-        full_url: str = f'{request.scheme}://{request.host}:{request.port}{request.path}'
+    async def _response_filter(self, context: FlowContext) -> None:
+        """Stop for out of scope responses and get the capture mode of the flow."""
+        flow = context.flow
+        self.response_count = self.response_count + 1
+        if self.target is None or self.in_scope is None:
+            self._parent_callback_proxy_message("RESPONSE: self in_scope is none")
+            context.stop()
+            return
 
-        if dynamic_host is not None and dynamic_fqdn:
-            dynamic_full_url: str = f'{request.scheme}://{dynamic_host}:{request.port}{request.path}'
+        scope_match = self._match_scope(flow)
+        if scope_match.in_scope == False:
+            context.stop()
+            return
 
-        parsed: ParseResult = urlparse(full_url)
-        path: str = parsed.path
-        url: str = f'{parsed.scheme}://{parsed.netloc.replace(":443","")}{parsed.path}'
+        await self._load_capture_policy()
+        context.values['scope_match'] = scope_match
+        context.values['capture_mode'] = self._capture_mode(flow)
 
-        try:
-            raw_request = assemble_request(flow.request).decode('utf-8')
-        except Exception as exc:
-            self._parent_callback_proxy_message("RESPONSE: raw request - ", exc)
-            raw_request = None
+    def _response_snapshot(self, context: FlowContext) -> None:
+        """Snapshot the request and response of a flow the capture policy keeps."""
+        flow = context.flow
+        capture_mode = context.values['capture_mode']
+        if capture_mode == CAPTURE_DROP:
+            return
+        context.snapshot = FlowSnapshot(
+            flow_id=context.flow_id,
+            target_id=int(self.target.id),
+            request=flow.request.get_state(),
+            response=flow.response.get_state(),
+            state=flow_state(flow),
+            capture_mode=capture_mode,
+            dynamic_host=context.values['scope_match'].dynamic_host,
+            captured=flow.metadata.get(CAPTURED_METADATA_KEY, False),
+            spilled_body=flow.metadata.get(SPILLED_METADATA_KEY)
+        )
+
+    def _response_enrich(self, context: FlowContext) -> None:
+        """Build the response record from the snapshot and archive the flow."""
+        snapshot = context.snapshot
+        if snapshot is None:
+            return
+        request = snapshot.get_request()
+        response = snapshot.get_response()
+        context.values['response'] = response
 
-        try:
-            raw_response = assemble_response(flow.response).decode('utf-8','replace')
-        except UnicodeDecodeError as exc:
-            try:
-                raw_response = str(assemble_response(flow.response))
-            except Exception as assemble_exc:
-                raw_response = None
-                self._parent_callback_proxy_message(flow.request.pretty_url)
-                self._parent_callback_proxy_message(str(assemble_exc))
-                detected_encoding = chardet.detect(flow.response)['encoding']
-                try:
-                    raw_response = flow.response.decode(detected_encoding)
-                except UnicodeDecodeError as decode_exc:
-                    print(f"Failed to decode byte string: {decode_exc}")
-                    raw_response = ""
-        except Exception as exc:
-            self._parent_callback_proxy_message(flow.request.pretty_url)
-            self._parent_callback_proxy_message(str(exc))
-            raw_response = None
+        response_headers = None
+        header_start = time.perf_counter()
 
         try:
-            decoded_content = None
-            if flow.response.content:
-                size = len(flow.response.content)
-                size  = min(size, 20)
-                if flow.response.content[0:size] != flow.response.get_decoded_content()[0:size]:
-                    decoded_content = flow.response.get_decoded_content()
-                else:
-                    decoded_content = flow.response.get_content()
+            response_lines = [f"HTTP/1.1 {response.status_code}"]
+            for key, value in response.headers.fields:
+                response_lines.append(f"{decode_header(key)}: {decode_header(value)}")
+            if len(response_lines) > 1:
+                response_headers = "\n".join(response_lines) + "\n"
         except Exception as exc:
-            decoded_content = None
-
+            self._parent_callback_proxy_message(f"RESPONSE: response headers string - {exc}")
+            response_headers = str(response.headers)
+        self.metrics.observe('response_headers', time.perf_counter() - header_start)
+
+        new_response = {}
+        if not snapshot.captured:
+            with self.metrics.timer('request_record'):
+                new_response = self._request_record(snapshot.flow_id, request, snapshot.target_id,
+                                                    snapshot.dynamic_host, snapshot.capture_mode != CAPTURE_METADATA)
+        elif snapshot.capture_mode == CAPTURE_METADATA:
+            new_response = self._request_metadata(request)
+        with self.metrics.timer('response_body'):
+            response_body = self._response_body(snapshot, request, response)
+        new_response.update(
+            flow_id=snapshot.flow_id,
+            target_id=snapshot.target_id,
+            action='Response',
+            response_status_code=response.status_code,
+            response_reason=str(response.reason),
+            response_headers=str(response_headers),
+            **response_body
+        )
         try:
-            full_flow = None
+            with self.metrics.timer('flow_archive'):
+                new_response['flow'] = self.writer.flow_archive.append_state(snapshot.state, snapshot.target_id)
         except Exception as exc:
-            full_flow = None
+            self._parent_callback_proxy_message(f"RESPONSE: flow archive - {exc}")
+        context.values['record'] = new_response
 
-        try:
-            new_response = ProxyModel(
-                target_id=int(self.target.id),
-                name=None,
-                request=None,
-                action='Response',
-                response_status_code=flow.response.status_code,
-                response_reason=str(flow.response.reason),
-                response_headers=str(response_headers),
-                response_text=self.clean_string(flow.response.text),
-                host=host,
-                port=port,
-                method=method,
-                scheme=scheme,
-                authority=authority,
-                path=path,
-                headers=str(headers),
-                content=self.clean_string(content),
-                timestamp_start=timestamp_start,
-                timestamp_end=timestamp_end,
-                full_url=full_url,
-                parsed_full_url=parsed,
-                parsed_path=path,
-                parsed_url=url,
-                raw_request=self.clean_string(raw_request),
-                raw_response=self.clean_string(raw_response),
-                decoded_content=self.clean_string(decoded_content),
-                flow=full_flow,
-                dynamic_host=dynamic_host,
-                dynamic_full_url=dynamic_full_url
-            )
-
-            with Database._get_db() as db:
-                db.add(new_response)
-                db.commit()
-                db.refresh(new_response)
-
-        except Exception as database_exception: # pylint: disable=W0718
-            self._parent_callback_proxy_message("RESPONSE: database_exception...")
-            self._parent_callback_proxy_message(database_exception)
-            self._parent_callback_proxy_message(traceback.print_exc())
+    async def _response_persist(self, context: FlowContext) -> None:
+        """Queue the response record, or remove a captured flow the policy drops, and publish it to `proxy tail`.
 
+        The background stages of the request have finished by now, so a request
+        record that was dropped after the response snapshot was taken is merged
+        into the response record here.
+        """
+        request_record = context.flow.metadata.pop(REQUEST_METADATA_KEY, None)
+        if context.values['capture_mode'] == CAPTURE_DROP:
+            self.metrics.inc('flows_policy_dropped')
+            if context.flow.metadata.get(CAPTURED_METADATA_KEY, False):
+                await self.writer.enqueue_async({'flow_id': context.flow_id, 'action': 'Drop'})
+            context.stop()
+            return
+        record = context.values['record']
+        if request_record is not None and context.snapshot.captured:
+            record = {**request_record, **record}
+        if await self.writer.enqueue_async(record):
+            self.metrics.inc('flows_captured')
+        if FLOW_BROADCAST.active():
+            FLOW_BROADCAST.publish(self._flow_summary(context))
+
+    @staticmethod
+    def _flow_summary(context: FlowContext) -> FlowSummary:
+        """Summarize a captured flow for `proxy tail`, from the live flow."""
+        flow = context.flow
+        request, response = flow.request, flow.response
+        spilled_body = flow.metadata.get(SPILLED_METADATA_KEY)
+        if spilled_body is not None:
+            size = spilled_body.written
+        elif response.raw_content is not None:
+            size = len(response.raw_content)
+        else:
+            try:
+                size = int(response.headers.get('content-length'))
+            except (TypeError, ValueError):
+                size = None
+        duration = None
+        if request.timestamp_start is not None and response.timestamp_end is not None:
+            duration = response.timestamp_end - request.timestamp_start
+        return FlowSummary(context.flow_id, context.snapshot.target_id, request.timestamp_start, request.method,
+                           request.pretty_host, request.pretty_url, response.status_code,
+                           mime_class(response.headers.get('content-type'), request.path), size, duration)
+
+    async def _response_analyze(self, context: FlowContext) -> None:
+        """Store the targets of a Synack registered summary."""
+        flow = context.flow
         if self.auth_token is not None and self.synack_api is not None:
 
             if flow.request.pretty_url.startswith(self.synack_base) and '/api/targets/registered_summary' == flow.request.path:
                 self._parent_callback_proxy_message(f"RESPONSE: {flow.request.pretty_url}")
-                targets = json.loads(self.clean_string(flow.response.text))
+                targets = json.loads(self.clean_string(context.values['response'].text))
 
                 for target in targets:
                     new_target = SynackTargetModel(
@@ -787,7 +954,19 @@ class ProxyHelper: # pylint: disable=R0902
                         collaboration_criteria = str(target['collaboration_criteria'])
                     )
 
-                    with Database._get_db() as db:
-                        db.add(new_target)
-                        db.commit()
-                        db.refresh(new_target)
+                    await run_db(self._add_synack_target, new_target)
+
+    @staticmethod
+    def _add_synack_target(db, new_target: SynackTargetModel) -> None:
+        """Store a Synack target, run with `run_db`."""
+        db.add(new_target)
+        db.commit()
+
+    async def done(self) -> None:
+        """Finish the background stages of the pipeline when the proxy shuts down.
+
+        Returns:
+            None
+        """
+        await self.pipeline.drain()
+        self.pipeline.close()
@@ -0,0 +1,94 @@
+"""proxypolicy.py"""
+from typing import List
+from rich.console import Console
+from rich.table import Table
+from sqlalchemy import func
+from modules.capture_policy import CAPTURE_DROP, CAPTURE_MODES, RULE_TYPES, media_rules
+from modules.database import Database
+from modules.proxycommand import ProxyCommand
+from models import CapturePolicyModel
+
+# pylint: disable=C0121,W0212
+
+
+class PolicyCommands(ProxyCommand):
+    """The `proxy policy` commands, managing the capture policy of the selected target."""
+
+    def _policy(self) -> None:
+        """Print the capture policy rules of the selected target.
+
+        Returns:
+            None
+        """
+        if self.app_obj.selected_target is None:
+            print("\nPlease select a target before using the 'policy' option.\n")
+            return
+
+        with Database._get_db() as db:
+            records: List[CapturePolicyModel] = db.query(CapturePolicyModel).filter(
+                    CapturePolicyModel.target_id == self.app_obj.selected_target.id,
+                    CapturePolicyModel.active == True
+                ).order_by(CapturePolicyModel.id).all()
+
+        print()
+        table = Table(title='Capture Policy')
+        table.add_column('id')
+        table.add_column('rule')
+        table.add_column('pattern')
+        table.add_column('mode')
+        for record in records:
+            table.add_row(str(record.id), record.rule_type, record.pattern, record.mode)
+
+        console = Console()
+        console.print(table)
+        print("Rules are checked in order; flows no rule matches are captured in full.")
+        print("Usage: proxy policy add <content-type|extension|host|path> <pattern> <full|metadata|drop>")
+        print("       proxy policy remove <id>")
+        print("       proxy policy no-media")
+        print()
+
+    def _policy_dynamic(self, args=None) -> None:
+        """Add or remove capture policy rules of the selected target.
+
+        Args:
+            args: The command arguments.
+
+        Returns:
+            None
+        """
+        if self.app_obj.selected_target is None:
+            print("\nPlease select a target before using the 'policy' option.\n")
+            return
+        target_id = self.app_obj.selected_target.id
+
+        rules = []
+        match args[2].lower():
+            case 'add':
+                if len(args) != 6 or args[3].lower() not in RULE_TYPES or args[5].lower() not in CAPTURE_MODES:
+                    print("Usage: proxy policy add <content-type|extension|host|path> <pattern> <full|metadata|drop>")
+                    return
+                rules.append({'rule_type': args[3].lower(), 'pattern': args[4], 'mode': args[5].lower()})
+            case 'no-media':
+                rules = media_rules(CAPTURE_DROP)
+            case 'remove':
+                try:
+                    policy_id = int(args[3])
+                except (IndexError, ValueError):
+                    print("Usage: proxy policy remove <id>")
+                    return
+                with Database._get_db() as db:
+                    db.query(CapturePolicyModel)\
+                        .filter(CapturePolicyModel.id == policy_id, CapturePolicyModel.target_id == target_id)\
+                        .update({'active': False, 'modified_timestamp': func.now()})
+                    db.commit()
+            case _:
+                return
+
+        if len(rules) > 0:
+            with Database._get_db() as db:
+                for rule in rules:
+                    db.add(CapturePolicyModel(target_id=target_id, **rule))
+                db.commit()
+
+        self.app_obj.selected_target_capture_policy = None
+        self._policy()
@@ -0,0 +1,192 @@
+"""proxyreports.py"""
+from concurrent.futures import CancelledError
+from datetime import datetime
+from typing import List
+from rich.console import Console
+from rich.table import Table
+from rich.text import Text
+from modules.bodystore import BodyStore
+from modules.database import Database
+from modules.history import explain, plan_indexes, planned_queries
+from modules.proxycommand import ProxyCommand
+from modules.proxywriter import ProxyWriter
+from modules.summarytable import SummaryTable
+
+SUMMARY_COLUMNS = {'host': 'host', 'method': 'method', 'status': 'response_status_code', 'content': 'content_class'}
+# pylint: disable=W0212,W0718
+
+
+class ReportCommands(ProxyCommand):
+    """The `proxy stats`, `replay`, `storage`, `summary` and `explain` commands."""
+
+    def _stats(self) -> None:
+        """Print the timings and counters of the running proxy.
+
+        Returns:
+            None
+        """
+        if self.writer is None:
+            print("\nThe proxy is not running.\n")
+            return
+        snapshot = self.writer.metrics.snapshot()
+
+        print()
+        table = Table(title='Proxy Stages')
+        table.add_column('Stage')
+        table.add_column('Count', justify='right')
+        table.add_column('p50 (ms)', justify='right')
+        table.add_column('p95 (ms)', justify='right')
+        table.add_column('p99 (ms)', justify='right')
+        for name, timer in snapshot['timers'].items():
+            table.add_row(name, str(timer['count']),
+                          *[f"{timer[percentile] * 1000:.3f}" if percentile in timer else '-' for percentile in (50, 95, 99)])
+
+        counters = Table(title='Proxy Counters')
+        counters.add_column('Name')
+        counters.add_column('Value', justify='right')
+        for name, value in {**snapshot['counters'], **snapshot['gauges']}.items():
+            counters.add_row(name, str(value))
+
+        console = Console()
+        console.print(table)
+        console.print(counters)
+        print()
+
+    def _replay(self) -> None:
+        """Write the capture journals left by earlier sessions to the database.
+
+        While the proxy is running the replay is queued for its writer thread.
+
+        Returns:
+            None
+        """
+        if self.writer is not None and self.writer.thread is not None:
+            try:
+                journals, records = self.writer.request_replay().result()
+            except CancelledError:
+                print("\nThe proxy stopped before the journals were replayed.\n")
+                return
+        else:
+            journals, records = ProxyWriter(journal=False).replay_journals()
+        print(f"\nReplayed {records} record(s) from {journals} journal(s).\n")
+
+    def _storage(self) -> None:
+        """Print the response body storage used per target.
+
+        Returns:
+            None
+        """
+        with Database._get_db() as db:
+            try:
+                records = BodyStore().storage_by_target(db)
+            except Exception as exc:
+                print(exc)
+                return
+
+        print()
+        table = Table(title='Response Body Storage')
+        table.add_column('Target')
+        table.add_column('Bodies', justify='right')
+        table.add_column('Size', justify='right')
+        table.add_column('Stored', justify='right')
+        table.add_column('Ratio', justify='right')
+        for record in records:
+            size = record.size or 0
+            stored_size = record.stored_size or 0
+            ratio = f"{size / stored_size:.2f}x" if stored_size > 0 else '-'
+            table.add_row(record.name or '(none)', str(record.bodies), str(size), str(stored_size), ratio)
+
+        console = Console()
+        console.print(table)
+        print()
+
+    def _summary(self, columns: List[str] = None) -> None:
+        """Print the request counts, response bytes and last seen time of the selected target's traffic.
+
+        Args:
+            columns (List[str]): The `SUMMARY_COLUMNS` to group by, all of them by default.
+
+        Returns:
+            None
+        """
+        columns = columns or list(SUMMARY_COLUMNS)
+        with Database._get_db() as db:
+            try:
+                records = SummaryTable.summary(db, self._target_id(), [SUMMARY_COLUMNS[column] for column in columns])
+            except Exception as exc:
+                print(exc)
+                return
+
+        print()
+        table = Table(title='Traffic Summary')
+        for column in columns:
+            table.add_column(column, justify='right' if column == 'status' else 'left')
+        table.add_column('Requests', justify='right')
+        table.add_column('Bytes', justify='right')
+        table.add_column('Last seen')
+        for record in records:
+            values = [str(value) if value not in (None, '', 0) else '-' for value in record[:len(columns)]]
+            last_seen = datetime.fromtimestamp(record.last_seen).strftime("%m/%d/%Y %H:%M:%S") if record.last_seen else '-'
+            table.add_row(*values, str(record.request_count), str(record.response_bytes or 0), last_seen)
+
+        console = Console()
+        console.print(table)
+        print("Usage: proxy summary [host|method|status|content ...]")
+        print("       proxy summary rebuild")
+        print()
+
+    def _summary_dynamic(self, args=None) -> None:
+        """Print the traffic summary grouped by some columns, or rebuild it from the proxy table.
+
+        Args:
+            args: The command arguments.
+
+        Returns:
+            None
+        """
+        if args[2].lower() == 'rebuild':
+            target_id = self._target_id()
+            with Database._get_db() as db:
+                try:
+                    counted = SummaryTable().rebuild(db, target_id)
+                    db.commit()
+                except Exception as exc:
+                    print(exc)
+                    return
+            print(f"\nCounted {counted} proxy row(s) in the traffic summary{'' if target_id is None else ' of the target'}.\n")
+            return
+
+        columns = [column.lower() for column in args[2:]]
+        unknown = [column for column in columns if column not in SUMMARY_COLUMNS]
+        if len(unknown) > 0:
+            print(f"\nUnknown summary column(s): {', '.join(unknown)}")
+            print("Usage: proxy summary [host|method|status|content ...]\n")
+            return
+        self._summary(list(dict.fromkeys(columns)))
+
+    def _explain(self) -> None:
+        """Print which indexes the history views use, from the database's query plans.
+
+        Returns:
+            None
+        """
+        target_id = self._target_id()
+        with Database._get_db() as db:
+            try:
+                plans = [(command, explain(db, statement)) for command, statement in planned_queries(target_id)]
+            except Exception as exc:
+                print(exc)
+                return
+
+        print()
+        table = Table(title='History Query Plans')
+        table.add_column('Query')
+        table.add_column('Indexes', overflow='fold')
+        table.add_column('Full scan')
+        for command, plan in plans:
+            indexes, full_scan = plan_indexes(plan)
+            table.add_row(command, '\n'.join(indexes) or '-', Text('yes', style="bold red") if full_scan else 'no')
+
+        console = Console()
+        console.print(table)
+        print()
@@ -0,0 +1,84 @@
+"""proxytail.py"""
+import threading
+from datetime import datetime
+from typing import List
+from prompt_toolkit import PromptSession
+from prompt_toolkit.patch_stdout import patch_stdout
+from rich.console import Console
+from rich.text import Text
+from modules.proxycommand import ProxyCommand
+from modules.tail import FLOW_BROADCAST, FlowSummary, TailFilter
+
+
+class TailCommands(ProxyCommand):
+    """The `proxy tail` command, following the captured flows live."""
+
+    def _tail(self, filters: List[str] = None) -> None:
+        """Print the flows the proxy captures as they arrive, until enter is pressed.
+
+        The flows come from the in-process `FLOW_BROADCAST`, not the database.
+        When the terminal cannot keep up, the oldest flows not shown yet are
+        skipped rather than slowing the proxy down.
+
+        Args:
+            filters (List[str]): The `TailFilter` arguments.
+
+        Returns:
+            None
+        """
+        if not self.app_obj.proxy_running:
+            print("\nThe proxy is not running.\n")
+            return
+        tail_filter = TailFilter(filters or [])
+        stop_event = threading.Event()
+        subscription = FLOW_BROADCAST.subscribe()
+        printer = threading.Thread(target=self._print_tail, args=(subscription, tail_filter, stop_event),
+                                   name='proxy-tail', daemon=True)
+        print("\nShowing the captured flows as they arrive ([enter]=stop)...\n")
+        with patch_stdout(raw=True):
+            printer.start()
+            try:
+                PromptSession().prompt(' > ')
+            except (KeyboardInterrupt, EOFError):
+                pass
+            finally:
+                stop_event.set()
+                subscription.close()
+                printer.join()
+        if subscription.dropped > 0:
+            print(f"Skipped {subscription.dropped} flow(s) the terminal could not keep up with.")
+        print()
+
+    def _tail_dynamic(self, args=None) -> None:
+        """Print the captured flows matching some filters as they arrive.
+
+        Args:
+            args: The command arguments.
+
+        Returns:
+            None
+        """
+        self._tail(args[2:])
+
+    @staticmethod
+    def _print_tail(subscription, tail_filter: TailFilter, stop_event: threading.Event) -> None:
+        console = Console()
+        while not stop_event.is_set():
+            flow = subscription.get(timeout=0.5)
+            if flow is not None and tail_filter.matches(flow):
+                console.print(TailCommands._tail_line(flow), soft_wrap=True)
+
+    @staticmethod
+    def _tail_line(flow: FlowSummary) -> Text:
+        """Format a flow as a `proxy tail` line."""
+        status = flow.response_status_code
+        style = {2: 'green', 3: 'cyan', 4: 'yellow', 5: 'bold red'}.get((status or 0) // 100, '')
+        line = Text()
+        line.append(datetime.fromtimestamp(flow.timestamp_start).strftime("%H:%M:%S") if flow.timestamp_start else '--:--:--')
+        line.append(f" {flow.method:<7}")
+        line.append(f"{status if status is not None else '-':>3}", style=style)
+        line.append(f" {flow.content_class:<6}")
+        line.append(f" {flow.size if flow.size is not None else '-':>9}")
+        line.append(f" {f'{flow.duration * 1000:.0f}ms' if flow.duration is not None else '-':>8} ")
+        line.append(flow.full_url)
+        return line
@@ -0,0 +1,725 @@
+"""proxywriter.py"""
+import asyncio
+import glob
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import List
+from sqlalchemy import Row, delete, insert, select, update
+from sqlalchemy.orm import Session
+from dotenv import load_dotenv
+from modules.bodystore import BODY_SEGMENT_PATH, BodyStore
+from modules.commentindex import COMMENT_BACKFILL_CHUNK_SIZE, CommentIndex
+from modules.database import Database
+from modules.flowarchive import FlowArchive
+from modules.journal import JOURNAL_PATH, Journal, held_by_other_process
+from modules.metrics import METRICS_FILE, METRICS_INTERVAL, Metrics
+from modules.querycache import EVERYTHING, QUERY_CACHE
+from modules.search import SearchIndex
+from modules.segments import SegmentWriter, session_prefix
+from modules.summarytable import SUMMARY_FLOW_COLUMNS, SummaryTable
+from models import ProxyModel
+
+load_dotenv()
+
+# pylint: disable=R0902,R0913,R0917,W0718
+
+WRITER_BATCH_SIZE = int(os.environ.get('PROXY_WRITER_BATCH_SIZE', '200'))
+WRITER_FLUSH_INTERVAL = float(os.environ.get('PROXY_WRITER_FLUSH_INTERVAL', '0.5'))
+WRITER_QUEUE_SIZE = int(os.environ.get('PROXY_WRITER_QUEUE_SIZE', '10000'))
+OVERLOAD_BLOCK = 'block'
+OVERLOAD_METADATA = 'metadata'
+OVERLOAD_JOURNAL = 'journal'
+OVERLOAD_POLICIES = [OVERLOAD_BLOCK, OVERLOAD_METADATA, OVERLOAD_JOURNAL]
+OVERLOAD_POLICY = os.environ.get('PROXY_OVERLOAD_POLICY', OVERLOAD_METADATA).lower()
+OVERLOAD_BLOCK_TIMEOUT = float(os.environ.get('PROXY_OVERLOAD_BLOCK_TIMEOUT', '0.05'))
+OVERLOAD_POLL_INTERVAL = 0.005
+OVERLOAD_HIGH_WATER = float(os.environ.get('PROXY_OVERLOAD_HIGH_WATER', '0.75'))
+BODY_COLUMNS = ('content', 'response_text')
+REQUEST_REQUIRED_COLUMNS = ('target_id', 'full_url')
+JOURNAL_ENABLED = os.environ.get('PROXY_JOURNAL', 'true').lower() in ('1', 'true', 'yes')
+JOURNAL_MAX_SIZE = int(os.environ.get('PROXY_JOURNAL_MAX_SIZE', str(64 * 1024 * 1024)))
+JOURNAL_RETRY_INTERVAL = float(os.environ.get('PROXY_JOURNAL_RETRY_INTERVAL', '5'))
+COMMENT_BACKFILL_INTERVAL = float(os.environ.get('PROXY_COMMENT_BACKFILL_INTERVAL', '5'))
+DROPPED_MESSAGE_EVERY = 1000
+OVERLOAD_MESSAGE_EVERY = 1000
+
+
+class ProxyWriter:
+    """Write-behind queue for captured proxy records.
+
+    The proxy hooks hand over plain dictionaries of `ProxyModel` column values and
+    return immediately. A background thread drains the bounded queue and inserts
+    the records in multi-row batches, so the mitmproxy event loop never waits on
+    the database.
+
+    Each HTTP flow is stored as a single row keyed by `flow_id`. The request hook
+    queues the request columns and the response hook queues the response columns
+    for the same `flow_id`; both halves are merged into one insert when they land
+    in the same batch, otherwise the response updates the row inserted earlier.
+    A flow is only inserted with its `REQUEST_REQUIRED_COLUMNS`; a response whose
+    request record was lost and that does not carry them itself is dropped and
+    counted as `records_orphaned` instead of leaving a row no target shows.
+    A `Drop` record removes the flow again, for requests the capture policy only
+    drops once the response headers are in.
+
+    When the database cannot keep up, `overload_policy` decides what `enqueue`
+    does instead of blocking the proxy:
+
+    - `block` waits up to `block_timeout` seconds, `PROXY_OVERLOAD_BLOCK_TIMEOUT`
+      by default, for room in the queue before dropping the record;
+      `enqueue_async` waits without blocking the event loop.
+    - `metadata` strips the bodies of records queued while the queue is fuller
+      than `PROXY_OVERLOAD_HIGH_WATER`, so the backlog is cheaper to write.
+    - `journal` appends records to a local overflow journal once the queue is
+      full, and keeps doing so until the writer has caught up and replayed it, so
+      records of a flow are still written in order.
+
+    Unless `PROXY_JOURNAL` is off, every record is appended to a local capture
+    journal before it is queued, so the records still queued when the process
+    dies are not lost, and the writer thread fsyncs it after every batch.
+    `enqueue_async` buffers the records of an event loop tick and appends them
+    from a worker thread in one write, keeping the serialization and file I/O
+    off the event loop without a thread handoff per record. Once everything in
+    the journal is committed it is rotated away; a journal with a batch that
+    failed is kept and replayed by `replay` when the database is back, or later
+    with `proxy replay`. Journals left by a session that died are replayed by
+    the writer thread when it starts; the ones of a process still running, going
+    by the process id in their name, are left alone. `request_replay` queues a
+    replay for the writer thread, so a running proxy never writes from a second
+    session. Replays merge on `flow_id`, so replaying a journal twice is
+    harmless.
+
+    Response bodies go to the content-addressed `BodyStore`; `body_segments` holds
+    the segment files the proxy spills large bodies to and `flow_archive` the
+    serialized flows. `metrics` collects the timings and counters of the capture
+    path and is written to `PROXY_METRICS_FILE` every `PROXY_METRICS_INTERVAL`
+    seconds when that is set. `summary_table` keeps the per-target traffic counts
+    of `proxy summary` current with every batch.
+    """
+
+    def __init__(self, callback_proxy_message=None, batch_size: int = WRITER_BATCH_SIZE,
+                 flush_interval: float = WRITER_FLUSH_INTERVAL, queue_size: int = WRITER_QUEUE_SIZE,
+                 overload_policy: str = OVERLOAD_POLICY, journal: bool = JOURNAL_ENABLED,
+                 block_timeout: float = OVERLOAD_BLOCK_TIMEOUT) -> None:
+        self._callback_proxy_message = callback_proxy_message
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = max(0.01, flush_interval)
+        self.queue: queue.Queue = queue.Queue(maxsize=max(1, queue_size))
+        self.overload_policy = overload_policy if overload_policy in OVERLOAD_POLICIES else OVERLOAD_METADATA
+        self.high_water = max(1, int(self.queue.maxsize * OVERLOAD_HIGH_WATER))
+        self.block_timeout = max(0.0, block_timeout)
+        self.overflow = Journal(os.path.join(JOURNAL_PATH, f"{session_prefix('overflow')}.jsonl"))
+        self.overflow_offset = 0
+        self.spilling = False
+        self.journal_lock = threading.RLock()
+        self.journal_prefix = session_prefix('capture')
+        self.journal_count = 0
+        self.journal = self._new_journal() if journal else None
+        self.journal_failed = False
+        self.journal_buffer: List[tuple[dict, asyncio.Future]] = []
+        self.journal_flusher: asyncio.Task | None = None
+        self.unreplayed: List[str] = []
+        self.replay_attempted = 0.0
+        self.leftovers_replayed = False
+        self.replay_requests: List[Future] = []
+        self.bodies_backfilled = 0.0
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.written_count = 0
+        self.dropped_count = 0
+        self.failed_count = 0
+        self.body_store = BodyStore()
+        self.search_index = SearchIndex(self.body_store)
+        self.comment_index = CommentIndex(self.body_store)
+        self.summary_table = SummaryTable()
+        self.body_segments = SegmentWriter(BODY_SEGMENT_PATH, session_prefix('body'))
+        self.flow_archive = FlowArchive()
+        self.metrics = Metrics()
+        self.metrics.gauge('queue_depth', self.pending)
+        self.metrics.gauge('records_written', lambda: self.written_count)
+        self.metrics.gauge('records_dropped', lambda: self.dropped_count)
+        self.metrics.gauge('records_failed', lambda: self.failed_count)
+        self.metrics.gauge('body_bytes_stored', lambda: self.body_store.stored_bytes)
+        self.metrics.gauge('overflow_bytes', lambda: self.overflow.size() - self.overflow_offset if self.spilling else 0)
+        self.metrics_file = METRICS_FILE
+        self.metrics_written = time.monotonic()
+
+    def start(self) -> None:
+        """Start the background writer thread.
+
+        Returns:
+            None
+        """
+        if self.thread is not None and self.thread.is_alive():
+            return
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, name='proxy-writer', daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout: float = None) -> None:
+        """Flush every queued record and stop the background writer thread.
+
+        Args:
+            timeout (float): Maximum number of seconds to wait for the flush.
+
+        Returns:
+            None
+        """
+        self.stop_event.set()
+        running = False
+        if self.thread is not None:
+            self.thread.join(timeout)
+            running = self.thread.is_alive()
+            self.thread = None
+        self.body_segments.close()
+        self.flow_archive.close()
+        self.overflow.close()
+        if self.overflow.size() == 0:
+            self._remove(self.overflow.path)
+        if self.journal is not None:
+            self.journal.close()
+            if self.journal_failed or not self.queue.empty() or self.spilling or running:
+                self.unreplayed.append(self.journal.path)
+            else:
+                self._remove(self.journal.path)
+        if not running:
+            self._cancel_replay_requests()
+        if len(self.unreplayed) > 0:
+            self._message(f"WRITER: {len(self.unreplayed)} capture journal(s) not written to the database yet, use 'proxy replay'.")
+        self._write_metrics()
+
+    def enqueue(self, record: dict, block_timeout: float = None) -> bool:
+        """Journal a record and queue it for the next batch, applying the overload policy when the queue is full.
+
+        Args:
+            record (dict): `ProxyModel` column values.
+            block_timeout (float): How long the `block` policy waits for room in the queue, `block_timeout` by default.
+
+        Returns:
+            True if the record was queued or journaled, False if it was dropped.
+        """
+        block_timeout = self.block_timeout if block_timeout is None else block_timeout
+        if self.journal is None:
+            return self._enqueue(record, block_timeout)
+        with self.journal_lock:
+            try:
+                self.journal.append(record)
+            except (OSError, TypeError, ValueError) as exc:
+                self._message(f"WRITER: capture journal - {exc}")
+            return self._enqueue(record, block_timeout)
+
+    async def enqueue_async(self, record: dict) -> bool:
+        """Journal and queue a record from a coroutine.
+
+        Same as `enqueue`, except that the `block` policy yields to the event loop
+        while it waits for room in the queue, so other flows keep moving, and the
+        record is journaled with the others of the same event loop tick, from a
+        worker thread.
+
+        Args:
+            record (dict): `ProxyModel` column values.
+
+        Returns:
+            True if the record was queued or journaled, False if it was dropped.
+        """
+        if self.overload_policy == OVERLOAD_BLOCK and self.queue.full():
+            deadline = time.monotonic() + self.block_timeout
+            while self.queue.full() and time.monotonic() < deadline:
+                await asyncio.sleep(OVERLOAD_POLL_INTERVAL)
+            if not self.queue.full():
+                self._overloaded('overload_blocked')
+        if self.journal is None:
+            return self.enqueue(record, block_timeout=0)
+        future = asyncio.get_running_loop().create_future()
+        self.journal_buffer.append((record, future))
+        if self.journal_flusher is None or self.journal_flusher.done():
+            self.journal_flusher = asyncio.create_task(self._flush_journal_buffer())
+        return await future
+
+    async def _flush_journal_buffer(self) -> None:
+        """Journal and queue the records buffered by `enqueue_async`, in order, with one append per batch."""
+        while len(self.journal_buffer) > 0:
+            buffered, self.journal_buffer = self.journal_buffer, []
+            try:
+                results = await asyncio.to_thread(self._journal_records, [record for record, _ in buffered])
+            except Exception as exc:
+                for _, future in buffered:
+                    if not future.done():
+                        future.set_exception(exc)
+                continue
+            for (_, future), result in zip(buffered, results):
+                if not future.done():
+                    future.set_result(result)
+
+    def _journal_records(self, records: List[dict]) -> List[bool]:
+        """Append records to the capture journal in one write, then queue them without blocking."""
+        with self.journal_lock:
+            try:
+                self.journal.append(records)
+            except (OSError, TypeError, ValueError) as exc:
+                self._message(f"WRITER: capture journal - {exc}")
+            return [self._enqueue(record, 0) for record in records]
+
+    def _enqueue(self, record: dict, block_timeout: float) -> bool:
+        if self.spilling:
+            with self.overflow.lock:
+                if self.spilling:
+                    return self._spill(record)
+        if self.overload_policy == OVERLOAD_METADATA and self.queue.qsize() >= self.high_water:
+            record = self._metadata_only(record)
+            self._overloaded('overload_metadata')
+        try:
+            self.queue.put_nowait(record)
+            return True
+        except queue.Full:
+            pass
+
+        if self.overload_policy == OVERLOAD_BLOCK and block_timeout > 0:
+            try:
+                self.queue.put(record, timeout=block_timeout)
+                self._overloaded('overload_blocked')
+                return True
+            except queue.Full:
+                pass
+        elif self.overload_policy == OVERLOAD_JOURNAL:
+            with self.overflow.lock:
+                self.spilling = True
+                return self._spill(record)
+
+        self.dropped_count += 1
+        if self.dropped_count % DROPPED_MESSAGE_EVERY == 1:
+            self._message(f"WRITER: queue full, {self.dropped_count} record(s) dropped so far.")
+        return False
+
+    def _overloaded(self, counter: str) -> None:
+        self.metrics.inc(counter)
+        if self.metrics.counters[counter] % OVERLOAD_MESSAGE_EVERY == 1:
+            self._message(f"WRITER: database is falling behind, {counter} triggered {self.metrics.counters[counter]} time(s).")
+
+    def _orphaned(self) -> None:
+        self.metrics.inc('records_orphaned')
+        if self.metrics.counters['records_orphaned'] % DROPPED_MESSAGE_EVERY == 1:
+            self._message(f"WRITER: {self.metrics.counters['records_orphaned']} response record(s) without their request dropped so far.")
+
+    def _spill(self, record: dict) -> bool:
+        try:
+            self.overflow.append(record)
+            self._overloaded('overload_journaled')
+            return True
+        except (OSError, TypeError, ValueError) as exc:
+            self.dropped_count += 1
+            self._message(f"WRITER: overflow journal - {exc}")
+            return False
+
+    @staticmethod
+    def _metadata_only(record: dict) -> dict:
+        """Get a copy of a record without its request and response bodies."""
+        record = dict(record)
+        for column in BODY_COLUMNS:
+            if column in record:
+                record[column] = None
+        raw_request = record.get('raw_request')
+        if raw_request is not None:
+            record['raw_request'] = raw_request.split('\r\n\r\n', 1)[0] + '\r\n\r\n'
+        return record
+
+    def pending(self) -> int:
+        """Number of records waiting to be written."""
+        return self.queue.qsize()
+
+    def _message(self, message) -> None:
+        if self._callback_proxy_message is not None:
+            self._callback_proxy_message(message)
+        else:
+            print(message)
+
+    def _write_metrics(self) -> None:
+        if self.metrics_file == '':
+            return
+        try:
+            self.metrics.write_prometheus(self.metrics_file)
+        except OSError as exc:
+            self._message(f"WRITER: metrics file - {exc}")
+        self.metrics_written = time.monotonic()
+
+    def _replay_overflow(self) -> bool:
+        """Write the next batch of the overflow journal once the queue is empty.
+
+        Returns:
+            False if the batch could not be written and will be retried.
+        """
+        batch, offset = self.overflow.read(self.overflow_offset, self.batch_size)
+        if len(batch) > 0 and not self._write_batch(batch):
+            self.stop_event.wait(self.flush_interval)
+            return False
+        self.overflow_offset = offset
+        if len(batch) < self.batch_size:
+            with self.overflow.lock:
+                if self.overflow.reset(offset):
+                    self.overflow_offset = 0
+                    self.spilling = False
+        return True
+
+    @staticmethod
+    def _remove(path: str) -> None:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def _new_journal(self) -> Journal:
+        self.journal_count += 1
+        return Journal(os.path.join(JOURNAL_PATH, f"{self.journal_prefix}-{self.journal_count:04d}.jsonl"),
+                       fsync_interval=float('inf'))
+
+    def _checkpoint_journal(self) -> None:
+        """Fsync the capture journal and rotate it once every record in it was processed."""
+        if self.journal is None:
+            return
+        self.journal.sync()
+        if not self.queue.empty() or self.spilling:
+            return
+        if not self.journal_failed and self.journal.size() < JOURNAL_MAX_SIZE:
+            return
+        # A hook holding the lock may be waiting for room in the queue, so try again after the next batch.
+        if not self.journal_lock.acquire(blocking=False):
+            return
+        try:
+            if not self.queue.empty():
+                return
+            journal = self.journal
+            self.journal = self._new_journal()
+        finally:
+            self.journal_lock.release()
+        journal.close()
+        if self.journal_failed:
+            self.unreplayed.append(journal.path)
+            self.journal_failed = False
+        else:
+            self._remove(journal.path)
+
+    def _replay_unreplayed(self) -> None:
+        """Retry the journals of this session that could not be written."""
+        if len(self.unreplayed) == 0 or time.monotonic() - self.replay_attempted < JOURNAL_RETRY_INTERVAL:
+            return
+        self.replay_attempted = time.monotonic()
+        while len(self.unreplayed) > 0:
+            if self.replay(self.unreplayed[0]) is None:
+                return
+            self.unreplayed.pop(0)
+
+    def _backfill_bodies(self) -> None:
+        """Extract the comments of, and index, a chunk of bodies not processed at ingest, e.g. spilled ones."""
+        if time.monotonic() - self.bodies_backfilled < COMMENT_BACKFILL_INTERVAL:
+            return
+        self.bodies_backfilled = time.monotonic()
+        try:
+            with Database._get_db() as db:
+                self.comment_index.backfill(db, limit=COMMENT_BACKFILL_CHUNK_SIZE)
+        except Exception as database_exception:
+            self._message(f"WRITER: comment backfill failed - {database_exception}")
+        try:
+            with Database._get_db() as db:
+                self.search_index.backfill_bodies(db, limit=COMMENT_BACKFILL_CHUNK_SIZE, batch_size=COMMENT_BACKFILL_CHUNK_SIZE)
+        except Exception as database_exception:
+            self._message(f"WRITER: search backfill failed - {database_exception}")
+
+    def replay(self, path: str) -> int | None:
+        """Write the records of a journal to the database and delete it.
+
+        Records are merged on `flow_id`, so flows already in the database are
+        updated rather than inserted again.
+
+        Args:
+            path (str): The journal file.
+
+        Returns:
+            The number of records replayed, or None if the database is unavailable and the journal was kept.
+        """
+        journal = Journal(path)
+        offset = 0
+        replayed = 0
+        while True:
+            batch, offset_after = journal.read(offset, self.batch_size)
+            if len(batch) == 0:
+                break
+            if not self._write_batch(batch, replay=True):
+                return None
+            offset = offset_after
+            replayed += len(batch)
+        self.metrics.inc('journal_replayed', replayed)
+        self._remove(path)
+        return replayed
+
+    def replay_journals(self, directory: str = None) -> tuple[int, int]:
+        """Replay every journal left in a directory, except the ones still in use.
+
+        The journals this writer is appending to, and the ones of another
+        process that is still running, are skipped.
+
+        Args:
+            directory (str): The journal directory, `JOURNAL_PATH` by default.
+
+        Returns:
+            (journals replayed, records replayed)
+        """
+        directory = JOURNAL_PATH if directory is None else directory
+        in_use = {self.overflow.path}
+        if self.journal is not None:
+            in_use.add(self.journal.path)
+        journals = 0
+        records = 0
+        for path in sorted(glob.glob(os.path.join(directory, '*.jsonl')), key=os.path.getmtime):
+            if path in in_use or held_by_other_process(path):
+                continue
+            replayed = self.replay(path)
+            if replayed is None:
+                break
+            if path in self.unreplayed:
+                self.unreplayed.remove(path)
+            journals += 1
+            records += replayed
+        return journals, records
+
+    def request_replay(self) -> Future:
+        """Queue a `replay_journals` for the writer thread.
+
+        Returns:
+            A future of (journals replayed, records replayed), cancelled if the writer stops first.
+        """
+        future: Future = Future()
+        self.queue.put(future)
+        return future
+
+    def _cancel_replay_requests(self) -> None:
+        """Cancel the replays the stopped writer thread will not run, including the ones still queued."""
+        with self.queue.mutex:
+            futures = [record for record in self.queue.queue if isinstance(record, Future)]
+        for future in self.replay_requests + futures:
+            future.cancel()
+        self.replay_requests = []
+
+    def _replay_requested(self) -> None:
+        """Run the replays queued by `request_replay`, and the one of the journals left by earlier sessions."""
+        if not self.leftovers_replayed:
+            self.leftovers_replayed = True
+            try:
+                journals, records = self.replay_journals()
+                if journals > 0:
+                    self._message(f"WRITER: replayed {records} record(s) from {journals} journal(s) left by an earlier session.")
+            except Exception as exc:
+                self._message(f"WRITER: journal replay failed - {exc}")
+        while len(self.replay_requests) > 0:
+            future = self.replay_requests.pop(0)
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(self.replay_journals())
+            except Exception as exc:
+                future.set_exception(exc)
+
+    def _run(self) -> None:
+        self._replay_requested()
+        while not self.stop_event.is_set() or not self.queue.empty() or self.spilling:
+            batch = self._next_batch()
+            if len(batch) > 0:
+                self._write_batch(batch)
+            self._replay_requested()
+            if self.spilling and self.queue.empty():
+                if not self._replay_overflow() and self.stop_event.is_set():
+                    self._message(f"WRITER: database unavailable, overflow journal kept at {self.overflow.path}")
+                    break
+            self._checkpoint_journal()
+            if not self.stop_event.is_set() and self.queue.empty() and not self.spilling:
+                self._replay_unreplayed()
+                self._backfill_bodies()
+            if self.metrics_file != '' and time.monotonic() - self.metrics_written >= METRICS_INTERVAL:
+                self._write_metrics()
+
+    def _next_batch(self) -> List[dict]:
+        """Collect up to `batch_size` records, waiting at most `flush_interval` seconds.
+
+        A replay request ends the batch, so the records queued before it are written first.
+        """
+        batch: List[dict] = []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            if self.stop_event.is_set():
+                try:
+                    record = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+            else:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    record = self.queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+            if isinstance(record, Future):
+                self.replay_requests.append(record)
+                break
+            batch.append(record)
+        return batch
+
+    def _write_batch(self, batch: List[dict], replay: bool = False) -> bool:
+        try:
+            with self.metrics.timer('database_write'), Database._get_db() as db:
+                changes = self._write_records(db, batch, replay)
+                db.commit()
+            QUERY_CACHE.captured(changes)
+            self.metrics.inc('batches_written')
+            self.written_count += len(batch)
+            return True
+        except Exception as database_exception:
+            self.failed_count += len(batch)
+            if not replay:
+                self.journal_failed = True
+            self._message("WRITER: database_exception...")
+            self._message(str(database_exception))
+            return False
+
+    @staticmethod
+    def _note_change(changes: dict, target_id: int | None, timestamp: int | None) -> None:
+        """Keep the oldest `timestamp_start` changed per target, for the query cache."""
+        low = EVERYTHING if timestamp is None else timestamp
+        changes[target_id] = min(changes.get(target_id, low), low)
+
+    @staticmethod
+    def _released_bodies(bodies: dict[str, list], updated: List[Row], updates: List[dict], deleted: List[Row]) -> dict[str, int]:
+        """Settle the body references of the rows a batch updates or deletes.
+
+        An update setting the body a row already has, e.g. when a journal is
+        replayed, does not add a reference; one replacing it releases the old
+        body, and so does deleting a row.
+
+        Returns:
+            The references to release per body hash. The counts of `bodies` are adjusted in place.
+        """
+        released: dict[str, int] = {}
+        for row in deleted:
+            if row.response_body_hash is not None:
+                released[row.response_body_hash] = released.get(row.response_body_hash, 0) + 1
+        for row, values in zip(updated, updates):
+            if 'response_body_hash' not in values or row.response_body_hash is None:
+                continue
+            if values['response_body_hash'] == row.response_body_hash:
+                bodies[row.response_body_hash][1] -= 1
+            else:
+                released[row.response_body_hash] = released.get(row.response_body_hash, 0) + 1
+        return released
+
+    def _write_records(self, db: Session, batch: List[dict], replay: bool = False) -> dict:
+        """Merge the records of a batch by flow and write them with one insert and one update.
+
+        When replaying, every flow is looked up, as its request may already be stored.
+
+        Returns:
+            The oldest `timestamp_start` inserted, updated or deleted per target, for `QueryCache.captured`.
+        """
+        flows, requested, inserts, dropped = self._merge_flows(batch)
+        changes: dict = {}
+        matched, new_flows = self._match_rows(db, flows, [flow_id for flow_id in flows if replay or flow_id not in requested], changes)
+        inserts += new_flows
+        for record in inserts:
+            self._note_change(changes, record.get('target_id'), record.get('timestamp_start'))
+        deleted = self._drop_flows(db, dropped, changes)
+        self._store_records(db, inserts, matched, deleted)
+        return changes
+
+    @staticmethod
+    def _merge_flows(batch: List[dict]) -> tuple[dict[str, dict], set[str], List[dict], set[str]]:
+        """Merge the records of a batch by `flow_id`.
+
+        Returns:
+            (the merged record per flow, the flows with a request record, the records without a flow, the dropped flows)
+        """
+        flows: dict[str, dict] = {}
+        requested: set[str] = set()
+        inserts: List[dict] = []
+        dropped: set[str] = set()
+        for record in batch:
+            flow_id = record.get('flow_id')
+            if flow_id is None:
+                inserts.append(record)
+                continue
+            if record.get('action') == 'Drop':
+                flows.pop(flow_id, None)
+                requested.discard(flow_id)
+                dropped.add(flow_id)
+                continue
+            if record.get('action') == 'Request':
+                requested.add(flow_id)
+            if flow_id in flows:
+                flows[flow_id].update(record)
+            else:
+                flows[flow_id] = dict(record)
+        return flows, requested, inserts, dropped
+
+    def _match_rows(self, db: Session, flows: dict[str, dict], lookup: List[str],
+                    changes: dict) -> tuple[List[tuple[Row, dict]], List[dict]]:
+        """Split the merged flows into updates of the rows stored already and inserts.
+
+        Only the flows in `lookup` are looked up. A flow without its `REQUEST_REQUIRED_COLUMNS`
+        is not inserted.
+
+        Returns:
+            (each row to update with its update, the records to insert)
+        """
+        existing = {}
+        if len(lookup) > 0:
+            existing = {row.flow_id: row for row in db.execute(
+                select(ProxyModel.flow_id, ProxyModel.id, *SUMMARY_FLOW_COLUMNS).where(ProxyModel.flow_id.in_(lookup)))}
+        matched: List[tuple[Row, dict]] = []
+        inserts: List[dict] = []
+        for flow_id, record in flows.items():
+            if flow_id in existing:
+                row = existing[flow_id]
+                matched.append((row, {'id': row.id, **record}))
+                self._note_change(changes, row.target_id, row.timestamp_start)
+                if 'timestamp_start' in record:
+                    self._note_change(changes, row.target_id, record['timestamp_start'])
+            elif all(record.get(column) is not None for column in REQUEST_REQUIRED_COLUMNS):
+                inserts.append(record)
+            else:
+                self._orphaned()
+        return matched, inserts
+
+    def _drop_flows(self, db: Session, dropped: set[str], changes: dict) -> List[Row]:
+        """Delete the dropped flows and their search documents.
+
+        Returns:
+            The rows deleted.
+        """
+        if len(dropped) == 0:
+            return []
+        rows = db.execute(select(ProxyModel.id, *SUMMARY_FLOW_COLUMNS).where(ProxyModel.flow_id.in_(dropped))).all()
+        for row in rows:
+            self._note_change(changes, row.target_id, row.timestamp_start)
+        if self.search_index.available(db):
+            self.search_index.remove(db, [row.id for row in rows])
+        db.execute(delete(ProxyModel).where(ProxyModel.flow_id.in_(dropped)))
+        return rows
+
+    def _store_records(self, db: Session, inserts: List[dict], matched: List[tuple[Row, dict]], deleted: List[Row]) -> None:
+        """Write the inserts and updates of a batch with their bodies, comments, summary counts and search documents."""
+        updated = [row for row, _ in matched]
+        updates = [values for _, values in matched]
+        documents = self.search_index.documents(inserts + updates)
+        bodies = self.body_store.extract(inserts + updates)
+        released = self._released_bodies(bodies, updated, updates, deleted)
+        self.body_store.save(db, bodies)
+        self.body_store.release(db, released)
+        self.comment_index.index(db, bodies, inserts + updates)
+        self.summary_table.record(db, [row._mapping for row in updated + deleted],
+                                  inserts + [{**row._mapping, **values} for row, values in zip(updated, updates)])
+        if len(inserts) > 0:
+            db.execute(insert(ProxyModel), inserts)
+        if len(updates) > 0:
+            db.execute(update(ProxyModel), updates)
+        self.search_index.index(db, documents)
+        self.search_index.index_bodies(db, bodies)
@@ -0,0 +1,132 @@
+"""querycache.py"""
+import os
+import threading
+from collections import OrderedDict
+from collections.abc import Hashable
+from typing import Any, List
+from dotenv import load_dotenv
+
+load_dotenv()
+
+QUERY_CACHE_ENTRIES = int(os.environ.get('PROXY_QUERY_CACHE_ENTRIES', '32'))
+QUERY_CACHE_ROWS = int(os.environ.get('PROXY_QUERY_CACHE_ROWS', '500'))
+QUERY_CACHE_EVENTS = 1000
+EVERYTHING = float('-inf')
+
+
+class CachedView:
+    """The newest rows of a history view, as of a capture sequence number.
+
+    `rows` are newest first on (`timestamp_start`, `id`) and `complete` tells
+    whether they are the whole result rather than its first `max_rows`.
+    """
+
+    def __init__(self, rows: List[Any], complete: bool, sequence: int, count: int = None) -> None:
+        self.rows = rows
+        self.complete = complete
+        self.sequence = sequence
+        self.count = count
+
+
+def merge_rows(rows: List[Any], fetched: List[Any], low: float, max_rows: int) -> tuple[List[Any], bool]:
+    """Replace the cached rows from a timestamp on with the rows read again.
+
+    Args:
+        rows: The cached rows, newest first.
+        fetched: The rows with `timestamp_start` of at least `low`, newest first.
+        low: The oldest timestamp that changed.
+        max_rows (int): The number of rows to keep.
+
+    Returns:
+        (rows, whether rows were cut to `max_rows`)
+    """
+    kept = [row for row in rows if row.timestamp_start < low]
+    merged = sorted(fetched + kept, key=lambda row: (row.timestamp_start, row.id), reverse=True)
+    return merged[:max_rows], len(merged) > max_rows
+
+
+class QueryCache:
+    """LRU cache of history views, kept valid by capture sequence numbers.
+
+    The proxy writer calls `captured` after every batch with the oldest
+    `timestamp_start` it inserted, updated or deleted per target, which bumps
+    the capture sequence of those targets and of the "no target" view. A view
+    cached at an older sequence is stale: only its rows from the oldest changed
+    timestamp on have to be read again and merged (`refresh_from`).
+
+    Sequence numbers live in memory, so the cache only sees captures written by
+    this process, which is where the proxy runs. Replays are written by the
+    proxy writer too; the other changes to stored rows, the body and comment
+    backfills, `database prune` and the migrations, `clear` the cache.
+    """
+
+    def __init__(self, max_entries: int = QUERY_CACHE_ENTRIES, max_rows: int = QUERY_CACHE_ROWS) -> None:
+        self.max_entries = max_entries
+        self.max_rows = max_rows
+        self.lock = threading.Lock()
+        self.entries: OrderedDict[Hashable, CachedView] = OrderedDict()
+        self.sequences: dict[int | None, int] = {}
+        self.events: dict[int | None, List[tuple[int, float]]] = {}
+
+    def captured(self, changes: dict[int | None, float]) -> None:
+        """Record the changes of a written batch.
+
+        Args:
+            changes: {target id: oldest `timestamp_start` changed}.
+
+        Returns:
+            None
+        """
+        if len(changes) == 0:
+            return
+        with self.lock:
+            for target_id, low in [*changes.items(), (None, min(changes.values()))]:
+                sequence = self.sequences.get(target_id, 0) + 1
+                self.sequences[target_id] = sequence
+                events = self.events.setdefault(target_id, [])
+                events.append((sequence, low))
+                if len(events) > QUERY_CACHE_EVENTS:
+                    del events[:len(events) - QUERY_CACHE_EVENTS]
+
+    def sequence(self, target_id: int | None) -> int:
+        """Get the capture sequence number of a target, None for all targets."""
+        with self.lock:
+            return self.sequences.get(target_id, 0)
+
+    def refresh_from(self, target_id: int | None, sequence: int) -> float | None:
+        """Get the oldest timestamp changed since a sequence number.
+
+        Returns:
+            None if nothing changed, `EVERYTHING` if the changes are no longer known.
+        """
+        with self.lock:
+            if self.sequences.get(target_id, 0) == sequence:
+                return None
+            events = self.events.get(target_id, [])
+            if len(events) == 0 or events[0][0] > sequence + 1:
+                return EVERYTHING
+            return min(low for event_sequence, low in events if event_sequence > sequence)
+
+    def get(self, key: Hashable) -> CachedView | None:
+        """Get a cached view, fresh or not."""
+        with self.lock:
+            view = self.entries.get(key)
+            if view is not None:
+                self.entries.move_to_end(key)
+            return view
+
+    def put(self, key: Hashable, view: CachedView) -> None:
+        """Cache a view, evicting the least recently used one when full."""
+        with self.lock:
+            self.entries[key] = view
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """Drop every cached view."""
+        with self.lock:
+            self.entries.clear()
+
+
+QUERY_CACHE = QueryCache()
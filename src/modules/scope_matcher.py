@@ -0,0 +1,117 @@
+"""scope_matcher.py"""
+from typing import Iterable, NamedTuple
+
+# pylint: disable=R0903
+
+DYNAMIC_PLACEHOLDER = '{dynamic}'
+
+
+class ScopeMatch(NamedTuple):
+    """Result of matching a host against the in scope items."""
+    in_scope: bool
+    dynamic_host: str | None = None
+
+
+NOT_IN_SCOPE = ScopeMatch(False, None)
+
+
+class _ScopeNode:
+    """Node of the reversed-label suffix trie."""
+    __slots__ = ('children', 'wildcard', 'dynamic_host')
+
+    def __init__(self) -> None:
+        self.children: dict[str, '_ScopeNode'] = {}
+        self.wildcard = False
+        self.dynamic_host = None
+
+
+class ScopeMatcher:
+    """In scope items compiled for constant-time host lookups.
+
+    Exact hosts live in a set. Wildcard (`*.example.com`) and dynamic
+    (`{dynamic}.example.com`) items are stored in a trie keyed by the host labels in
+    reverse order, so a lookup walks at most one node per label of the host.
+    Suffixes that do not start on a label boundary (i.e. `*example.com`) keep the
+    original `endswith` behaviour.
+    """
+
+    def __init__(self, scope_items: Iterable[dict]) -> None:
+        self.exact_hosts: set[str] = set()
+        self.root = _ScopeNode()
+        self.match_all = False
+        self.suffixes: list[str] = []
+        self.dynamic_suffixes: list[tuple[str, str]] = []
+        for item in scope_items or []:
+            fqdn = item.get('fqdn')
+            if fqdn is not None:
+                self._add(fqdn)
+
+    def _add(self, fqdn: str) -> None:
+        fqdn = fqdn.strip().lower()
+        self.exact_hosts.add(fqdn)
+
+        if '*' in fqdn:
+            suffix = fqdn.replace('*', '')
+            if suffix == '':
+                self.match_all = True
+            elif suffix.startswith('.') and len(suffix) > 1:
+                self._node_for(suffix[1:]).wildcard = True
+            else:
+                self.suffixes.append(suffix)
+
+        if DYNAMIC_PLACEHOLDER in fqdn:
+            suffix = fqdn.split(DYNAMIC_PLACEHOLDER, 1)[1]
+            if suffix.startswith('.') and len(suffix) > 1:
+                self._node_for(suffix[1:]).dynamic_host = fqdn
+            elif suffix != '':
+                self.dynamic_suffixes.append((suffix, fqdn))
+
+    def _node_for(self, domain: str) -> _ScopeNode:
+        node = self.root
+        for label in reversed(domain.split('.')):
+            node = node.children.setdefault(label, _ScopeNode())
+        return node
+
+    def match(self, host: str) -> ScopeMatch:
+        """Match a host against the in scope items.
+
+        Args:
+            host (str): The host of the request.
+
+        Returns:
+            ScopeMatch
+        """
+        if host is None:
+            return NOT_IN_SCOPE
+        host = host.lower()
+        in_scope = self.match_all or host in self.exact_hosts
+        dynamic_host = None
+
+        labels = host.split('.')
+        node = self.root
+        for remaining in range(len(labels) - 1, 0, -1):
+            node = node.children.get(labels[remaining])
+            if node is None:
+                break
+            if node.wildcard:
+                in_scope = True
+            if node.dynamic_host is not None:
+                dynamic_host = node.dynamic_host
+
+        if not in_scope:
+            for suffix in self.suffixes:
+                if host.endswith(suffix):
+                    in_scope = True
+                    break
+
+        if dynamic_host is None:
+            for suffix, fqdn in self.dynamic_suffixes:
+                if host.endswith(suffix):
+                    dynamic_host = fqdn
+                    break
+
+        if dynamic_host is not None:
+            return ScopeMatch(True, dynamic_host)
+        if in_scope:
+            return ScopeMatch(True, None)
+        return NOT_IN_SCOPE
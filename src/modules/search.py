@@ -0,0 +1,506 @@
+"""search.py"""
+import os
+from typing import Iterable, List
+from sqlalchemy import Connection, bindparam, inspect, select, text, update
+from sqlalchemy.orm import Session
+from dotenv import load_dotenv
+from modules.bodystore import BodyStore
+from modules.searchquery import HIGHLIGHT_START, HIGHLIGHT_STOP, PREFIX, SUBSTRING, SearchTerm, fts5_query
+from models import BodyModel, ProxyModel
+
+load_dotenv()
+
+# pylint: disable=W0718
+
+SEARCH_TABLE = 'proxysearch'
+SEARCH_BODY_TABLE = 'proxysearchbody'
+SEARCH_RESULT_LIMIT = int(os.environ.get('PROXY_SEARCH_RESULT_LIMIT', '1000'))
+SEARCH_DOCUMENT_MAX = int(os.environ.get('PROXY_SEARCH_DOCUMENT_MAX', str(256 * 1024)))
+
+POSTGRES_SCHEMA = [
+    f"""CREATE TABLE IF NOT EXISTS {SEARCH_TABLE} (
+        proxy_id INTEGER PRIMARY KEY,
+        target_id INTEGER,
+        request TEXT,
+        response TEXT,
+        request_document TSVECTOR GENERATED ALWAYS AS
+            (to_tsvector('simple', regexp_replace(coalesce(request, ''), '[^[:alnum:]]+', ' ', 'g'))) STORED,
+        response_document TSVECTOR GENERATED ALWAYS AS
+            (to_tsvector('simple', regexp_replace(coalesce(response, ''), '[^[:alnum:]]+', ' ', 'g'))) STORED
+    )""",
+    f"CREATE INDEX IF NOT EXISTS ix_{SEARCH_TABLE}_request_document ON {SEARCH_TABLE} USING GIN (request_document)",
+    f"CREATE INDEX IF NOT EXISTS ix_{SEARCH_TABLE}_response_document ON {SEARCH_TABLE} USING GIN (response_document)",
+    f"CREATE INDEX IF NOT EXISTS ix_{SEARCH_TABLE}_target_id ON {SEARCH_TABLE} (target_id)",
+    f"""CREATE TABLE IF NOT EXISTS {SEARCH_BODY_TABLE} (
+        body_hash VARCHAR PRIMARY KEY,
+        body TEXT,
+        body_document TSVECTOR GENERATED ALWAYS AS
+            (to_tsvector('simple', regexp_replace(coalesce(body, ''), '[^[:alnum:]]+', ' ', 'g'))) STORED
+    )""",
+    f"CREATE INDEX IF NOT EXISTS ix_{SEARCH_BODY_TABLE}_body_document ON {SEARCH_BODY_TABLE} USING GIN (body_document)"
+]
+POSTGRES_TRIGRAM_SCHEMA = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    f"CREATE INDEX IF NOT EXISTS ix_{SEARCH_TABLE}_request_trgm ON {SEARCH_TABLE} USING GIN (request gin_trgm_ops)",
+    f"CREATE INDEX IF NOT EXISTS ix_{SEARCH_TABLE}_response_trgm ON {SEARCH_TABLE} USING GIN (response gin_trgm_ops)",
+    f"CREATE INDEX IF NOT EXISTS ix_{SEARCH_BODY_TABLE}_body_trgm ON {SEARCH_BODY_TABLE} USING GIN (body gin_trgm_ops)"
+]
+SQLITE_SCHEMA = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5(request, response, target_id UNINDEXED)",
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_BODY_TABLE} USING fts5(body, body_hash UNINDEXED)"
+]
+SQLITE_COLUMNS = {SEARCH_TABLE: ['request', 'response'], SEARCH_BODY_TABLE: ['body']}
+
+
+def _postgres_tsquery(term: SearchTerm, index: int) -> tuple[str, dict]:
+    """Get the SQL and parameters of the `tsquery` of a full-text term."""
+    name = f'term_{index}'
+    if term.kind == PREFIX:
+        return f"to_tsquery('simple', :{name})", {name: ' <-> '.join(f"'{word}'" for word in term.text.split(' ')) + ':*'}
+    return f"phraseto_tsquery('simple', :{name})", {name: term.text}
+
+
+def _like_pattern(value: str) -> str:
+    return '%' + value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+
+class SearchIndex:
+    """Full-text index of the captured requests and responses.
+
+    Each proxy row has a request document (URL and raw request) and a response
+    document (headers) in the `proxysearch` table, written by the proxy writer
+    as flows are stored. Response bodies are indexed once per distinct body in
+    the `proxysearchbody` table, keyed by the body store hash like the bodies
+    themselves, and `search_ind` marks the bodies of the `body` table indexed.
+    On PostgreSQL the documents are `tsvector` columns with GIN indexes, and
+    `pg_trgm` indexes serve substring terms; on SQLite both tables are FTS5
+    indexes. All terms of a query have to match the same document, and plain
+    terms match whole words; `*substring` terms match inside words. Only the
+    first `SEARCH_DOCUMENT_MAX` characters of each document are indexed, so a
+    match further into a large body is not found. Bodies spilled to segments
+    are indexed by `backfill_bodies`, which the proxy writer runs when idle.
+    """
+
+    def __init__(self, body_store: BodyStore = None) -> None:
+        self.body_store = body_store if body_store is not None else BodyStore()
+        self.present = None
+
+    @staticmethod
+    def ensure(connection: Connection) -> List[str]:
+        """Create the search tables and their indexes.
+
+        Args:
+            connection (Connection): A connection inside a transaction.
+
+        Returns:
+            Warnings, e.g. when `pg_trgm` is not available.
+        """
+        warnings: List[str] = []
+        if connection.dialect.name == 'postgresql':
+            for statement in POSTGRES_SCHEMA:
+                connection.execute(text(statement))
+            try:
+                with connection.begin_nested():
+                    for statement in POSTGRES_TRIGRAM_SCHEMA:
+                        connection.execute(text(statement))
+            except Exception as exc:
+                warnings.append(f"pg_trgm is not available, substring search will scan: {exc}")
+        elif connection.dialect.name == 'sqlite':
+            for statement in SQLITE_SCHEMA:
+                connection.execute(text(statement))
+        else:
+            warnings.append(f"Search is not supported on {connection.dialect.name}.")
+        return warnings
+
+    def available(self, db: Session) -> bool:
+        """Check whether the search tables exist, until they do, so a running writer picks up `database migrate`."""
+        if not self.present:
+            inspector = inspect(db.connection())
+            self.present = inspector.has_table(SEARCH_TABLE) and inspector.has_table(SEARCH_BODY_TABLE)
+        return self.present
+
+    @staticmethod
+    def _key(db: Session) -> str:
+        """Get the column of `proxysearch` holding the proxy row id."""
+        return 'proxy_id' if db.bind.dialect.name == 'postgresql' else 'rowid'
+
+    @staticmethod
+    def documents(records: Iterable[dict]) -> dict[str, tuple]:
+        """Get the search documents of proxy records.
+
+        Args:
+            records: `ProxyModel` column values.
+
+        Returns:
+            {flow_id: (request document, response document)}, None for a part the records do not have.
+        """
+        documents: dict[str, tuple] = {}
+        for record in records:
+            flow_id = record.get('flow_id')
+            if flow_id is None:
+                continue
+            request = None
+            if record.get('full_url') is not None or record.get('raw_request') is not None:
+                request = '\n'.join(value for value in (record.get('full_url'), record.get('raw_request')) if value)
+            response = record.get('response_headers')
+            if request is not None or response is not None:
+                documents[flow_id] = (request and request[:SEARCH_DOCUMENT_MAX], response and response[:SEARCH_DOCUMENT_MAX])
+        return documents
+
+    def index(self, db: Session, documents: dict[str, tuple]) -> None:
+        """Add or update the documents of stored flows.
+
+        Args:
+            db (Session): The current session to connect to the database.
+            documents: The documents returned by `documents`.
+
+        Returns:
+            None
+        """
+        if len(documents) == 0 or not self.available(db):
+            return
+        rows = []
+        for flow_id, proxy_id, target_id in db.execute(select(ProxyModel.flow_id, ProxyModel.id, ProxyModel.target_id)
+                                                       .where(ProxyModel.flow_id.in_(list(documents)))):
+            request, response = documents[flow_id]
+            rows.append({'proxy_id': proxy_id, 'target_id': target_id, 'request': request, 'response': response})
+        self._write(db, rows)
+
+    def _write(self, db: Session, rows: List[dict]) -> None:
+        if len(rows) == 0:
+            return
+        if db.bind.dialect.name == 'postgresql':
+            db.execute(text(f"""INSERT INTO {SEARCH_TABLE} (proxy_id, target_id, request, response)
+                VALUES (:proxy_id, :target_id, :request, :response)
+                ON CONFLICT (proxy_id) DO UPDATE SET target_id = EXCLUDED.target_id,
+                request = COALESCE(EXCLUDED.request, {SEARCH_TABLE}.request),
+                response = COALESCE(EXCLUDED.response, {SEARCH_TABLE}.response)"""), rows)
+            return
+        ids = [row['proxy_id'] for row in rows]
+        existing = {proxy_id: (request, response) for proxy_id, request, response in db.execute(
+            text(f"SELECT rowid, request, response FROM {SEARCH_TABLE} WHERE rowid IN :ids")
+            .bindparams(bindparam('ids', expanding=True)), {'ids': ids})}
+        for row in rows:
+            request, response = existing.get(row['proxy_id'], (None, None))
+            row['request'] = row['request'] if row['request'] is not None else request
+            row['response'] = row['response'] if row['response'] is not None else response
+        self.remove(db, ids)
+        db.execute(text(f"INSERT INTO {SEARCH_TABLE} (rowid, request, response, target_id) "
+                        "VALUES (:proxy_id, :request, :response, :target_id)"), rows)
+
+    def index_bodies(self, db: Session, bodies: dict[str, list]) -> None:
+        """Index the bodies not indexed yet, once per body.
+
+        Spilled bodies are left to `backfill_bodies`.
+
+        Args:
+            db (Session): The current session to connect to the database.
+            bodies: The bodies returned by `BodyStore.extract`, after `BodyStore.save`.
+
+        Returns:
+            None
+        """
+        if len(bodies) == 0 or not self.available(db):
+            return
+        indexed = dict(db.execute(select(BodyModel.hash, BodyModel.search_ind)
+                                  .where(BodyModel.hash.in_(list(bodies)))).all())
+        self._write_bodies(db, {body_hash: body for body_hash, (body, _) in bodies.items()
+                                if not indexed.get(body_hash) and isinstance(body, str)})
+
+    @staticmethod
+    def _write_bodies(db: Session, bodies: dict[str, str | None]) -> None:
+        """Write the documents of bodies and mark them as indexed; bodies without text are only marked."""
+        if len(bodies) == 0:
+            return
+        rows = [{'body_hash': body_hash, 'body': body[:SEARCH_DOCUMENT_MAX]}
+                for body_hash, body in bodies.items() if isinstance(body, str) and body != '']
+        if len(rows) > 0:
+            if db.bind.dialect.name == 'postgresql':
+                db.execute(text(f"INSERT INTO {SEARCH_BODY_TABLE} (body_hash, body) VALUES (:body_hash, :body) "
+                                "ON CONFLICT (body_hash) DO NOTHING"), rows)
+            else:
+                db.execute(text(f"INSERT INTO {SEARCH_BODY_TABLE} (body_hash, body) VALUES (:body_hash, :body)"), rows)
+        db.execute(update(BodyModel).where(BodyModel.hash.in_(list(bodies))).values(search_ind=True),
+                   execution_options={'synchronize_session': False})
+
+    def remove(self, db: Session, proxy_ids: List[int]) -> None:
+        """Remove the documents of deleted proxy rows."""
+        if len(proxy_ids) == 0 or not self.available(db):
+            return
+        key = self._key(db)
+        db.execute(text(f"DELETE FROM {SEARCH_TABLE} WHERE {key} IN :ids")
+                   .bindparams(bindparam('ids', expanding=True)), {'ids': list(proxy_ids)})
+
+    def prune(self, db: Session) -> int:
+        """Remove the documents of deleted proxy rows and of the bodies no proxy row references anymore.
+
+        Run it before `BodyStore.prune`, which deletes those bodies and commits.
+
+        Args:
+            db (Session): The current session to connect to the database.
+
+        Returns:
+            The number of documents removed.
+        """
+        if not self.available(db):
+            return 0
+        key = self._key(db)
+        removed = db.execute(text(f"DELETE FROM {SEARCH_TABLE} WHERE NOT EXISTS "
+                                  f"(SELECT 1 FROM proxy WHERE proxy.id = {SEARCH_TABLE}.{key})")).rowcount
+        removed += db.execute(text(f"DELETE FROM {SEARCH_BODY_TABLE} WHERE NOT EXISTS "
+                                   f"(SELECT 1 FROM proxy WHERE proxy.response_body_hash = {SEARCH_BODY_TABLE}.body_hash)")
+                              ).rowcount
+        return removed
+
+    def search(self, db: Session, terms: List[SearchTerm], target_id: int = None, requests: bool = True,
+               responses: bool = True, limit: int = SEARCH_RESULT_LIMIT) -> List[int]:
+        """Find the proxy rows matching a query, best match first.
+
+        A body matching the query matches every proxy row with that body.
+
+        Args:
+            db (Session): The current session to connect to the database.
+            terms: The parsed query.
+            target_id (int): Only search the rows of this target.
+            requests (bool): Search the request documents.
+            responses (bool): Search the response documents and bodies.
+            limit (int): The maximum number of results.
+
+        Returns:
+            The ids of the matching proxy rows.
+        """
+        columns = [column for column, wanted in (('request', requests), ('response', responses)) if wanted]
+        if len(terms) == 0 or len(columns) == 0:
+            return []
+        postgres = db.bind.dialect.name == 'postgresql'
+        conditions = self._postgres_conditions if postgres else self._sqlite_conditions
+        where, rank, parameters = conditions(SEARCH_TABLE, terms, columns)
+        if target_id is not None:
+            where.append('target_id = :target_id')
+            parameters['target_id'] = target_id
+        queries = [f"SELECT {self._key(db)} AS proxy_id, {rank} AS score FROM {SEARCH_TABLE} WHERE {' AND '.join(where)}"]
+        if responses:
+            where, rank, body_parameters = conditions(SEARCH_BODY_TABLE, terms, ['body'])
+            parameters.update(body_parameters)
+            target = ' WHERE proxy.target_id = :target_id' if target_id is not None else ''
+            queries.append(f"SELECT proxy.id AS proxy_id, matches.score FROM (SELECT body_hash, {rank} AS score "
+                           f"FROM {SEARCH_BODY_TABLE} WHERE {' AND '.join(where)}) AS matches "
+                           f"JOIN proxy ON proxy.response_body_hash = matches.body_hash{target}")
+        if len(queries) == 1:
+            # One row per proxy row; SQLite cannot rank a flattened FTS5 subquery in a GROUP BY.
+            order = 'score DESC' if postgres else 'score'
+            statement = f"{queries[0]} ORDER BY {order}, proxy_id DESC LIMIT :limit"
+        else:
+            order = 'max(score) DESC' if postgres else 'min(score)'
+            statement = (f"SELECT proxy_id FROM ({' UNION ALL '.join(queries)}) AS results "
+                         f"GROUP BY proxy_id ORDER BY {order}, proxy_id DESC LIMIT :limit")
+        parameters['limit'] = limit
+        return [row[0] for row in db.execute(text(statement), parameters)]
+
+    @staticmethod
+    def _postgres_conditions(table: str, terms: List[SearchTerm], columns: List[str]) -> tuple[List[str], str, dict]:
+        """Get the conditions of a query on the documents of a search table, and the rank of a match (higher first).
+
+        Every term has to match the same column.
+        """
+        parameters = {f'term_{index}': _like_pattern(term.text) for index, term in enumerate(terms) if term.kind == SUBSTRING}
+        substrings = list(parameters)
+        tsqueries = []
+        for index, term in enumerate(terms):
+            if term.kind != SUBSTRING:
+                tsquery, term_parameters = _postgres_tsquery(term, index)
+                tsqueries.append(tsquery)
+                parameters.update(term_parameters)
+        query = ' && '.join(tsqueries)
+        documents = []
+        for column in columns:
+            conditions = [f"{table}.{column}_document @@ ({query})"] if len(tsqueries) > 0 else []
+            conditions += [f"{table}.{column} ILIKE :{name}" for name in substrings]
+            documents.append('(' + ' AND '.join(conditions) + ')')
+        rank = '0'
+        if len(tsqueries) > 0:
+            rank = ' + '.join(f"ts_rank({table}.{column}_document, {query})" for column in columns)
+        return ['(' + ' OR '.join(documents) + ')'], rank, parameters
+
+    @staticmethod
+    def _sqlite_conditions(table: str, terms: List[SearchTerm], columns: List[str]) -> tuple[List[str], str, dict]:
+        """Get the conditions of a query on an FTS5 search table, and the rank of a match (lower first).
+
+        Every term has to match the same column.
+        """
+        parameters = {f'term_{index}': term.text.lower() for index, term in enumerate(terms) if term.kind == SUBSTRING}
+        substrings = list(parameters)
+        match = fts5_query(terms, columns)
+        rank = '0' if match is None else f'bm25({table})'
+        if len(substrings) == 0:
+            parameters[f'{table}_match'] = match
+            return [f"{table} MATCH :{table}_match"], rank, parameters
+        documents = []
+        for column in columns:
+            conditions = [f"instr(lower({column}), :{name}) > 0" for name in substrings]
+            if match is not None:
+                conditions.insert(0, f"{table} MATCH :{table}_{column}_match")
+                parameters[f'{table}_{column}_match'] = fts5_query(terms, [column])
+            documents.append('(' + ' AND '.join(conditions) + ')')
+        return ['(' + ' OR '.join(documents) + ')'], rank, parameters
+
+    def snippets(self, db: Session, terms: List[SearchTerm], proxy_ids: List[int], requests: bool = True,
+                 responses: bool = True) -> dict[int, str]:
+        """Get a short extract of where each row matched, with the matches between `HIGHLIGHT_START` and `HIGHLIGHT_STOP`.
+
+        Args:
+            db (Session): The current session to connect to the database.
+            terms: The parsed query.
+            proxy_ids: The rows, i.e. one page of results.
+            requests (bool): The request documents were searched.
+            responses (bool): The response documents and bodies were searched.
+
+        Returns:
+            {proxy id: snippet}
+        """
+        columns = [column for column, wanted in (('request', requests), ('response', responses)) if wanted]
+        if len(proxy_ids) == 0 or len(columns) == 0:
+            return {}
+        body_hashes: dict[int, str] = {}
+        if responses:
+            body_hashes = dict(db.execute(select(ProxyModel.id, ProxyModel.response_body_hash)
+                                          .where(ProxyModel.id.in_(list(proxy_ids)),
+                                                 ProxyModel.response_body_hash.isnot(None))).all())
+        key = self._key(db)
+        snippets: dict[int, str] = {}
+        full_text = [term for term in terms if term.kind != SUBSTRING]
+        if len(full_text) > 0:
+            snippets.update(self._headlines(db, SEARCH_TABLE, key, full_text, proxy_ids, columns))
+            self._body_snippets(snippets, body_hashes, proxy_ids, lambda hashes: self._headlines(
+                db, SEARCH_BODY_TABLE, 'body_hash', full_text, hashes, ['body']))
+        substrings = [term.text for term in terms if term.kind == SUBSTRING]
+        missing = [proxy_id for proxy_id in proxy_ids if snippets.get(proxy_id) is None]
+        if len(substrings) > 0 and len(missing) > 0:
+            snippets.update(self._substring_snippets(db, SEARCH_TABLE, key, substrings[0], missing, columns))
+            self._body_snippets(snippets, body_hashes, missing, lambda hashes: self._substring_snippets(
+                db, SEARCH_BODY_TABLE, 'body_hash', substrings[0], hashes, ['body']))
+        return snippets
+
+    @staticmethod
+    def _body_snippets(snippets: dict[int, str], body_hashes: dict[int, str], proxy_ids: List[int], extract) -> None:
+        """Fill in the snippets still missing with the ones of the bodies of the rows."""
+        missing = {proxy_id: body_hashes[proxy_id] for proxy_id in proxy_ids
+                   if snippets.get(proxy_id) is None and proxy_id in body_hashes}
+        if len(missing) == 0:
+            return
+        body_snippets = extract(list(set(missing.values())))
+        for proxy_id, body_hash in missing.items():
+            if body_snippets.get(body_hash) is not None:
+                snippets[proxy_id] = body_snippets[body_hash]
+
+    @staticmethod
+    def _headlines(db: Session, table: str, key: str, terms: List[SearchTerm], keys: list, columns: List[str]) -> dict:
+        """Get the highlighted extracts of the full-text terms in the documents of a search table, by key."""
+        if db.bind.dialect.name == 'postgresql':
+            parameters: dict = {'keys': list(keys)}
+            tsqueries = []
+            for index, term in enumerate(terms):
+                tsquery, term_parameters = _postgres_tsquery(term, index)
+                tsqueries.append(tsquery)
+                parameters.update(term_parameters)
+            options = f"MaxFragments=1, MaxWords=16, MinWords=6, StartSel={HIGHLIGHT_START}, StopSel={HIGHLIGHT_STOP}"
+            headlines = [f"CASE WHEN {column}_document @@ ({' && '.join(tsqueries)}) "
+                         f"THEN ts_headline('simple', left({column}, 65536), {' && '.join(tsqueries)}, '{options}') END"
+                         for column in columns]
+            statement = text(f"SELECT {key}, coalesce({', '.join(headlines)}) FROM {table} WHERE {key} IN :keys")
+        else:
+            parameters = {'match': fts5_query(terms, columns), 'keys': list(keys)}
+            highlights = [f"CASE WHEN instr(snippet({table}, {index}, '{HIGHLIGHT_START}', '{HIGHLIGHT_STOP}', '…', 16), "
+                          f"'{HIGHLIGHT_START}') > 0 THEN snippet({table}, {index}, '{HIGHLIGHT_START}', "
+                          f"'{HIGHLIGHT_STOP}', '…', 16) END"
+                          for index, column in enumerate(SQLITE_COLUMNS[table]) if column in columns]
+            statement = text(f"SELECT {key}, coalesce({', '.join(highlights)}, NULL) FROM {table} "
+                             f"WHERE {table} MATCH :match AND {key} IN :keys")
+        return dict(db.execute(statement.bindparams(bindparam('keys', expanding=True)), parameters).all())
+
+    @staticmethod
+    def _substring_snippets(db: Session, table: str, key: str, substring: str, keys: list, columns: List[str]) -> dict:
+        postgres = db.bind.dialect.name == 'postgresql'
+        find = 'strpos' if postgres else 'instr'
+        start = 'greatest' if postgres else 'max'
+        extracts = ', '.join(f"CASE WHEN {find}(lower({column}), :substring) > 0 THEN "
+                             f"substr({column}, {start}({find}(lower({column}), :substring) - 40, 1), 120) END"
+                             for column in columns)
+        statement = text(f"SELECT {key}, coalesce({extracts}) FROM {table} WHERE {key} IN :keys")
+        snippets = {}
+        for row_key, extract in db.execute(statement.bindparams(bindparam('keys', expanding=True)),
+                                           {'substring': substring.lower(), 'keys': list(keys)}):
+            if extract is not None:
+                position = extract.lower().find(substring.lower())
+                extract = (extract[:position] + HIGHLIGHT_START + extract[position:position + len(substring)]
+                           + HIGHLIGHT_STOP + extract[position + len(substring):])
+            snippets[row_key] = extract
+        return snippets
+
+    def backfill(self, db: Session, batch_size: int = 500) -> int:
+        """Index the proxy rows and bodies stored before the search index existed.
+
+        Args:
+            db (Session): The current session to connect to the database.
+            batch_size (int): The number of rows read at a time.
+
+        Returns:
+            The number of proxy rows and bodies indexed.
+        """
+        if not self.available(db):
+            return 0
+        key = self._key(db)
+        indexed = 0
+        last_id = 0
+        while True:
+            records = db.execute(select(ProxyModel.id, ProxyModel.target_id, ProxyModel.full_url, ProxyModel.raw_request,
+                                        ProxyModel.response_headers)
+                                 .where(ProxyModel.id > last_id).order_by(ProxyModel.id).limit(batch_size)).all()
+            if len(records) == 0:
+                break
+            last_id = records[-1].id
+            present = {row[0] for row in db.execute(text(f"SELECT {key} FROM {SEARCH_TABLE} WHERE {key} IN :ids")
+                                                    .bindparams(bindparam('ids', expanding=True)),
+                                                    {'ids': [record.id for record in records]})}
+            documents = self.documents([{'flow_id': record.id, 'full_url': record.full_url, 'raw_request': record.raw_request,
+                                         'response_headers': record.response_headers}
+                                        for record in records if record.id not in present])
+            records = {record.id: record for record in records}
+            self._write(db, [{'proxy_id': proxy_id, 'target_id': records[proxy_id].target_id,
+                              'request': request, 'response': response}
+                             for proxy_id, (request, response) in documents.items()])
+            db.commit()
+            indexed += len(documents)
+
+        return indexed + self.backfill_bodies(db, batch_size=batch_size)
+
+    def backfill_bodies(self, db: Session, limit: int = None, batch_size: int = 500) -> int:
+        """Index the bodies not indexed yet, e.g. spilled ones or the ones stored before the search index existed.
+
+        Args:
+            db (Session): The current session to connect to the database.
+            limit (int): Stop after about this many bodies, e.g. to backfill a chunk at a time.
+            batch_size (int): The number of bodies read at a time.
+
+        Returns:
+            The number of bodies indexed.
+        """
+        if not self.available(db):
+            return 0
+        indexed = 0
+        while limit is None or indexed < limit:
+            bodies = db.execute(select(BodyModel.hash, BodyModel.content, BodyModel.data, BodyModel.encoding,
+                                       BodyModel.segment, BodyModel.segment_offset, BodyModel.segment_length)
+                                .where(BodyModel.search_ind.is_(None)).limit(batch_size)).all()
+            if len(bodies) == 0:
+                break
+            documents = {}
+            for body in bodies:
+                try:
+                    documents[body.hash] = self.body_store.decode(body)
+                except Exception:
+                    documents[body.hash] = None
+            self._write_bodies(db, documents)
+            db.commit()
+            indexed += len(bodies)
+        return indexed
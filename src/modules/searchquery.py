@@ -0,0 +1,85 @@
+"""searchquery.py"""
+import re
+import shlex
+from typing import Iterable, List, NamedTuple
+
+HIGHLIGHT_START = '\x02'
+HIGHLIGHT_STOP = '\x03'
+
+TERM = 'term'
+PREFIX = 'prefix'
+PHRASE = 'phrase'
+SUBSTRING = 'substring'
+
+
+class SearchTerm(NamedTuple):
+    """A term of a search query."""
+    kind: str
+    text: str
+
+
+def parse_query(query: str | Iterable[str]) -> List[SearchTerm]:
+    """Parse a search query.
+
+    Every term has to match. `"two words"` is a phrase, `adm*` matches words
+    starting with `adm` and `*dmin*` (or `*dmin`) matches `dmin` anywhere, also
+    inside words. Words are split on anything that is not a letter or a digit,
+    so `x-api-key` is the phrase `x api key`.
+
+    Args:
+        query: The query string, or its terms as typed on the command line.
+
+    Returns:
+        The terms, without empty ones.
+    """
+    if isinstance(query, str):
+        try:
+            parts = shlex.split(query)
+        except ValueError:
+            parts = query.split()
+    else:
+        parts = list(query)
+    terms: List[SearchTerm] = []
+    for part in parts:
+        if part.startswith('*'):
+            substring = part.strip('*')
+            if substring != '':
+                terms.append(SearchTerm(SUBSTRING, substring))
+            continue
+        prefix = part.endswith('*')
+        words = tokenize(part)
+        if len(words) == 0:
+            continue
+        if prefix:
+            terms.append(SearchTerm(PREFIX, ' '.join(words)))
+        elif len(words) > 1:
+            terms.append(SearchTerm(PHRASE, ' '.join(words)))
+        else:
+            terms.append(SearchTerm(TERM, words[0]))
+    return terms
+
+
+def tokenize(value: str) -> List[str]:
+    """Split a value into lowercase words the way the search index does."""
+    return [word for word in re.split(r'[\W_]+', value.lower()) if word != '']
+
+
+def fts5_query(terms: List[SearchTerm], columns: Iterable[str]) -> str | None:
+    """Build the FTS5 `MATCH` expression of the full-text terms.
+
+    Args:
+        terms: The parsed terms.
+        columns: The columns that may match, each one on its own.
+
+    Returns:
+        The expression, or None when there are no full-text terms.
+    """
+    parts = []
+    for term in terms:
+        if term.kind == SUBSTRING:
+            continue
+        parts.append(f'"{term.text}" *' if term.kind == PREFIX else f'"{term.text}"')
+    if len(parts) == 0:
+        return None
+    query = ' AND '.join(parts)
+    return ' OR '.join(f'{column} : ({query})' for column in columns)
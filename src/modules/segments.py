@@ -0,0 +1,135 @@
+"""segments.py"""
+import mmap
+import os
+import threading
+import time
+from typing import NamedTuple
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# pylint: disable=R0902
+
+BASE_PATH = os.path.dirname(os.path.abspath(__file__))
+DATA_PATH = os.environ.get('W3BT00LKIT_DATA_PATH', os.path.join(os.path.dirname(BASE_PATH), 'data'))
+SEGMENT_MAX_SIZE = int(os.environ.get('SEGMENT_MAX_SIZE', str(256 * 1024 * 1024)))
+SEGMENT_SUFFIX = '.seg'
+
+
+def session_prefix(name: str) -> str:
+    """Get a segment prefix unique to this process and start time.
+
+    Args:
+        name (str): The kind of segment.
+
+    Returns:
+        The prefix.
+    """
+    return f"{name}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+
+
+class SegmentRef(NamedTuple):
+    """Location of a byte range inside a segment file."""
+    segment: str
+    offset: int
+    length: int
+
+
+class SegmentWriter:
+    """Append-only segment files in a data directory.
+
+    Space is handed out by `reserve`, which is safe to call from several threads,
+    and filled with `write_at`, so a body that arrives in chunks stays contiguous
+    even when other bodies are written at the same time. A new segment is started
+    once the current one reaches `max_size`; segments are never rewritten. The
+    prefix should be unique per writer, e.g. `session_prefix('body')`.
+    """
+
+    def __init__(self, directory: str, prefix: str, max_size: int = SEGMENT_MAX_SIZE) -> None:
+        self.directory = directory
+        self.prefix = prefix
+        self.max_size = max(1, max_size)
+        self.lock = threading.Lock()
+        self.file_descriptors: dict[str, int] = {}
+        self.segment = None
+        self.segment_size = 0
+        self.segment_count = 0
+
+    def _rotate(self) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        self.segment_count += 1
+        self.segment = f"{self.prefix}-{self.segment_count:04d}{SEGMENT_SUFFIX}"
+        self.segment_size = 0
+        self.file_descriptors[self.segment] = os.open(os.path.join(self.directory, self.segment),
+                                                      os.O_RDWR | os.O_CREAT, 0o600)
+
+    def reserve(self, length: int) -> SegmentRef:
+        """Reserve space for `length` bytes at the end of the current segment.
+
+        Args:
+            length (int): The number of bytes to reserve.
+
+        Returns:
+            SegmentRef
+        """
+        with self.lock:
+            if self.segment is None or (self.segment_size > 0 and self.segment_size + length > self.max_size):
+                self._rotate()
+            ref = SegmentRef(self.segment, self.segment_size, length)
+            self.segment_size += length
+            return ref
+
+    def write_at(self, ref: SegmentRef, position: int, data: bytes) -> None:
+        """Write bytes inside a reserved range.
+
+        Args:
+            ref (SegmentRef): The reserved range.
+            position (int): The position relative to the start of the range.
+            data (bytes): The bytes to write.
+
+        Returns:
+            None
+        """
+        if position + len(data) > ref.length:
+            raise ValueError(f"{len(data)} byte(s) at {position} do not fit in a range of {ref.length} byte(s)")
+        os.pwrite(self.file_descriptors[ref.segment], data, ref.offset + position)
+
+    def append(self, data: bytes) -> SegmentRef:
+        """Write bytes at the end of the current segment.
+
+        Args:
+            data (bytes): The bytes to write.
+
+        Returns:
+            SegmentRef
+        """
+        ref = self.reserve(len(data))
+        self.write_at(ref, 0, data)
+        return ref
+
+    def close(self) -> None:
+        """Close the open segment files."""
+        with self.lock:
+            for file_descriptor in self.file_descriptors.values():
+                os.close(file_descriptor)
+            self.file_descriptors = {}
+            self.segment = None
+
+
+def read_segment(directory: str, segment: str, offset: int, length: int) -> bytes:
+    """Read a byte range of a segment file through a memory map.
+
+    Args:
+        directory (str): The data directory of the segments.
+        segment (str): The segment file name.
+        offset (int): The start of the range.
+        length (int): The number of bytes to read.
+
+    Returns:
+        The bytes of the range.
+    """
+    if length <= 0:
+        return b''
+    with open(os.path.join(directory, os.path.basename(segment)), 'rb') as segment_file:
+        with mmap.mmap(segment_file.fileno(), 0, access=mmap.ACCESS_READ) as segment_map:
+            return segment_map[offset:offset + length]
@@ -0,0 +1,144 @@
+"""summarytable.py"""
+from typing import Iterable, List, Mapping
+from sqlalchemy import Row, case, delete, desc, func, inspect, select, text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+from modules.trafficsummary import SummaryKey, summary_deltas, summary_key
+from models import BodyModel, ProxyModel, TrafficSummaryModel
+
+# pylint: disable=E1102
+
+SUMMARY_KEY_COLUMNS = list(SummaryKey._fields)
+SUMMARY_FLOW_COLUMNS = (ProxyModel.target_id, ProxyModel.host, ProxyModel.method, ProxyModel.response_status_code,
+                        ProxyModel.response_headers, ProxyModel.path, ProxyModel.response_body_hash,
+                        ProxyModel.timestamp_start)
+SUMMARY_REBUILD_CHUNK_SIZE = 1000
+SUMMARY_ROW_LIMIT = 500
+
+
+class SummaryTable:
+    """Traffic counts per (target, host, method, status code, content class).
+
+    The proxy writer keeps the `trafficsummary` table current as it writes each
+    batch: every flow inserted, updated or dropped adds or subtracts its count
+    and response bytes with one upsert per summary row, so `proxy summary`
+    reads a few hundred rows instead of scanning the proxy table. `last_seen`
+    only grows; `rebuild` recounts everything from the proxy table, e.g. after
+    a backfill or an import.
+    """
+
+    def __init__(self) -> None:
+        self.present = None
+
+    def available(self, db: Session) -> bool:
+        """Check whether the summary table exists, once."""
+        if self.present is None:
+            self.present = inspect(db.connection()).has_table(TrafficSummaryModel.__tablename__)
+        return self.present
+
+    def record(self, db: Session, removed: Iterable[Mapping], added: Iterable[Mapping]) -> None:
+        """Count the flows written in a batch.
+
+        Args:
+            db (Session): The current session to connect to the database.
+            removed: The stored state of the flows updated or deleted, as `ProxyModel` column values.
+            added: The new state of the flows inserted or updated, with their `response_body_hash`.
+
+        Returns:
+            None
+        """
+        if not self.available(db):
+            return
+        removed, added = list(removed), list(added)
+        hashes = {flow.get('response_body_hash') for flow in removed + added} - {None}
+        sizes = {}
+        if len(hashes) > 0:
+            sizes = dict(db.execute(select(BodyModel.hash, BodyModel.size).where(BodyModel.hash.in_(hashes))).all())
+        self.apply(db, summary_deltas(removed, added, {body_hash: size or 0 for body_hash, size in sizes.items()}))
+
+    @staticmethod
+    def apply(db: Session, deltas: dict[SummaryKey, List]) -> None:
+        """Add count and byte changes to the summary rows, creating the rows missing.
+
+        Args:
+            db (Session): The current session to connect to the database.
+            deltas: The changes from `summary_deltas`.
+
+        Returns:
+            None
+        """
+        if len(deltas) == 0:
+            return
+        dialect = postgresql if db.bind.dialect.name == 'postgresql' else sqlite
+        statement = dialect.insert(TrafficSummaryModel)
+        excluded = statement.excluded
+        statement = statement.on_conflict_do_update(index_elements=SUMMARY_KEY_COLUMNS, set_={
+            'request_count': TrafficSummaryModel.request_count + excluded.request_count,
+            'response_bytes': TrafficSummaryModel.response_bytes + excluded.response_bytes,
+            'last_seen': case((excluded.last_seen.is_(None), TrafficSummaryModel.last_seen),
+                              (TrafficSummaryModel.last_seen.is_(None), excluded.last_seen),
+                              (excluded.last_seen > TrafficSummaryModel.last_seen, excluded.last_seen),
+                              else_=TrafficSummaryModel.last_seen),
+            'modified_timestamp': func.now()
+        })
+        db.execute(statement, [{**key._asdict(), 'request_count': count, 'response_bytes': size, 'last_seen': last_seen}
+                               for key, (count, size, last_seen) in sorted(deltas.items())])
+        if any(count < 0 for count, _, _ in deltas.values()):
+            db.execute(delete(TrafficSummaryModel).where(TrafficSummaryModel.request_count <= 0))
+
+    def rebuild(self, db: Session, target_id: int = None, chunk_size: int = SUMMARY_REBUILD_CHUNK_SIZE) -> int:
+        """Recount the summary rows from the proxy table, in the caller's transaction.
+
+        The summary table is locked first, so batches the proxy writer commits
+        meanwhile wait and are counted once, after the rebuilt rows.
+
+        Args:
+            db (Session): The current session to connect to the database.
+            target_id (int): Only rebuild the rows of this target.
+            chunk_size (int): Number of proxy rows read at a time.
+
+        Returns:
+            The number of proxy rows counted.
+        """
+        if db.bind.dialect.name == 'postgresql':
+            db.execute(text(f"LOCK TABLE {TrafficSummaryModel.__tablename__} IN EXCLUSIVE MODE"))
+        cleared = delete(TrafficSummaryModel)
+        query = select(*SUMMARY_FLOW_COLUMNS, func.coalesce(BodyModel.size, func.length(ProxyModel.response_text)).label('size'))\
+            .outerjoin(BodyModel, BodyModel.hash == ProxyModel.response_body_hash)
+        if target_id is not None:
+            cleared = cleared.where(TrafficSummaryModel.target_id == target_id)
+            query = query.where(ProxyModel.target_id == target_id)
+        db.execute(cleared)
+
+        deltas: dict[SummaryKey, List] = {}
+        counted = 0
+        for row in db.execute(query, execution_options={'yield_per': chunk_size}):
+            delta = deltas.setdefault(summary_key(row._mapping), [0, 0, None])
+            delta[0] += 1
+            delta[1] += row.size or 0
+            if row.timestamp_start is not None and (delta[2] is None or row.timestamp_start > delta[2]):
+                delta[2] = row.timestamp_start
+            counted += 1
+        self.apply(db, deltas)
+        return counted
+
+    @staticmethod
+    def summary(db: Session, target_id: int = None, columns: List[str] = None, limit: int = SUMMARY_ROW_LIMIT) -> List[Row]:
+        """Read the summary, grouped by some of its key columns.
+
+        Args:
+            db (Session): The current session to connect to the database.
+            target_id (int): Only read the rows of this target.
+            columns (List[str]): The key columns to group by, all but `target_id` by default.
+            limit (int): The maximum number of rows.
+
+        Returns:
+            Rows of the key columns with `request_count`, `response_bytes` and `last_seen`, busiest first.
+        """
+        groups = [getattr(TrafficSummaryModel, name) for name in (columns or SUMMARY_KEY_COLUMNS[1:])]
+        request_count = func.sum(TrafficSummaryModel.request_count).label('request_count')
+        query = select(*groups, request_count, func.sum(TrafficSummaryModel.response_bytes).label('response_bytes'),
+                       func.max(TrafficSummaryModel.last_seen).label('last_seen'))
+        if target_id is not None:
+            query = query.where(TrafficSummaryModel.target_id == target_id)
+        return db.execute(query.group_by(*groups).order_by(desc(request_count), *groups).limit(limit)).all()
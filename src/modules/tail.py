@@ -0,0 +1,66 @@
+"""tail.py"""
+import os
+import re
+from typing import List, NamedTuple
+from dotenv import load_dotenv
+from modules.broadcast import Broadcast
+from modules.trafficsummary import CONTENT_CLASSES, CONTENT_OTHER
+
+load_dotenv()
+
+TAIL_BUFFER = int(os.environ.get('PROXY_TAIL_BUFFER', '1000'))
+TAIL_METHODS = {'GET', 'POST', 'PUT', 'PATCH', 'DELETE', 'HEAD', 'OPTIONS', 'TRACE', 'CONNECT'}
+TAIL_CONTENT_CLASSES = {name for name, _ in CONTENT_CLASSES} | {CONTENT_OTHER}
+TAIL_STATUS = re.compile(r'^[1-5](?:\d\d|xx)$', re.I)
+
+
+class FlowSummary(NamedTuple):
+    """A captured flow as shown by `proxy tail`."""
+    flow_id: str
+    target_id: int | None
+    timestamp_start: float | None
+    method: str
+    host: str
+    full_url: str
+    response_status_code: int | None
+    content_class: str
+    size: int | None
+    duration: float | None
+
+
+FLOW_BROADCAST = Broadcast(TAIL_BUFFER)
+
+
+class TailFilter:
+    """The `proxy tail` filters.
+
+    Each argument is a status code (`404`) or class (`4xx`), a method, a
+    content class (`json`) or else a case-insensitive substring of the URL.
+    A flow has to match one value of every kind given.
+    """
+
+    def __init__(self, args: List[str]) -> None:
+        self.statuses: List[str] = []
+        self.methods: set[str] = set()
+        self.content_classes: set[str] = set()
+        self.urls: List[str] = []
+        for arg in args:
+            if TAIL_STATUS.match(arg):
+                self.statuses.append(arg.lower().replace('x', ''))
+            elif arg.upper() in TAIL_METHODS:
+                self.methods.add(arg.upper())
+            elif arg.lower() in TAIL_CONTENT_CLASSES:
+                self.content_classes.add(arg.lower())
+            else:
+                self.urls.append(arg.lower())
+
+    def matches(self, flow: FlowSummary) -> bool:
+        """Check whether a flow passes the filters."""
+        if len(self.statuses) > 0 and not any(str(flow.response_status_code).startswith(status)
+                                              for status in self.statuses):
+            return False
+        if len(self.methods) > 0 and flow.method.upper() not in self.methods:
+            return False
+        if len(self.content_classes) > 0 and flow.content_class not in self.content_classes:
+            return False
+        return len(self.urls) == 0 or any(url in flow.full_url.lower() for url in self.urls)
@@ -4,6 +4,7 @@ from sqlalchemy.orm.query import Query
 from rich.console import Console
 from rich.table import Table
 from modules.database import Database
+from modules.scope_matcher import ScopeMatcher
 from models import TargetModel, TargetScopeModel
 
 # pylint: disable=C0121,W0212,W0718
@@ -63,6 +64,7 @@ class TargetScope: # pylint: disable=R0902
                     }
                     self.target_scopes_in.append(targetscope_record)
                 self.app_obj.selected_target_in_scope = self.target_scopes_in
+                self.app_obj.selected_target_scope_matcher = ScopeMatcher(self.target_scopes_in)
 
                 print('\033[32mIn Scope:\033[0m')
                 table = Table()
@@ -0,0 +1,119 @@
+"""trafficsummary.py"""
+import re
+from typing import Iterable, List, Mapping, NamedTuple
+
+NO_TARGET = 0
+NO_RESPONSE = 0
+CONTENT_NONE = 'none'
+CONTENT_OTHER = 'other'
+
+CONTENT_TYPE = re.compile(r'^content-type\s*:\s*([^;\r\n]*)', re.I | re.M)
+CONTENT_CLASSES = [
+    ('html', ('text/html', 'application/xhtml')),
+    ('json', ('json',)),
+    ('script', ('javascript', 'ecmascript')),
+    ('css', ('text/css',)),
+    ('xml', ('xml',)),
+    ('image', ('image/',)),
+    ('font', ('font/', 'woff', 'opentype', 'truetype')),
+    ('media', ('audio/', 'video/')),
+    ('text', ('text/',)),
+    ('binary', ('application/octet-stream', 'application/pdf', 'application/zip', 'application/wasm'))
+]
+EXTENSION_CLASSES = {
+    'html': 'html', 'htm': 'html', 'json': 'json', 'js': 'script', 'mjs': 'script', 'css': 'css', 'xml': 'xml',
+    'png': 'image', 'jpg': 'image', 'jpeg': 'image', 'gif': 'image', 'svg': 'image', 'webp': 'image', 'ico': 'image',
+    'woff': 'font', 'woff2': 'font', 'ttf': 'font', 'otf': 'font', 'eot': 'font',
+    'mp3': 'media', 'mp4': 'media', 'webm': 'media', 'txt': 'text', 'pdf': 'binary', 'zip': 'binary', 'wasm': 'binary'
+}
+
+
+class SummaryKey(NamedTuple):
+    """A row of the traffic summary.
+
+    Flows without a target or a response are counted under `NO_TARGET`,
+    `NO_RESPONSE` and `CONTENT_NONE`, so every part of the key has a value.
+    """
+    target_id: int
+    host: str
+    method: str
+    response_status_code: int
+    content_class: str
+
+
+def content_class(response_headers: str | None, path: str | None = None) -> str:
+    """Classify a response by its `Content-Type` header, or the extension of its path without one.
+
+    Args:
+        response_headers (str): The response headers, one `Name: value` per line.
+        path (str): The request path.
+
+    Returns:
+        html, json, script, css, xml, image, font, media, text, binary or other.
+    """
+    match = CONTENT_TYPE.search(response_headers or '')
+    return mime_class(match.group(1) if match is not None else None, path)
+
+
+def mime_class(mime: str | None, path: str | None = None) -> str:
+    """Classify a response by its `Content-Type` value, or the extension of its path without one.
+
+    Args:
+        mime (str): The `Content-Type` header value.
+        path (str): The request path.
+
+    Returns:
+        The content class, as `content_class`.
+    """
+    mime = (mime or '').split(';', 1)[0].strip().lower()
+    if mime != '':
+        for name, patterns in CONTENT_CLASSES:
+            if any(pattern in mime for pattern in patterns):
+                return name
+        return CONTENT_OTHER
+    name = (path or '').split('?', 1)[0].rsplit('/', 1)[-1]
+    if '.' in name:
+        return EXTENSION_CLASSES.get(name.rsplit('.', 1)[-1].lower(), CONTENT_OTHER)
+    return CONTENT_OTHER
+
+
+def summary_key(flow: Mapping) -> SummaryKey:
+    """Get the summary row a flow is counted in.
+
+    Args:
+        flow: `ProxyModel` column values.
+
+    Returns:
+        The key of the row.
+    """
+    status = flow.get('response_status_code')
+    return SummaryKey(flow.get('target_id') or NO_TARGET, flow.get('host') or '', flow.get('method') or '',
+                      status if status is not None else NO_RESPONSE,
+                      content_class(flow.get('response_headers'), flow.get('path')) if status is not None else CONTENT_NONE)
+
+
+def summary_deltas(removed: Iterable[Mapping], added: Iterable[Mapping], sizes: Mapping[str, int]) -> dict[SummaryKey, List]:
+    """Get the changes to the summary rows when flows are replaced.
+
+    An updated flow is removed in its stored state and added in its new one,
+    which moves it to another row when e.g. its response arrives.
+
+    Args:
+        removed: The stored state of the flows updated or deleted.
+        added: The new state of the flows inserted or updated.
+        sizes: {body hash: size in bytes} of the response bodies.
+
+    Returns:
+        {key: [count change, bytes change, latest `timestamp_start` added or None]},
+        without the rows left unchanged.
+    """
+    deltas: dict[SummaryKey, List] = {}
+    for sign, flows in ((-1, removed), (1, added)):
+        for flow in flows:
+            delta = deltas.setdefault(summary_key(flow), [0, 0, None])
+            delta[0] += sign
+            delta[1] += sign * sizes.get(flow.get('response_body_hash'), 0)
+            timestamp = flow.get('timestamp_start')
+            if sign > 0 and timestamp is not None and (delta[2] is None or timestamp > delta[2]):
+                delta[2] = timestamp
+    return {key: delta for key, delta in deltas.items() if delta[0] != 0 or delta[1] != 0}
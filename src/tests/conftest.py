@@ -0,0 +1,12 @@
+"""conftest.py"""
+import os
+import sys
+import tempfile
+
+# The modules import each other as `modules.*` and `models`, as when run from src.
+SRC_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if SRC_PATH not in sys.path:
+    sys.path.insert(0, SRC_PATH)
+
+# The body segments are kept out of the data directory.
+os.environ.setdefault('W3BT00LKIT_DATA_PATH', tempfile.mkdtemp(prefix='w3bt00lkit-tests-'))
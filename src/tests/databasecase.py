@@ -0,0 +1,46 @@
+"""databasecase.py"""
+import os
+import tempfile
+import unittest
+
+from sqlalchemy import Engine, create_engine
+import modules.database as database # pylint: disable=import-error
+from models import Base # pylint: disable=import-error
+from modules.querycache import QUERY_CACHE # pylint: disable=import-error
+from modules.search import SearchIndex # pylint: disable=import-error
+
+class DatabaseTestCase(unittest.TestCase):
+    """Test case running against a new SQLite database.
+
+    The database replaces the engine of the `sqlite` backend, so the modules
+    opening their own sessions with `Database._get_db()` use it too.
+    """
+    engine: Engine
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory() # pylint: disable=consider-using-with
+        self.engine = create_engine(f"sqlite:///{os.path.join(self.directory.name, 'w3bt00lkit.db')}",
+                                    connect_args={'check_same_thread': False})
+        # The vulnerability table uses JSONB, which SQLite cannot create.
+        Base.metadata.create_all(self.engine, tables=[table for table in Base.metadata.sorted_tables
+                                                      if table.name != 'vulnerability'])
+        with self.engine.begin() as connection:
+            SearchIndex.ensure(connection)
+        self.previous = (database.CONNECTION_OPTION, database._engines.get('sqlite')) # pylint: disable=protected-access
+        database.CONNECTION_OPTION = 'sqlite'
+        database._engines['sqlite'] = self.engine # pylint: disable=protected-access
+        QUERY_CACHE.clear()
+
+    def tearDown(self) -> None:
+        database.CONNECTION_OPTION, engine = self.previous
+        if engine is None:
+            database._engines.pop('sqlite', None) # pylint: disable=protected-access
+        else:
+            database._engines['sqlite'] = engine # pylint: disable=protected-access
+        QUERY_CACHE.clear()
+        self.engine.dispose()
+        self.directory.cleanup()
+
+    def session(self):
+        """Open a session on the test database."""
+        return database.Database._get_db() # pylint: disable=protected-access
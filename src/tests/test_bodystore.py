@@ -0,0 +1,103 @@
+"""test_bodystore.py"""
+import unittest
+
+from sqlalchemy import delete, insert, select
+from databasecase import DatabaseTestCase # pylint: disable=import-error
+from modules.bodystore import BodyStore # pylint: disable=import-error
+from modules.proxywriter import ProxyWriter # pylint: disable=import-error
+from models import BodyModel, ProxyModel # pylint: disable=import-error
+
+class BodyStoreTest(DatabaseTestCase):
+    """Body store test case."""
+
+    def test_dedup(self) -> None:
+        """Test a body seen in several records and batches is stored once with a reference per record."""
+        body_store = BodyStore(compression=None)
+        records = [{'response_text': 'same body'}, {'response_text': 'same body'}, {'response_text': None}, {}]
+        bodies = body_store.extract(records)
+        self.assertEqual(bodies, {BodyStore.hash_body('same body'): ['same body', 2]})
+        self.assertEqual([record.get('response_body_hash', 'unset') for record in records],
+                         [BodyStore.hash_body('same body'), BodyStore.hash_body('same body'), None, 'unset'])
+        with self.session() as db:
+            self.assertEqual(body_store.save(db, bodies), 1)
+            self.assertEqual(body_store.save(db, body_store.extract([{'response_text': 'same body'}])), 0)
+            db.commit()
+            self.assertEqual(db.execute(select(BodyModel.ref_count, BodyModel.content, BodyModel.encoding)).all(),
+                             [(3, 'same body', None)])
+
+    def test_compression(self) -> None:
+        """Test bodies at the threshold are compressed, smaller ones kept as text, and both read back the same."""
+        for compression in ('zlib', 'zstd'):
+            with self.subTest(compression=compression), self.session() as db:
+                body_store = BodyStore(compression=compression, threshold=64)
+                large, small = f'{compression} ' * 64, f'small {compression}'
+                body_store.save(db, body_store.extract([{'response_text': large}, {'response_text': small}]))
+                db.commit()
+                rows = {row.hash: row for row in db.execute(select(BodyModel.hash, BodyModel.encoding, BodyModel.size,
+                                                                   BodyModel.stored_size, BodyModel.content))}
+                compressed = rows[BodyStore.hash_body(large)]
+                self.assertEqual(compressed.encoding, body_store.compression)
+                self.assertIsNone(compressed.content)
+                self.assertLess(compressed.stored_size, compressed.size)
+                self.assertIsNone(rows[BodyStore.hash_body(small)].encoding)
+                self.assertEqual(body_store.get_text(db, BodyStore.hash_body(large)), large)
+                self.assertEqual(body_store.get_text(db, BodyStore.hash_body(small)), small)
+                self.assertIsNone(body_store.get_text(db, BodyStore.hash_body('missing')))
+
+    def test_writer_and_prune(self) -> None:
+        """Test the writer keeps only the body hash on the proxy rows, and prune deletes the bodies no row uses."""
+        writer = ProxyWriter(callback_proxy_message=lambda message: None, journal=False)
+        writer._write_batch([{'flow_id': f'flow-{number}', 'target_id': 1, 'full_url': 'http://app.test/', 'action': 'Response', # pylint: disable=protected-access
+                              'response_text': 'same body'} for number in range(2)])
+        with self.session() as db:
+            rows = db.execute(select(ProxyModel.response_text, ProxyModel.response_body_hash)).all()
+            self.assertEqual(rows, [(None, BodyStore.hash_body('same body'))] * 2)
+            self.assertEqual(db.scalars(select(BodyModel.ref_count)).all(), [2])
+            self.assertEqual(BodyStore().prune(db), 0)
+            db.execute(delete(ProxyModel))
+            db.commit()
+            self.assertEqual(BodyStore().prune(db), 1)
+            self.assertEqual(db.scalars(select(BodyModel.hash)).all(), [])
+
+    def test_backfill(self) -> None:
+        """Test backfill moves inline bodies to the body store and clears them from the proxy rows."""
+        body_store = BodyStore()
+        with self.session() as db:
+            db.execute(insert(ProxyModel), [{'flow_id': f'legacy-{number}', 'response_text': 'same body' if number < 2 else 'other'}
+                                            for number in range(3)])
+            db.commit()
+            self.assertEqual(body_store.backfill(db, chunk_size=2), 3)
+            rows = db.execute(select(ProxyModel.response_text, ProxyModel.response_body_hash).order_by(ProxyModel.id)).all()
+            self.assertEqual([row.response_text for row in rows], [None, None, None])
+            self.assertEqual(rows[0].response_body_hash, BodyStore.hash_body('same body'))
+            self.assertEqual(dict(db.execute(select(BodyModel.hash, BodyModel.ref_count)).all()),
+                             {BodyStore.hash_body('same body'): 2, BodyStore.hash_body('other'): 1})
+            self.assertEqual(body_store.get_text(db, rows[2].response_body_hash), 'other')
+            self.assertEqual(body_store.backfill(db), 0)
+
+    def ref_counts(self) -> dict:
+        """Get the reference count of every body by its text."""
+        body_store = BodyStore()
+        with self.session() as db:
+            return {body_store.get_text(db, row.hash): row.ref_count
+                    for row in db.execute(select(BodyModel.hash, BodyModel.ref_count))}
+
+    def test_ref_counts(self) -> None:
+        """Test replays do not count a body twice, and replaced or dropped bodies are released."""
+        writer = ProxyWriter(journal=False)
+        records = [{'flow_id': 'flow-1', 'target_id': 1, 'action': 'Request', 'method': 'GET', 'full_url': 'http://app.test/'},
+                   {'flow_id': 'flow-1', 'action': 'Response', 'response_text': 'first'},
+                   {'flow_id': 'flow-2', 'target_id': 1, 'full_url': 'http://app.test/', 'action': 'Response', 'response_text': 'first'}]
+        self.assertTrue(writer._write_batch(records)) # pylint: disable=protected-access
+        self.assertTrue(writer._write_batch(records, replay=True)) # pylint: disable=protected-access
+        self.assertEqual(self.ref_counts(), {'first': 2})
+        replaced = [{'flow_id': 'flow-1', 'action': 'Response', 'response_text': 'second'}]
+        self.assertTrue(writer._write_batch(replaced)) # pylint: disable=protected-access
+        self.assertEqual(self.ref_counts(), {'first': 1, 'second': 1})
+        self.assertTrue(writer._write_batch([{'flow_id': 'flow-2', 'action': 'Drop'}])) # pylint: disable=protected-access
+        self.assertEqual(self.ref_counts(), {'first': 0, 'second': 1})
+        with self.session() as db:
+            self.assertEqual(BodyStore().prune(db), 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+"""test_broadcast.py"""
+import threading
+import unittest
+
+from modules.broadcast import Broadcast # pylint: disable=import-error
+
+class BroadcastTest(unittest.TestCase):
+    """Broadcast test case."""
+
+    def test_publish(self) -> None:
+        """Test every subscriber gets the messages published after it subscribed."""
+        broadcast = Broadcast()
+        self.assertFalse(broadcast.active())
+        self.assertEqual(broadcast.publish('lost'), 0)
+        first = broadcast.subscribe()
+        broadcast.publish(1)
+        second = broadcast.subscribe()
+        broadcast.publish(2)
+        self.assertEqual(first.drain(), [1, 2])
+        self.assertEqual(second.drain(), [2])
+        second.close()
+        self.assertEqual(broadcast.publish(3), 1)
+        self.assertEqual(second.drain(), [])
+
+    def test_slow_consumer(self) -> None:
+        """Test a full subscription drops its oldest messages instead of blocking the publisher."""
+        broadcast = Broadcast(maxsize=3)
+        with broadcast.subscribe() as subscription:
+            for message in range(5):
+                broadcast.publish(message)
+            self.assertEqual(subscription.drain(), [2, 3, 4])
+            self.assertEqual(subscription.dropped, 2)
+        self.assertFalse(broadcast.active())
+
+    def test_get(self) -> None:
+        """Test get waits for a message, times out, and returns once closed."""
+        broadcast = Broadcast()
+        subscription = broadcast.subscribe()
+        self.assertIsNone(subscription.get(timeout=0.01))
+        timer = threading.Timer(0.01, broadcast.publish, args=('flow',))
+        timer.start()
+        self.assertEqual(subscription.get(timeout=5), 'flow')
+        timer = threading.Timer(0.01, subscription.close)
+        timer.start()
+        self.assertIsNone(subscription.get(timeout=5))
+
+if __name__ == '__main__':
+    unittest.main()
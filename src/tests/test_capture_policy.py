@@ -0,0 +1,56 @@
+"""test_capture_policy.py"""
+import unittest
+
+from modules.capture_policy import CAPTURE_DROP, CAPTURE_FULL, CAPTURE_METADATA # pylint: disable=import-error
+from modules.capture_policy import CapturePolicy, media_rules, path_extension # pylint: disable=import-error
+
+class CapturePolicyTest(unittest.TestCase):
+    """Capture policy test case."""
+
+    def test_request_rules(self) -> None:
+        """Test host, path and extension rules match the request line, first rule first."""
+        policy = CapturePolicy([
+            {'rule_type': 'host', 'pattern': '*.cdn.test', 'mode': CAPTURE_DROP},
+            {'rule_type': 'path', 'pattern': '/static/*', 'mode': CAPTURE_METADATA},
+            {'rule_type': 'extension', 'pattern': '.PNG', 'mode': CAPTURE_DROP},
+            {'rule_type': 'path', 'pattern': '/static/app.png', 'mode': CAPTURE_FULL}
+        ])
+        self.assertEqual(policy.for_request('img.CDN.test', '/api'), CAPTURE_DROP)
+        self.assertEqual(policy.for_request('app.test', '/Static/app.png'), CAPTURE_METADATA)
+        self.assertEqual(policy.for_request('app.test', '/logo.png?size=2#top'), CAPTURE_DROP)
+        self.assertIsNone(policy.for_request('app.test', '/api/users'))
+        self.assertIsNone(policy.for_request(None, None))
+        self.assertIsNone(policy.for_response('image/png'))
+
+    def test_response_rules(self) -> None:
+        """Test content type rules match the media type of the response."""
+        policy = CapturePolicy(media_rules(), default_mode=CAPTURE_METADATA)
+        self.assertEqual(policy.for_response('Image/PNG; charset=binary'), CAPTURE_DROP)
+        self.assertEqual(policy.for_response('application/font-woff'), CAPTURE_DROP)
+        self.assertIsNone(policy.for_response('application/json'))
+        self.assertIsNone(policy.for_response(None))
+        self.assertEqual(policy.for_request('app.test', '/fonts/a.woff2'), CAPTURE_DROP)
+        self.assertEqual(policy.default_mode, CAPTURE_METADATA)
+
+    def test_rule_order(self) -> None:
+        """Test a content type rule added before a request line rule decides first, once the response is in."""
+        policy = CapturePolicy([
+            {'rule_type': 'content-type', 'pattern': 'image/*', 'mode': CAPTURE_DROP},
+            {'rule_type': 'host', 'pattern': '*', 'mode': CAPTURE_FULL},
+            {'rule_type': 'content-type', 'pattern': 'text/*', 'mode': CAPTURE_METADATA}
+        ])
+        self.assertIsNone(policy.for_request('app.test', '/logo.png'))
+        self.assertEqual(policy.for_response('image/png', 'app.test', '/logo.png'), CAPTURE_DROP)
+        self.assertEqual(policy.for_response('text/html', 'app.test', '/'), CAPTURE_FULL)
+        policy = CapturePolicy([{'rule_type': 'path', 'pattern': '/api/*', 'mode': CAPTURE_FULL},
+                                {'rule_type': 'content-type', 'pattern': '*', 'mode': CAPTURE_METADATA}])
+        self.assertEqual(policy.for_request('app.test', '/api/users'), CAPTURE_FULL)
+        self.assertEqual(policy.for_response('text/html', 'app.test', '/index.html'), CAPTURE_METADATA)
+
+    def test_path_extension(self) -> None:
+        """Test the extension ignores the query string and fragment."""
+        self.assertEqual(path_extension('/a/b.JS?v=1.2'), 'js')
+        self.assertEqual(path_extension('/a.b/c#x.y'), '')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,34 @@
+"""test_comments.py"""
+import unittest
+
+from modules.comments import COMMENT_BLOCK, COMMENT_HTML, COMMENT_LINE, extract_comments # pylint: disable=import-error
+
+class CommentsTest(unittest.TestCase):
+    """Comments test case."""
+
+    def test_html(self) -> None:
+        """Test HTML comments and the comments of inline scripts and styles are found once each."""
+        body = ('<html><!-- TODO: remove debug --><script>var url = "https://example.com"; // api v2\n'
+                '</script><style>a { background: url(http://example.com/a.png) } /* theme */</style>'
+                '<!-- TODO: remove debug --><!----></html>')
+        self.assertEqual([(comment.kind, comment.text) for comment in extract_comments(body)], [
+            (COMMENT_HTML, 'TODO: remove debug'),
+            (COMMENT_LINE, 'api v2'),
+            (COMMENT_BLOCK, 'theme')
+        ])
+        self.assertEqual(extract_comments(body)[0].position, 6)
+
+    def test_script(self) -> None:
+        """Test strings, regular expressions and divisions do not start comments."""
+        body = ("var a = 'it // is'; var r = /\\/\\//g; var b = c / d; // one\n"
+                "var s = `multi\n// line`; /* two */ return /a\\/\\/b/.test(x) // three")
+        self.assertEqual([comment.text for comment in extract_comments(body)], ['one', 'two', 'three'])
+
+    def test_no_comments(self) -> None:
+        """Test JSON, binary and empty bodies have no comments."""
+        self.assertEqual(extract_comments('{"url": "// not"}'), [])
+        self.assertEqual(extract_comments('\x00\x01 // binary'), [])
+        self.assertEqual(extract_comments('  '), [])
+
+if __name__ == '__main__':
+    unittest.main() # pragma: no cover
@@ -0,0 +1,53 @@
+"""test_database.py"""
+import asyncio
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from sqlalchemy import text
+import modules.database as database # pylint: disable=import-error
+
+class DatabaseEngineTest(unittest.TestCase):
+    """Database engine test case."""
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory() # pylint: disable=consider-using-with
+        self.addCleanup(self.directory.cleanup)
+        patchers = [mock.patch.object(database, 'CONNECTION_STRING_SQLITE',
+                                      f"sqlite:///{os.path.join(self.directory.name, 'w3bt00lkit.db')}"),
+                    mock.patch.object(database, 'CONNECTION_OPTION', 'sqlite'),
+                    mock.patch.dict(database._engines, clear=True)] # pylint: disable=protected-access
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(database.dispose_engines)
+
+    def test_one_engine_per_backend(self) -> None:
+        """Test every session of a backend shares one lazily created, pooled engine."""
+        self.assertEqual(database._engines, {}) # pylint: disable=protected-access
+        engine = database.get_engine()
+        self.assertIs(database.get_engine('sqlite'), engine)
+        self.assertEqual(engine.pool.size(), database.POOL_SIZE)
+        with database.Database._get_db() as first, database.Database._get_db() as second: # pylint: disable=protected-access
+            self.assertIs(first.get_bind(), engine)
+            self.assertIs(second.get_bind(), engine)
+            self.assertEqual(first.execute(text('SELECT 1')).scalar(), 1)
+
+    def test_dispose_engines(self) -> None:
+        """Test disposing the engines closes them and the next session creates a new one."""
+        engine = database.get_engine()
+        database.dispose_engines()
+        self.assertEqual(database._engines, {}) # pylint: disable=protected-access
+        self.assertIsNot(database.get_engine(), engine)
+
+    def test_run_db(self) -> None:
+        """Test a session function runs in a worker thread on the pooled engine when no asyncio driver is installed."""
+        def query(db, value: int) -> tuple:
+            return db.execute(text('SELECT :value'), {'value': value}).scalar(), threading.current_thread() is threading.main_thread()
+        with mock.patch.object(database, 'async_driver_available', return_value=False):
+            self.assertEqual(asyncio.run(database.run_db(query, 7)), (7, False))
+
+if __name__ == '__main__':
+    unittest.main()
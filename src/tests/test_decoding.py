@@ -0,0 +1,49 @@
+"""test_decoding.py"""
+import unittest
+from unittest.mock import patch
+
+from modules.decoding import BodyDecoder, content_type_charset, decode_header # pylint: disable=import-error
+
+class DecodingTest(unittest.TestCase):
+    """Decoding test case."""
+
+    def setUp(self) -> None:
+        self.decoder = BodyDecoder()
+
+    def test_decode_header(self) -> None:
+        """Test header values fall back to latin-1."""
+        self.assertEqual(decode_header('text/html'), 'text/html')
+        self.assertEqual(decode_header('café'.encode('utf-8')), 'café')
+        self.assertEqual(decode_header(b'caf\xe9'), 'café')
+
+    def test_content_type_charset(self) -> None:
+        """Test the media type and charset of a Content-Type header."""
+        self.assertEqual(content_type_charset('Text/HTML; charset="ISO-8859-1"'), ('text/html', 'iso8859-1'))
+        self.assertEqual(content_type_charset('application/json; charset=bogus'), ('application/json', None))
+        self.assertEqual(content_type_charset(None), (None, None))
+
+    def test_charset_and_utf8_skip_detection(self) -> None:
+        """Test chardet is not called when the charset or UTF-8 decodes the body."""
+        with patch('modules.decoding.chardet.detect') as mock_detect:
+            self.assertEqual(self.decoder.decode(b'caf\xe9', 'text/html; charset=latin-1', 'a.test'), 'café')
+            self.assertEqual(self.decoder.decode('café'.encode('utf-8'), 'text/html', 'a.test'), 'café')
+            mock_detect.assert_not_called()
+
+    def test_detected_encoding_is_cached(self) -> None:
+        """Test chardet runs once per host and media type."""
+        body = 'Привет, мир'.encode('cp1251')
+        with patch('modules.decoding.chardet.detect', return_value={'encoding': 'windows-1251'}) as mock_detect:
+            self.assertEqual(self.decoder.decode(body, 'text/plain', 'a.test'), body.decode('cp1251'))
+            self.assertEqual(self.decoder.decode(body, 'text/plain', 'a.test'), body.decode('cp1251'))
+            self.assertEqual(mock_detect.call_count, 1)
+            self.decoder.decode(body, 'text/plain', 'b.test')
+            self.assertEqual(mock_detect.call_count, 2)
+
+    def test_latin1_fallback(self) -> None:
+        """Test undetectable bodies decode as latin-1."""
+        with patch('modules.decoding.chardet.detect', return_value={'encoding': None}):
+            self.assertEqual(self.decoder.decode(b'\xff\xfe\xfa', None, 'a.test'), 'ÿþú')
+        self.assertIsNone(self.decoder.decode(None))
+
+if __name__ == '__main__':
+    unittest.main() # pragma: no cover
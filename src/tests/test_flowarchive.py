@@ -0,0 +1,48 @@
+"""test_flowarchive.py"""
+import glob
+import os
+import tempfile
+import unittest
+
+from mitmproxy.test import tflow
+from modules.flowarchive import INDEX_SUFFIX, FlowArchive # pylint: disable=import-error
+
+class FlowArchiveTest(unittest.TestCase):
+    """Flow archive test case."""
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory() # pylint: disable=consider-using-with
+        self.addCleanup(self.directory.cleanup)
+
+    def test_append_read(self) -> None:
+        """Test archived flows are read back by reference, without the toolkit's metadata."""
+        archive = FlowArchive(self.directory.name)
+        flow = tflow.tflow(resp=True)
+        flow.metadata['w3bt00lkit_captured'] = True
+        flow.metadata['note'] = 'kept'
+        reference = archive.append(flow, target_id=3)
+        archive.close()
+        self.assertTrue(reference.startswith('target-3/'))
+        read = FlowArchive.read(reference, self.directory.name)
+        self.assertEqual(read.id, flow.id)
+        self.assertEqual(read.request.url, flow.request.url)
+        self.assertEqual(read.response.content, flow.response.content)
+        self.assertEqual(read.metadata, {'note': 'kept'})
+        self.assertIn('w3bt00lkit_captured', flow.metadata)
+
+    def test_segments_and_index(self) -> None:
+        """Test segments rotate, and the index and a scan of the segments find every flow."""
+        archive = FlowArchive(self.directory.name, max_size=1)
+        flows = [tflow.tflow(resp=True) for _ in range(3)]
+        references = [archive.append(flow, target_id=1) for flow in flows]
+        archive.close()
+        target_directory = os.path.join(self.directory.name, 'target-1')
+        segments = sorted(path for path in glob.glob(os.path.join(target_directory, '*')) if not path.endswith(INDEX_SUFFIX))
+        self.assertEqual(len(segments), 3)
+        self.assertEqual([flow.id for path in segments for flow in FlowArchive.scan(path)], [flow.id for flow in flows])
+        index = FlowArchive.read_index(glob.glob(os.path.join(target_directory, f'*{INDEX_SUFFIX}'))[0])
+        self.assertEqual(list(index), [flow.id for flow in flows])
+        self.assertEqual([f"target-1/{segment}:{offset}:{length}" for segment, offset, length in index.values()], references)
+
+if __name__ == '__main__':
+    unittest.main()
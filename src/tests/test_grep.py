@@ -0,0 +1,66 @@
+"""test_grep.py"""
+import re
+import time
+import unittest
+import warnings
+from unittest import mock
+
+from databasecase import DatabaseTestCase # pylint: disable=import-error
+from modules.grep import BodyGrep, GrepDocument, scan # pylint: disable=import-error
+from modules.proxywriter import ProxyWriter # pylint: disable=import-error
+
+def flow(number: int, body: str, target_id: int = 1) -> dict:
+    """Get the record of a captured flow."""
+    return {'flow_id': f'flow-{number}', 'target_id': target_id, 'action': 'Response', 'response_text': body,
+            'full_url': f'http://app.test/item/{number}',
+            'raw_request': f'GET /item/{number} HTTP/1.1\r\nHost: app.test\r\n\r\n'}
+
+class GrepTest(DatabaseTestCase):
+    """Proxy grep test case."""
+
+    def test_scan(self) -> None:
+        """Test matches are reported with their byte offset, at most max_matches per document."""
+        documents = [GrepDocument(1, 'request', 'é token-1 token-2 token-3'), GrepDocument('hash', 'response', 'no match')]
+        self.assertEqual(scan(r'token-\d', documents, max_matches=2),
+                         [(1, 'request', 3, 'token-1'), (1, 'request', 11, 'token-2')])
+
+    def test_grep(self) -> None:
+        """Test requests and stored bodies are scanned, each shared body once, and mapped back to their proxy rows."""
+        ProxyWriter(journal=False)._write_batch([flow(1, 'secret=abc'), flow(2, 'secret=abc'), # pylint: disable=protected-access
+                                                 flow(3, 'nothing here', target_id=2)])
+        matches = sorted(BodyGrep(workers=1).grep(r'secret=\w+|/item/3'))
+        self.assertEqual([(match.flow_id, match.part, match.text, match.others) for match in matches],
+                         [('flow-2', 'response', 'secret=abc', 1), ('flow-3', 'request', '/item/3', 0)])
+        self.assertEqual(list(BodyGrep(workers=1).grep('secret', target_id=2)), [])
+        with self.assertRaises(re.error):
+            list(BodyGrep(workers=1).grep('('))
+
+    def test_grep_shared_body(self) -> None:
+        """Test a body stored under two targets only maps to the rows of the target grepped."""
+        ProxyWriter(journal=False)._write_batch([flow(1, 'shared secret'), flow(2, 'shared secret', target_id=2), # pylint: disable=protected-access
+                                                 flow(3, 'shared secret', target_id=2)])
+        self.assertEqual([(match.flow_id, match.others) for match in BodyGrep(workers=1).grep('secret', target_id=1)],
+                         [('flow-1', 0)])
+        self.assertEqual([(match.flow_id, match.others) for match in BodyGrep(workers=1).grep('secret', target_id=2)],
+                         [('flow-3', 1)])
+        self.assertEqual([(match.flow_id, match.others) for match in BodyGrep(workers=1).grep('secret')],
+                         [('flow-3', 2)])
+    def test_grep_writer_running(self) -> None:
+        """Test the workers are not forked from a process running the writer thread."""
+        writer = ProxyWriter(journal=False, flush_interval=0.01)
+        writer.start()
+        try:
+            writer.enqueue(flow(1, 'token=xyz'))
+            deadline = time.monotonic() + 5
+            while writer.written_count == 0 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            self.assertTrue(writer.thread.is_alive())
+            with warnings.catch_warnings(), mock.patch('os.fork', side_effect=AssertionError('forked')):
+                warnings.simplefilter('error', DeprecationWarning)
+                matches = list(BodyGrep(workers=2).grep(r'token=\w+'))
+        finally:
+            writer.stop()
+        self.assertEqual([(match.flow_id, match.text) for match in matches], [('flow-1', 'token=xyz')])
+
+if __name__ == '__main__':
+    unittest.main()
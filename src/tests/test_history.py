@@ -0,0 +1,97 @@
+"""test_history.py"""
+import unittest
+
+from sqlalchemy import update
+from databasecase import DatabaseTestCase # pylint: disable=import-error
+from modules.commentindex import CommentIndex # pylint: disable=import-error
+from modules.history import HistoryPages, ProxyRow, SearchPages, get_proxy_record, load_proxy_record # pylint: disable=import-error
+from modules.proxywriter import ProxyWriter # pylint: disable=import-error
+from modules.searchquery import HIGHLIGHT_START, parse_query # pylint: disable=import-error
+from models import BodyModel, ProxyModel # pylint: disable=import-error
+
+def flow(number: int, target_id: int = 1, body: str = None) -> list:
+    """Get the request and response records of a captured flow."""
+    flow_id = f'flow-{number}'
+    full_url = f'http://app.test/api/{number}'
+    return [
+        {'flow_id': flow_id, 'target_id': target_id, 'action': 'Request', 'method': 'GET', 'host': 'app.test',
+         'path': f'/api/{number}', 'full_url': full_url, 'timestamp_start': 1700000000 + number,
+         'raw_request': f'GET /api/{number} HTTP/1.1\r\nHost: app.test\r\n\r\n'},
+        {'flow_id': flow_id, 'target_id': target_id, 'action': 'Response', 'response_status_code': 200,
+         'response_headers': 'Content-Type: application/json', 'full_url': full_url,
+         'response_text': body if body is not None else f'{{"item": {number}}}'}
+    ]
+
+class HistoryTest(DatabaseTestCase):
+    """History and search pages test case."""
+
+    def write(self, *flows: list) -> None:
+        """Write flows with the proxy writer."""
+        writer = ProxyWriter(journal=False)
+        self.assertTrue(writer._write_batch([record for records in flows for record in records])) # pylint: disable=protected-access
+
+    def test_history_pages(self) -> None:
+        """Test pages are read newest first with keyset cursors, and filtered by the criteria."""
+        self.write(*(flow(number, target_id=1 + number % 2) for number in range(7)))
+        pages = HistoryPages(page_size=3)
+        self.assertEqual([[row.full_url[-1] for row in pages.page(number)] for number in range(4)],
+                         [['6', '5', '4'], ['3', '2', '1'], ['0'], []])
+        self.assertEqual(len(pages.cursors), 3)
+        self.assertEqual(pages.cursors[1], (pages[2].timestamp_start, pages[2].id))
+        self.assertEqual(pages[6].full_url, 'http://app.test/api/0')
+        with self.assertRaises(IndexError):
+            pages[7] # pylint: disable=pointless-statement
+        self.assertEqual(len(pages), 7)
+        filtered = HistoryPages([ProxyModel.target_id == 2], page_size=2)
+        self.assertEqual([row.full_url[-1] for row in filtered.page(1)], ['1'])
+
+    def test_cache_cleared_by_backfill(self) -> None:
+        """Test a cached view is read again after a comment backfill changes its rows outside the writer."""
+        self.write(flow(1, body='<html><!-- todo: remove --></html>'))
+        with self.session() as db:
+            db.execute(update(BodyModel).values(comments_ind=None))
+            db.execute(update(ProxyModel).values(comments_ind=None))
+            db.commit()
+        self.assertEqual(len(HistoryPages([ProxyModel.comments_ind == True]).page(0)), 0) # pylint: disable=singleton-comparison
+        with self.session() as db:
+            self.assertEqual(CommentIndex().backfill(db), 1)
+        self.assertEqual(len(HistoryPages([ProxyModel.comments_ind == True]).page(0)), 1) # pylint: disable=singleton-comparison
+
+    def test_get_proxy_record(self) -> None:
+        """Test the list only reads the list columns, and a row is loaded with its body from the body store."""
+        self.write(flow(1))
+        row = HistoryPages().page(0)[0]
+        self.assertIsInstance(row, ProxyRow)
+        record = get_proxy_record(row.id)
+        self.assertEqual((record.method, record.response_status_code), ('GET', 200))
+        self.assertIsNotNone(record.response_body_hash)
+        self.assertEqual(record.response_text, '{"item": 1}')
+        self.assertIsNone(get_proxy_record(row.id + 1))
+
+    def test_search_pages(self) -> None:
+        """Test search results are paged with a highlighted snippet, and filtered by target and by side of the flow."""
+        self.write(flow(1, body='{"token": "needle-one"}'), flow(2, target_id=2, body='{"token": "needle-two"}'), flow(3))
+        pages = SearchPages(parse_query('needle'), page_size=1)
+        self.assertEqual(len(pages), 2)
+        self.assertEqual({row.full_url for row in pages.page(0) + pages.page(1)}, {'http://app.test/api/1', 'http://app.test/api/2'})
+        self.assertEqual(pages.page(2), [])
+        self.assertIn(HIGHLIGHT_START, pages[0].snippet)
+        self.assertEqual([row.full_url for row in SearchPages(parse_query('needle'), target_id=2)], ['http://app.test/api/2'])
+        self.assertEqual(len(SearchPages(parse_query('needle'), responses=False)), 0)
+        self.assertEqual(len(SearchPages(parse_query('/api/3'), responses=False)), 1)
+
+    def test_select_search_row(self) -> None:
+        """Test a search result loads the full proxy row, with its body from the body store."""
+        self.write(flow(1), flow(2, body='{"token": "needle-secret"}'))
+        pages = SearchPages(parse_query('needle'))
+        self.assertEqual(len(pages), 1)
+        row = pages[0]
+        record = load_proxy_record(row)
+        self.assertIsInstance(record, ProxyModel)
+        self.assertEqual(record.id, row.id)
+        self.assertIn('GET /api/2', record.raw_request)
+        self.assertEqual(record.response_text, '{"token": "needle-secret"}')
+        self.assertIs(load_proxy_record(record), record)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+"""test_metrics.py"""
+import os
+import tempfile
+import unittest
+
+from modules.metrics import Histogram, Metrics # pylint: disable=import-error
+
+class MetricsTest(unittest.TestCase):
+    """Metrics test case."""
+
+    def test_percentiles(self) -> None:
+        """Test nearest-rank percentiles."""
+        histogram = Histogram()
+        self.assertEqual(histogram.percentiles(), {})
+        for value in range(1, 101):
+            histogram.observe(value)
+        self.assertEqual(histogram.percentiles(), {50: 50, 95: 95, 99: 99})
+        self.assertEqual(histogram.count, 100)
+        self.assertEqual(histogram.total, 5050)
+
+    def test_window(self) -> None:
+        """Test percentiles only use the most recent samples."""
+        histogram = Histogram(size=10)
+        for value in range(100):
+            histogram.observe(value)
+        self.assertEqual(histogram.percentiles((50,)), {50: 94})
+        self.assertEqual(histogram.count, 100)
+
+    def test_snapshot(self) -> None:
+        """Test timers, counters and gauges are reported."""
+        metrics = Metrics()
+        with metrics.timer('stage'):
+            pass
+        metrics.inc('flows')
+        metrics.inc('flows', 2)
+        metrics.gauge('queue_depth', lambda: 7)
+        snapshot = metrics.snapshot()
+        self.assertEqual(snapshot['timers']['stage']['count'], 1)
+        self.assertEqual(snapshot['counters'], {'flows': 3})
+        self.assertEqual(snapshot['gauges'], {'queue_depth': 7})
+
+    def test_prometheus(self) -> None:
+        """Test the Prometheus text format."""
+        metrics = Metrics()
+        metrics.observe('scope_match', 0.5)
+        metrics.inc('flows')
+        text = metrics.to_prometheus(prefix='test')
+        self.assertIn('test_stage_seconds{stage="scope_match",quantile="0.99"} 0.500000000', text)
+        self.assertIn('test_stage_seconds_count{stage="scope_match"} 1', text)
+        self.assertIn('test_flows_total 1', text)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'metrics.prom')
+            metrics.write_prometheus(path)
+            with open(path, 'r', encoding='utf-8') as metrics_file:
+                self.assertIn('w3bt00lkit_proxy_flows_total 1', metrics_file.read())
+
+if __name__ == '__main__':
+    unittest.main() # pragma: no cover
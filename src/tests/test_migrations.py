@@ -0,0 +1,80 @@
+"""test_migrations.py"""
+import unittest
+
+from sqlalchemy import insert, inspect, select, text
+from databasecase import DatabaseTestCase # pylint: disable=import-error
+from modules.migrations import MIGRATIONS, apply_migrations, pending_migrations, schema_version # pylint: disable=import-error
+from modules.history import explain, plan_indexes, planned_queries # pylint: disable=import-error
+from models import ProxyModel # pylint: disable=import-error
+
+HISTORY_INDEXES = ['ix_proxy_timestamp_start_id',
+                   'ix_proxy_target_id_response_status_code_timestamp_start_id',
+                   'ix_proxy_responses_target_id_timestamp_start_id',
+                   'ix_proxy_responses_target_id_method_timestamp_start_id',
+                   'ix_proxy_target_id_host_path']
+
+class MigrationsTest(DatabaseTestCase):
+    """Migrations test case."""
+
+    def setUp(self) -> None:
+        super().setUp()
+        # Start from a database created before the history indexes existed.
+        with self.engine.begin() as connection:
+            for name in HISTORY_INDEXES:
+                connection.execute(text(f'DROP INDEX {name}'))
+
+    def proxy_indexes(self) -> set[str]:
+        """Get the names of the indexes of the proxy table."""
+        with self.engine.connect() as connection:
+            return {index['name'] for index in inspect(connection).get_indexes('proxy')}
+
+    def test_apply_migrations(self) -> None:
+        """Test every migration is applied once and in order, and the version is recorded."""
+        with self.engine.begin() as connection:
+            self.assertEqual(schema_version(connection), 0)
+            applied = apply_migrations(connection)
+        self.assertEqual([migration.version for migration, _ in applied], [migration.version for migration in MIGRATIONS])
+        with self.engine.begin() as connection:
+            self.assertEqual(schema_version(connection), MIGRATIONS[-1].version)
+            self.assertEqual(pending_migrations(connection), [])
+            self.assertEqual(apply_migrations(connection), [])
+        self.assertLessEqual(set(HISTORY_INDEXES), self.proxy_indexes())
+
+    def test_model_indexes_migration(self) -> None:
+        """Test the model indexes migration leaves the indexes of later migrations to them."""
+        with self.engine.begin() as connection:
+            MIGRATIONS[1].function(connection)
+        self.assertFalse(set(HISTORY_INDEXES) & self.proxy_indexes())
+
+    def test_history_plans(self) -> None:
+        """Test every history query is planned on an index once the migrations are applied."""
+        with self.engine.begin() as connection:
+            apply_migrations(connection)
+        with self.session() as db:
+            for target_id in (None, 1):
+                for command, statement in planned_queries(target_id):
+                    with self.subTest(command=command, target_id=target_id):
+                        indexes, full_scan = plan_indexes(explain(db, statement))
+                        self.assertFalse(full_scan)
+                        self.assertTrue(set(indexes) & {*HISTORY_INDEXES, 'ix_proxy_target_id_timestamp_start_id'})
+
+    def test_fold_legacy_proxy_rows(self) -> None:
+        """Test the legacy request rows are merged into their response row and every row gets a flow id."""
+        legacy = {'target_id': 1, 'timestamp_start': 1700000000, 'method': 'GET', 'full_url': 'http://app.test/'}
+        with self.session() as db:
+            db.execute(insert(ProxyModel), [{**legacy, 'action': 'Request'},
+                                            {**legacy, 'action': 'Response', 'response_status_code': 200},
+                                            {**legacy, 'action': 'Request', 'full_url': 'http://app.test/pending'},
+                                            {**legacy, 'action': 'Request', 'flow_id': 'flow-1'}])
+            db.commit()
+        with self.engine.begin() as connection:
+            messages = apply_migrations(connection)[0][1]
+        self.assertEqual(messages, ["Merged 1 legacy request row(s) into their response row.",
+                                    "Assigned a flow id to 2 legacy proxy row(s)."])
+        with self.session() as db:
+            rows = db.execute(select(ProxyModel.id, ProxyModel.flow_id, ProxyModel.action).order_by(ProxyModel.id)).all()
+        self.assertEqual([(row.flow_id, row.action) for row in rows],
+                         [(f'legacy-{rows[0].id}', 'Response'), (f'legacy-{rows[1].id}', 'Request'), ('flow-1', 'Request')])
+
+if __name__ == '__main__':
+    unittest.main()
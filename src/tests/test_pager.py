@@ -0,0 +1,84 @@
+"""test_pager.py"""
+import io
+import unittest
+
+from rich.console import Console
+from rich.table import Table
+from modules.pager import ListPages, Pager # pylint: disable=import-error
+
+class CountingPages(ListPages):
+    """List pages recording the pages read."""
+
+    def __init__(self, rows, page_size) -> None:
+        super().__init__(rows, page_size)
+        self.read = []
+
+    def page(self, number):
+        self.read.append(number)
+        return super().page(number)
+
+def render(rows, start_index) -> Table:
+    """Render a page as a one column table."""
+    table = Table('#')
+    for number, row in enumerate(rows, start_index):
+        table.add_row(f"{number}:{row}")
+    return table
+
+class PagerTest(unittest.TestCase):
+    """Pager test case."""
+
+    def test_list_pages(self) -> None:
+        """Test a list is served a page at a time."""
+        pages = ListPages(list(range(7)), page_size=3)
+        self.assertEqual(pages.page(0), [0, 1, 2])
+        self.assertEqual(pages.page(2), [6])
+        self.assertEqual(pages.page(3), [])
+        self.assertEqual(pages.page(-1), [])
+        self.assertEqual(len(pages), 7)
+
+    def test_pager(self) -> None:
+        """Test only the pages shown are read, rows are numbered across pages and paging stops at the ends."""
+        output = io.StringIO()
+        source = CountingPages(list('abcde'), page_size=2)
+        pager = Pager(source, render, console=Console(file=output, width=40))
+        self.assertEqual(pager.show(), ['a', 'b'])
+        self.assertEqual(source.read, [0])
+        self.assertEqual(pager.next(), ['c', 'd'])
+        self.assertEqual(pager.start_index, 2)
+        self.assertIn('3:d', output.getvalue())
+        self.assertEqual(pager.next(), ['e'])
+        self.assertEqual(pager.next(), [])
+        self.assertEqual(pager.number, 2)
+        self.assertEqual(pager.previous(), ['c', 'd'])
+        self.assertEqual(pager.show(0), ['a', 'b'])
+        self.assertEqual(pager.previous(), [])
+
+    def test_list_source(self) -> None:
+        """Test a plain list is paged with the given page size."""
+        pager = Pager(list(range(30)), render, page_size=25, console=Console(file=io.StringIO()))
+        self.assertEqual(len(pager.show()), 25)
+        self.assertEqual(pager.next(), list(range(25, 30)))
+    def test_split_columns(self) -> None:
+        """Test the columns that do not fit the console are printed in another table, after the row numbers."""
+        def wide(rows, start_index) -> Table:
+            table = Table('#', 'alpha', 'beta', 'gamma')
+            for number, row in enumerate(rows, start_index):
+                table.add_row(str(number), *[f"{name}-{row}" * 3 for name in ('alpha', 'beta', 'gamma')])
+            return table
+        output = io.StringIO()
+        pager = Pager(['a', 'b'], wide, console=Console(file=output, width=60))
+        self.assertEqual(pager.show(), ['a', 'b'])
+        tables = pager.split_columns(wide(['a'], 0))
+        self.assertEqual([[column.header for column in table.columns] for table in tables],
+                         [['#', 'alpha', 'beta'], ['#', 'gamma']])
+        lines = output.getvalue().splitlines()
+        self.assertTrue(all(len(line) <= 60 for line in lines))
+        self.assertEqual(sum('gamma-b' in line for line in lines), 1)
+        self.assertEqual(sum(line.startswith('│ 1 ') for line in lines), 2)
+        self.assertEqual(len(Pager(['a'], wide, console=Console(file=io.StringIO(), width=200)).split_columns(wide(['a'], 0))), 1)
+        narrow = io.StringIO()
+        Pager(['a', 'b'], wide, console=Console(file=narrow, width=60), split_columns=False).show()
+        self.assertEqual(sum('┏' in line for line in narrow.getvalue().splitlines()), 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+"""test_pipeline.py"""
+import asyncio
+import threading
+import unittest
+
+from mitmproxy.test import tflow
+from modules.metrics import Metrics # pylint: disable=import-error
+from modules.pipeline import FlowContext, Pipeline # pylint: disable=import-error
+
+class PipelineTest(unittest.TestCase):
+    """Pipeline test case."""
+
+    def test_stages(self) -> None:
+        """Test stages run in order, offloaded ones in a worker thread, and are timed."""
+        metrics = Metrics()
+        pipeline = Pipeline(metrics, workers=1)
+        calls = []
+
+        def enrich(context: FlowContext) -> None:
+            calls.append(('enrich', threading.current_thread() is threading.main_thread()))
+            context.values['record'] = context.snapshot
+
+        async def persist(context: FlowContext) -> None:
+            calls.append(('persist', context.values['record']))
+
+        pipeline.stage('request', 'filter', lambda context: calls.append(('filter', None)))
+        pipeline.stage('request', 'snapshot', lambda context: setattr(context, 'snapshot', 'snapshot'))
+        pipeline.stage('request', 'enrich', enrich, offload=True)
+        pipeline.stage('request', 'persist', persist)
+
+        async def run() -> None:
+            await pipeline.run('request', FlowContext(tflow.tflow()))
+            await pipeline.drain()
+        asyncio.run(run())
+        pipeline.close()
+
+        self.assertEqual(calls, [('filter', None), ('enrich', False), ('persist', 'snapshot')])
+        self.assertEqual(metrics.snapshot()['timers']['request_enrich']['count'], 1)
+        with self.assertRaises(ValueError):
+            pipeline.stage('request', 'filter', print)
+
+    def test_offload_frees_event_loop(self) -> None:
+        """Test the hook returns and the event loop keeps running while an offloaded stage is still busy."""
+        pipeline = Pipeline(Metrics(), workers=1)
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def enrich(context: FlowContext) -> None: # pylint: disable=unused-argument
+            started.set()
+            release.wait(5)
+            calls.append('enrich')
+
+        pipeline.stage('request', 'snapshot', lambda context: None)
+        pipeline.stage('request', 'enrich', enrich, offload=True)
+
+        async def run() -> None:
+            await pipeline.run('request', FlowContext(tflow.tflow()))
+            while not started.is_set():
+                await asyncio.sleep(0.001)
+            ticks = 0
+            for _ in range(10):
+                await asyncio.sleep(0)
+                ticks += 1
+            calls.append(('ticks', ticks))
+            release.set()
+            await pipeline.drain()
+        asyncio.run(run())
+        pipeline.close()
+
+        self.assertEqual(calls, [('ticks', 10), 'enrich'])
+
+    def test_stop(self) -> None:
+        """Test a stage can stop the pipeline and errors stop it too."""
+        errors = []
+        pipeline = Pipeline(Metrics(), workers=0, on_error=errors.append)
+        calls = []
+        pipeline.stage('request', 'filter', lambda context: context.stop())
+        pipeline.stage('request', 'snapshot', lambda context: calls.append('snapshot'))
+        pipeline.stage('response', 'filter', lambda context: 1 / 0)
+        pipeline.stage('response', 'snapshot', lambda context: calls.append('snapshot'))
+
+        async def run() -> None:
+            await pipeline.run('request', FlowContext(tflow.tflow()))
+            await pipeline.run('response', FlowContext(tflow.tflow()))
+        asyncio.run(run())
+
+        self.assertEqual(calls, [])
+        self.assertEqual(len(errors), 1)
+        self.assertTrue(errors[0].startswith('RESPONSE: filter'))
+
+    def test_flow_order(self) -> None:
+        """Test the background stages of a flow's response wait for the ones of its request."""
+        pipeline = Pipeline(Metrics(), workers=0)
+        calls = []
+
+        async def slow_persist(context: FlowContext) -> None:
+            await asyncio.sleep(0.05)
+            calls.append('request')
+
+        pipeline.stage('request', 'snapshot', lambda context: None)
+        pipeline.stage('request', 'persist', slow_persist)
+        pipeline.stage('response', 'snapshot', lambda context: None)
+        pipeline.stage('response', 'persist', lambda context: calls.append('response'))
+
+        async def run() -> None:
+            flow = tflow.tflow(resp=True)
+            await pipeline.run('request', FlowContext(flow))
+            await pipeline.run('response', FlowContext(flow))
+            await pipeline.drain()
+        asyncio.run(run())
+
+        self.assertEqual(calls, ['request', 'response'])
+        self.assertEqual(pipeline.pending(), 0)
+        self.assertEqual(pipeline.chains, {})
+
+if __name__ == '__main__':
+    unittest.main() # pragma: no cover
@@ -0,0 +1,54 @@
+"""test_proxy.py"""
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from sqlalchemy import text
+from databasecase import DatabaseTestCase # pylint: disable=import-error
+from modules.proxy import Proxy # pylint: disable=import-error
+from modules.proxywriter import ProxyWriter # pylint: disable=import-error
+from modules.search import SEARCH_BODY_TABLE, SEARCH_TABLE # pylint: disable=import-error
+
+def flow(number: int, path: str, method: str = 'GET', status_code: int = 200, target_id: int = 1) -> dict:
+    """Get the record of a captured flow."""
+    return {'flow_id': f'flow-{number}', 'target_id': target_id, 'action': 'Response', 'method': method,
+            'host': 'app.test', 'path': path, 'full_url': f'http://app.test{path}', 'timestamp_start': 1700000000 + number,
+            'response_status_code': status_code}
+
+class ProxyTest(DatabaseTestCase):
+    """Proxy history views test case."""
+
+    def setUp(self) -> None:
+        super().setUp()
+        writer = ProxyWriter(callback_proxy_message=lambda message: None, journal=False)
+        records = [flow(1, '/api/users'), flow(2, '/v2/orders', method='POST', status_code=201), flow(3, '/static/app.js'),
+                   flow(4, '/api/admin', status_code=403), flow(5, '/api/other', target_id=2)]
+        self.assertTrue(writer._write_batch(records)) # pylint: disable=protected-access
+        app_obj = SimpleNamespace(selected_target=SimpleNamespace(id=1))
+        self.proxy = Proxy(app_obj, None)
+        self.addCleanup(self.proxy.loop.close)
+        self.addCleanup(self.proxy.proxyconfig_obj.loop.close)
+
+    def paths(self, view, *args) -> list:
+        """Get the paths of the rows a history view shows, newest first."""
+        with mock.patch.object(self.proxy, 'history') as history, mock.patch('builtins.print'):
+            view(*args)
+        return [row.full_url.removeprefix('http://app.test') for row in history.call_args.args[0]]
+
+    def test_responses_api(self) -> None:
+        """Test the API view lists the API responses of the selected target, also combined with other filters."""
+        self.assertEqual(self.paths(self.proxy._responses, 'api'), ['/api/admin', '/v2/orders', '/api/users']) # pylint: disable=protected-access
+        self.assertEqual(self.paths(self.proxy._responses_dynamic, ['proxy', 'responses', '200', 'get', 'api']), # pylint: disable=protected-access
+                         ['/api/users'])
+    def test_search_fallback(self) -> None:
+        """Test a scan without the search index matches every term in the same document, like the index."""
+        query = ['proxy', 'search', 'api', 'admin']
+        self.assertEqual(self.paths(self.proxy._search_dynamic, query), ['/api/admin']) # pylint: disable=protected-access
+        with self.engine.begin() as connection:
+            connection.execute(text(f"DROP TABLE {SEARCH_TABLE}"))
+            connection.execute(text(f"DROP TABLE {SEARCH_BODY_TABLE}"))
+        self.assertEqual(self.paths(self.proxy._search_dynamic, query), ['/api/admin']) # pylint: disable=protected-access
+        self.assertEqual(self.paths(self.proxy._search_dynamic, ['proxy', 'search', 'api', 'orders']), []) # pylint: disable=protected-access
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+"""test_proxyhelper.py"""
+import asyncio
+import unittest
+from unittest import mock
+from types import SimpleNamespace
+
+from mitmproxy.test import tflow
+from modules.capture_policy import CapturePolicy # pylint: disable=import-error
+from modules.proxyhelper import ProxyHelper # pylint: disable=import-error
+from modules.proxywriter import ProxyWriter # pylint: disable=import-error
+from modules.scope_matcher import ScopeMatcher # pylint: disable=import-error
+
+class ProxyHelperTest(unittest.TestCase):
+    """Proxy helper test case."""
+
+    def setUp(self) -> None:
+        target = SimpleNamespace(id=1, name='app', platform='web')
+        in_scope = [{'fqdn': 'address', 'path': None}]
+        app_obj = SimpleNamespace(selected_target=target, selected_target_in_scope=in_scope,
+                                  selected_target_scope_matcher=ScopeMatcher(in_scope),
+                                  selected_target_capture_policy=CapturePolicy([]))
+        self.writer = ProxyWriter(callback_proxy_message=lambda message: None, journal=False)
+        self.proxy_helper = ProxyHelper(app_obj, target, in_scope, lambda message: None, self.writer)
+
+    def tearDown(self) -> None:
+        self.proxy_helper.pipeline.close()
+        self.writer.stop()
+
+    def test_response_before_request_persisted(self) -> None:
+        """Test a response arriving before the request record was queued does not rebuild the request columns."""
+        flow = tflow.tflow(resp=True)
+
+        async def run() -> None:
+            await self.proxy_helper.request(flow)
+            await self.proxy_helper.response(flow)
+            await self.proxy_helper.pipeline.drain()
+        asyncio.run(run())
+
+        request, response = self.writer.queue.get_nowait(), self.writer.queue.get_nowait()
+        self.assertEqual((request['action'], response['action']), ('Request', 'Response'))
+        self.assertIn('raw_request', request)
+        self.assertNotIn('raw_request', response)
+        self.assertEqual(response['response_status_code'], 200)
+
+    def test_request_not_queued(self) -> None:
+        """Test the response record carries the request columns when the request record was dropped."""
+        flow = tflow.tflow(resp=True)
+        self.writer.queue.maxsize = 1
+        self.writer.queue.put_nowait({'flow_id': 'busy'})
+
+        async def run() -> None:
+            await self.proxy_helper.request(flow)
+            await self.proxy_helper.pipeline.drain()
+            self.writer.queue.get_nowait()
+            await self.proxy_helper.response(flow)
+            await self.proxy_helper.pipeline.drain()
+        asyncio.run(run())
+
+        response = self.writer.queue.get_nowait()
+        self.assertEqual(response['action'], 'Response')
+        self.assertIn('raw_request', response)
+
+    def test_request_dropped_after_snapshot(self) -> None:
+        """Test the response record carries the request columns when the request record is dropped after the response snapshot."""
+        flow = tflow.tflow(resp=True)
+        enqueue_async = self.writer.enqueue_async
+
+        async def drop_requests(record: dict) -> bool:
+            if record['action'] == 'Request':
+                return False
+            return await enqueue_async(record)
+
+        async def run() -> None:
+            await self.proxy_helper.request(flow)
+            await self.proxy_helper.response(flow)
+            await self.proxy_helper.pipeline.drain()
+        with mock.patch.object(self.writer, 'enqueue_async', side_effect=drop_requests):
+            asyncio.run(run())
+
+        response = self.writer.queue.get_nowait()
+        self.assertTrue(self.writer.queue.empty())
+        self.assertEqual((response['action'], response['target_id'], response['method']), ('Response', 1, 'GET'))
+        self.assertEqual(response['full_url'], 'http://address:22/path')
+        self.assertIn('raw_request', response)
+        self.assertNotIn('w3bt00lkit_request', flow.metadata)
+
+    def test_metadata_decided_by_response(self) -> None:
+        """Test a content type rule keeping only metadata clears the request body recorded before the response."""
+        self.proxy_helper.app_obj.selected_target_capture_policy = CapturePolicy(
+            [{'rule_type': 'content-type', 'pattern': 'text/*', 'mode': 'metadata'}])
+        flow = tflow.tflow(resp=True)
+        flow.request.content = b'secret=1'
+        flow.response.headers['content-type'] = 'text/html'
+        flow_response, flow.response = flow.response, None
+
+        async def run() -> None:
+            await self.proxy_helper.request(flow)
+            flow.response = flow_response
+            await self.proxy_helper.response(flow)
+            await self.proxy_helper.pipeline.drain()
+        asyncio.run(run())
+
+        request, response = self.writer.queue.get_nowait(), self.writer.queue.get_nowait()
+        self.assertIn('secret=1', request['raw_request'])
+        self.assertIsNone(response['content'])
+        self.assertNotIn('secret=1', response['raw_request'])
+        self.assertIsNone(response['response_text'])
+
+if __name__ == '__main__':
+    unittest.main()
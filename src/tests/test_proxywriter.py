@@ -0,0 +1,238 @@
+"""test_proxywriter.py"""
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from sqlalchemy import func, select
+from databasecase import DatabaseTestCase # pylint: disable=import-error
+from modules.journal import Journal # pylint: disable=import-error
+from modules.proxywriter import OVERLOAD_BLOCK, OVERLOAD_JOURNAL, OVERLOAD_METADATA, ProxyWriter # pylint: disable=import-error
+from models import ProxyModel # pylint: disable=import-error
+
+def request(number: int) -> dict:
+    """Get the request record of a flow."""
+    return {'flow_id': f'flow-{number}', 'target_id': 1, 'action': 'Request', 'method': 'GET',
+            'full_url': f'http://app.test/{number}', 'timestamp_start': 1700000000 + number}
+
+class ProxyWriterTest(DatabaseTestCase):
+    """Proxy writer test case."""
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.journals = tempfile.TemporaryDirectory() # pylint: disable=consider-using-with
+        patcher = mock.patch('modules.proxywriter.JOURNAL_PATH', self.journals.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.journals.cleanup)
+
+    def count(self) -> int:
+        """Count the stored proxy rows."""
+        with self.session() as db:
+            return db.scalar(select(func.count(ProxyModel.id)))
+
+    def rows(self) -> dict:
+        """Get the stored proxy rows by flow id."""
+        with self.session() as db:
+            return {row.flow_id: row for row in db.execute(select(ProxyModel.flow_id, ProxyModel.method, ProxyModel.full_url,
+                                                                  ProxyModel.response_status_code, ProxyModel.action))}
+
+    def writer(self, **options) -> ProxyWriter:
+        """Get a writer that does not print its messages."""
+        return ProxyWriter(callback_proxy_message=lambda message: None, **options)
+
+    def test_merge_flows(self) -> None:
+        """Test the request and response of a flow are written as one row, within a batch and across batches."""
+        writer = self.writer(journal=False)
+        writer._write_batch([request(1), {'flow_id': 'flow-1', 'action': 'Response', 'response_status_code': 200}, # pylint: disable=protected-access
+                             request(2)])
+        writer._write_batch([{'flow_id': 'flow-2', 'action': 'Response', 'response_status_code': 404}]) # pylint: disable=protected-access
+        rows = self.rows()
+        self.assertEqual(len(rows), 2)
+        self.assertEqual((rows['flow-1'].method, rows['flow-1'].response_status_code, rows['flow-1'].action), ('GET', 200, 'Response'))
+        self.assertEqual((rows['flow-2'].full_url, rows['flow-2'].response_status_code), ('http://app.test/2', 404))
+        self.assertEqual(writer.written_count, 4)
+
+    def test_drop_flows(self) -> None:
+        """Test a Drop record removes its flow, whether it was written in an earlier batch or not."""
+        writer = self.writer(journal=False)
+        writer._write_batch([request(1), request(2), {'flow_id': 'flow-2', 'action': 'Drop'}]) # pylint: disable=protected-access
+        self.assertEqual(list(self.rows()), ['flow-1'])
+        writer._write_batch([{'flow_id': 'flow-1', 'action': 'Drop'}]) # pylint: disable=protected-access
+        self.assertEqual(self.count(), 0)
+
+    def test_response_without_request(self) -> None:
+        """Test a response whose request was lost is not inserted on its own, unless it carries the request columns."""
+        writer = self.writer(journal=False)
+        self.assertTrue(writer._write_batch([{'flow_id': 'flow-1', 'action': 'Response', 'response_status_code': 200}, # pylint: disable=protected-access
+                                             {**request(2), 'action': 'Response', 'response_status_code': 200}]))
+        self.assertTrue(writer._write_batch([{'flow_id': 'flow-3', 'target_id': 1, 'action': 'Response'}], replay=True)) # pylint: disable=protected-access
+        self.assertEqual(list(self.rows()), ['flow-2'])
+        self.assertEqual(writer.metrics.counters['records_orphaned'], 2)
+        writer._write_batch([request(1)]) # pylint: disable=protected-access
+        writer._write_batch([{'flow_id': 'flow-1', 'action': 'Response', 'response_status_code': 200}], replay=True) # pylint: disable=protected-access
+        self.assertEqual(self.rows()['flow-1'].response_status_code, 200)
+
+    def test_records_without_flow(self) -> None:
+        """Test records without a flow id are inserted as they are."""
+        writer = self.writer(journal=False)
+        record = {key: value for key, value in request(1).items() if key != 'flow_id'}
+        writer._write_batch([record, dict(record)]) # pylint: disable=protected-access
+        self.assertEqual(self.count(), 2)
+
+    def test_next_batch(self) -> None:
+        """Test batches hold at most batch_size records and do not wait past the flush interval for more."""
+        writer = self.writer(journal=False, batch_size=2, flush_interval=0.01)
+        for number in range(3):
+            writer.enqueue(request(number))
+        self.assertEqual(len(writer._next_batch()), 2) # pylint: disable=protected-access
+        self.assertEqual(len(writer._next_batch()), 1) # pylint: disable=protected-access
+        self.assertEqual(writer._next_batch(), []) # pylint: disable=protected-access
+
+    def test_write_batches(self) -> None:
+        """Test stop writes every queued record, in batches of at most batch_size."""
+        writer = self.writer(journal=False, batch_size=2, flush_interval=0.01)
+        for number in range(5):
+            self.assertTrue(writer.enqueue(request(number)))
+        writer.start()
+        writer.stop(timeout=10)
+        self.assertEqual((writer.pending(), writer.written_count, writer.failed_count), (0, 5, 0))
+        with self.session() as db:
+            self.assertEqual(db.scalars(select(ProxyModel.full_url).order_by(ProxyModel.id)).all(),
+                             [f'http://app.test/{number}' for number in range(5)])
+
+    def test_queue_full(self) -> None:
+        """Test enqueue drops records instead of blocking once the queue is full."""
+        writer = self.writer(journal=False, queue_size=2)
+        self.assertEqual([writer.enqueue(request(number)) for number in range(3)], [True, True, False])
+        self.assertEqual((writer.pending(), writer.dropped_count), (2, 1))
+
+    def test_overload_metadata(self) -> None:
+        """Test the metadata policy strips the bodies above the high water mark and drops records once full."""
+        writer = self.writer(journal=False, queue_size=4, overload_policy=OVERLOAD_METADATA)
+        body = {**request(0), 'content': 'body', 'raw_request': 'POST / HTTP/1.1\r\nHost: app.test\r\n\r\nbody'}
+        for _ in range(4):
+            self.assertTrue(writer.enqueue(dict(body)))
+        self.assertFalse(writer.enqueue(dict(body)))
+        queued = [writer.queue.get_nowait() for _ in range(4)]
+        self.assertEqual([record['content'] for record in queued], ['body', 'body', 'body', None])
+        self.assertEqual(queued[3]['raw_request'], 'POST / HTTP/1.1\r\nHost: app.test\r\n\r\n')
+        self.assertEqual(writer.dropped_count, 1)
+        self.assertEqual(writer.metrics.counters['overload_metadata'], 2)
+
+    def test_overload_block(self) -> None:
+        """Test the block policy waits for room in the queue, without blocking the event loop when async, then drops the record."""
+        writer = self.writer(journal=False, queue_size=1, overload_policy=OVERLOAD_BLOCK)
+        self.assertTrue(writer.enqueue(request(1)))
+        self.assertFalse(writer.enqueue(request(2), block_timeout=0.01))
+
+        async def enqueue() -> bool:
+            asyncio.get_running_loop().call_later(0.01, writer.queue.get_nowait)
+            return await writer.enqueue_async(request(3))
+        self.assertTrue(asyncio.run(enqueue()))
+        self.assertEqual(writer.queue.get_nowait()['flow_id'], 'flow-3')
+        self.assertEqual(writer.dropped_count, 1)
+
+    def test_overload_journal(self) -> None:
+        """Test the journal policy spills to the overflow journal once full and writes it back in order."""
+        writer = self.writer(journal=False, queue_size=1, overload_policy=OVERLOAD_JOURNAL, flush_interval=0.01)
+        self.assertTrue(writer.enqueue(request(1)))
+        self.assertTrue(writer.enqueue(request(2)))
+        self.assertTrue(writer.spilling)
+        writer.queue.get_nowait()
+        self.assertTrue(writer.enqueue({'flow_id': 'flow-2', 'action': 'Response', 'response_status_code': 201}))
+        self.assertTrue(writer.queue.empty())
+        writer.start()
+        writer.stop(timeout=10)
+        self.assertFalse(writer.spilling)
+        self.assertEqual({flow_id: row.response_status_code for flow_id, row in self.rows().items()}, {'flow-2': 201})
+
+    def test_journal_before_queue(self) -> None:
+        """Test records are journaled before they are queued, also from a coroutine, and the journal is removed once they are written."""
+        writer = self.writer(flush_interval=0.01)
+        self.assertTrue(writer.enqueue(request(1)))
+        self.assertTrue(asyncio.run(writer.enqueue_async(request(2))))
+        self.assertEqual(writer.pending(), 2)
+        self.assertEqual([record['flow_id'] for record in Journal(writer.journal.path).read()[0]], ['flow-1', 'flow-2'])
+        writer.start()
+        writer.stop(timeout=10)
+        self.assertEqual(self.count(), 2)
+        self.assertEqual(writer.unreplayed, [])
+        self.assertEqual(os.listdir(self.journals.name), [])
+
+    def test_journal_async_batches(self) -> None:
+        """Test the records queued from coroutines in the same event loop tick are journaled with one append, in order."""
+        writer = self.writer()
+        journal_records = writer._journal_records # pylint: disable=protected-access
+
+        async def enqueue() -> list:
+            return await asyncio.gather(*[writer.enqueue_async(request(number)) for number in range(1, 4)])
+        with mock.patch.object(writer, '_journal_records', side_effect=journal_records) as appends:
+            self.assertEqual(asyncio.run(enqueue()), [True, True, True])
+        self.assertEqual(appends.call_count, 1)
+        self.assertEqual([record['flow_id'] for record in Journal(writer.journal.path).read()[0]], ['flow-1', 'flow-2', 'flow-3'])
+        self.assertEqual([writer.queue.get_nowait()['flow_id'] for _ in range(3)], ['flow-1', 'flow-2', 'flow-3'])
+        writer.stop()
+
+    def test_replay_journals(self) -> None:
+        """Test a journal left with unwritten records is replayed into the database once."""
+        writer = self.writer()
+        writer.enqueue(request(1))
+        writer.enqueue(request(2))
+        writer.stop()
+        self.assertEqual(len(writer.unreplayed), 1)
+        records, _ = Journal(writer.unreplayed[0]).read()
+        self.assertEqual([record['flow_id'] for record in records], ['flow-1', 'flow-2'])
+        self.assertEqual(self.writer(journal=False).replay_journals(self.journals.name), (1, 2))
+        self.assertEqual(self.count(), 2)
+        self.assertEqual(os.listdir(self.journals.name), [])
+    def leftover(self, pid: int, *records: dict) -> str:
+        """Write a capture journal as left by the process `pid`."""
+        journal = Journal(os.path.join(self.journals.name, f'capture-20240101-000000-{pid}-0001.jsonl'))
+        journal.append(list(records))
+        journal.close()
+        return journal.path
+
+    def test_replay_leftovers_on_start(self) -> None:
+        """Test the writer thread replays the journals of a dead session when it starts, and not the ones of a live process."""
+        with subprocess.Popen([sys.executable, '-c', '']) as process:
+            process.wait()
+        self.leftover(process.pid, request(1), request(2))
+        live = self.leftover(os.getppid(), request(3))
+        writer = self.writer(journal=False, flush_interval=0.01)
+        writer.start()
+        writer.stop(timeout=10)
+        self.assertEqual(sorted(self.rows()), ['flow-1', 'flow-2'])
+        self.assertEqual(os.listdir(self.journals.name), [os.path.basename(live)])
+
+    def test_request_replay(self) -> None:
+        """Test a manual replay runs on the writer thread of a running proxy, and a queued one is cancelled when it stops."""
+        writer = self.writer(journal=False, flush_interval=0.01)
+        writer.start()
+        try:
+            writer.enqueue(request(1))
+            deadline = time.monotonic() + 10
+            while writer.written_count == 0 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            self.leftover(os.getpid(), {'flow_id': 'flow-1', 'action': 'Response', 'response_status_code': 200})
+            threads = []
+            replay = writer.replay
+            with mock.patch.object(writer, 'replay', side_effect=lambda path: threads.append(threading.current_thread()) or replay(path)):
+                self.assertEqual(writer.request_replay().result(timeout=10), (1, 1))
+            self.assertEqual(threads, [writer.thread])
+        finally:
+            writer.stop(timeout=10)
+        self.assertEqual({flow_id: (row.method, row.response_status_code) for flow_id, row in self.rows().items()},
+                         {'flow-1': ('GET', 200)})
+        stopped = self.writer(journal=False)
+        future = stopped.request_replay()
+        stopped.stop()
+        self.assertTrue(future.cancelled())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+"""test_querycache.py"""
+import unittest
+from typing import NamedTuple
+
+from modules.querycache import EVERYTHING, QUERY_CACHE_EVENTS, CachedView, QueryCache, merge_rows # pylint: disable=import-error
+
+class Row(NamedTuple):
+    """A history row."""
+    id: int
+    timestamp_start: int
+
+class QueryCacheTest(unittest.TestCase):
+    """Query cache test case."""
+
+    def test_refresh_from(self) -> None:
+        """Test the oldest changed timestamp since a sequence number is kept per target and for all targets."""
+        cache = QueryCache()
+        self.assertIsNone(cache.refresh_from(1, cache.sequence(1)))
+        cache.captured({1: 100, 2: 50})
+        cache.captured({1: 80})
+        self.assertEqual(cache.sequence(1), 2)
+        self.assertEqual(cache.sequence(2), 1)
+        self.assertEqual(cache.refresh_from(1, 0), 80)
+        self.assertEqual(cache.refresh_from(1, 1), 80)
+        self.assertEqual(cache.refresh_from(None, 0), 50)
+        self.assertIsNone(cache.refresh_from(2, 1))
+        cache.captured({})
+        self.assertIsNone(cache.refresh_from(1, 2))
+
+    def test_refresh_from_trimmed(self) -> None:
+        """Test everything is read again once the changes since a sequence number were trimmed."""
+        cache = QueryCache()
+        for timestamp in range(QUERY_CACHE_EVENTS + 1):
+            cache.captured({1: timestamp})
+        self.assertEqual(cache.refresh_from(1, 0), EVERYTHING)
+        self.assertEqual(cache.refresh_from(1, 1), 1)
+
+    def test_merge_rows(self) -> None:
+        """Test the rows from the oldest changed timestamp on are replaced, newest first and cut to size."""
+        rows = [Row(3, 30), Row(2, 20), Row(1, 10)]
+        merged, truncated = merge_rows(rows, [Row(4, 40), Row(3, 30), Row(2, 20)], 20, 3)
+        self.assertEqual(merged, [Row(4, 40), Row(3, 30), Row(2, 20)])
+        self.assertTrue(truncated)
+        merged, truncated = merge_rows(rows, [Row(3, 30)], 15, 3)
+        self.assertEqual(merged, [Row(3, 30), Row(1, 10)])
+        self.assertFalse(truncated)
+
+    def test_lru(self) -> None:
+        """Test the least recently used view is evicted."""
+        cache = QueryCache(max_entries=2)
+        cache.put('a', CachedView([], True, 0))
+        cache.put('b', CachedView([], True, 0))
+        self.assertIsNotNone(cache.get('a'))
+        cache.put('c', CachedView([], True, 0))
+        self.assertIsNone(cache.get('b'))
+        self.assertIsNotNone(cache.get('a'))
+        self.assertIsNotNone(cache.get('c'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+"""test_scope_matcher.py"""
+import unittest
+
+from modules.scope_matcher import ScopeMatcher # pylint: disable=import-error
+
+SCOPE_ITEMS: list[dict] = [
+    {'fqdn': 'www.example.com', 'path': None},
+    {'fqdn': '*.api.example.com', 'path': None},
+    {'fqdn': '{dynamic}.tenant.example.net', 'path': None},
+    {'fqdn': '*example.org', 'path': None},
+    {'fqdn': None, 'path': '/admin'}
+]
+
+class ScopeMatcherTest(unittest.TestCase):
+    """Scope matcher test case."""
+
+    def setUp(self) -> None:
+        self.matcher = ScopeMatcher(SCOPE_ITEMS)
+
+    def test_exact_host(self) -> None:
+        """Test exact host matches."""
+        self.assertTrue(self.matcher.match('www.example.com').in_scope)
+        self.assertTrue(self.matcher.match('WWW.Example.com').in_scope)
+        self.assertFalse(self.matcher.match('example.com').in_scope)
+
+    def test_wildcard(self) -> None:
+        """Test wildcard matches need at least one extra label."""
+        self.assertTrue(self.matcher.match('v1.api.example.com').in_scope)
+        self.assertTrue(self.matcher.match('a.b.api.example.com').in_scope)
+        self.assertFalse(self.matcher.match('api.example.com').in_scope)
+        self.assertFalse(self.matcher.match('otherapi.example.com').in_scope)
+
+    def test_dynamic(self) -> None:
+        """Test dynamic matches return the scope item."""
+        scope_match = self.matcher.match('acme.tenant.example.net')
+        self.assertTrue(scope_match.in_scope)
+        self.assertEqual(scope_match.dynamic_host, '{dynamic}.tenant.example.net')
+        self.assertIsNone(self.matcher.match('www.example.com').dynamic_host)
+
+    def test_unaligned_suffix(self) -> None:
+        """Test wildcards that do not start on a label boundary."""
+        self.assertTrue(self.matcher.match('myexample.org').in_scope)
+        self.assertFalse(self.matcher.match('example.org.evil.com').in_scope)
+
+    def test_match_all(self) -> None:
+        """Test a bare `*` scope item."""
+        matcher = ScopeMatcher([{'fqdn': '*', 'path': None}])
+        self.assertTrue(matcher.match('anything.test').in_scope)
+        self.assertFalse(ScopeMatcher([]).match('anything.test').in_scope)
+
+if __name__ == '__main__':
+    unittest.main() # pragma: no cover
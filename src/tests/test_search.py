@@ -0,0 +1,29 @@
+"""test_search.py"""
+import unittest
+
+from modules.searchquery import PHRASE, PREFIX, SUBSTRING, TERM, SearchTerm, fts5_query, parse_query # pylint: disable=import-error
+
+class SearchQueryTest(unittest.TestCase):
+    """Search query test case."""
+
+    def test_parse_query(self) -> None:
+        """Test terms, phrases, prefixes and substrings are told apart."""
+        self.assertEqual(parse_query('Admin "remove me" pass* *ter2* x-api-key * ""'), [
+            SearchTerm(TERM, 'admin'),
+            SearchTerm(PHRASE, 'remove me'),
+            SearchTerm(PREFIX, 'pass'),
+            SearchTerm(SUBSTRING, 'ter2'),
+            SearchTerm(PHRASE, 'x api key')
+        ])
+        self.assertEqual(parse_query(['user_id', '/api/v1/']), [SearchTerm(PHRASE, 'user id'), SearchTerm(PHRASE, 'api v1')])
+        self.assertEqual(parse_query('"unbalanced'), [SearchTerm(TERM, 'unbalanced')])
+
+    def test_fts5_query(self) -> None:
+        """Test the FTS5 expression matches every term within one column."""
+        terms = parse_query('admin pass* *ter2')
+        self.assertEqual(fts5_query(terms, ['request', 'response']),
+                         'request : ("admin" AND "pass" *) OR response : ("admin" AND "pass" *)')
+        self.assertIsNone(fts5_query(parse_query('*ter2'), ['response']))
+
+if __name__ == '__main__':
+    unittest.main() # pragma: no cover
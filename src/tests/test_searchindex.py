@@ -0,0 +1,102 @@
+"""test_searchindex.py"""
+import unittest
+
+from sqlalchemy import text
+from databasecase import DatabaseTestCase # pylint: disable=import-error
+from modules.bodystore import BodyStore, SpilledBody # pylint: disable=import-error
+from modules.proxywriter import ProxyWriter # pylint: disable=import-error
+from modules.search import SEARCH_BODY_TABLE, SEARCH_TABLE, SearchIndex # pylint: disable=import-error
+from modules.searchquery import HIGHLIGHT_START, parse_query # pylint: disable=import-error
+
+def response(number: int, body: str, target_id: int = 1) -> dict:
+    """Get the record of a captured flow."""
+    return {'flow_id': f'flow-{number}', 'target_id': target_id, 'action': 'Response', 'method': 'GET',
+            'full_url': f'http://app.test/page/{number}', 'timestamp_start': 1700000000 + number,
+            'raw_request': f'GET /page/{number} HTTP/1.1', 'response_status_code': 200,
+            'response_headers': f'HTTP/1.1 200\nX-Request: header{number}\n', 'response_text': body}
+
+class SearchIndexTest(DatabaseTestCase):
+    """Search index test case."""
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.writer = ProxyWriter(journal=False)
+        self.search_index = SearchIndex()
+
+    def write(self, records: list) -> None:
+        """Write records with the proxy writer."""
+        self.assertTrue(self.writer._write_batch(records)) # pylint: disable=protected-access
+
+    def search(self, query: str, **options) -> list:
+        """Search the index."""
+        with self.session() as db:
+            return self.search_index.search(db, parse_query(query), **options)
+
+    def test_bodies_indexed_once(self) -> None:
+        """Test a body shared by several rows is indexed once and matches every row."""
+        shared = 'welcome to the shared landing page'
+        self.write([response(1, shared), response(2, shared), response(3, 'something else', target_id=2)])
+        with self.session() as db:
+            self.assertEqual(db.scalar(text(f"SELECT count(*) FROM {SEARCH_BODY_TABLE}")), 2)
+            self.assertEqual(db.scalar(text(f"SELECT count(*) FROM {SEARCH_TABLE} WHERE response LIKE '%landing%'")), 0)
+        self.assertEqual(self.search('landing'), [2, 1])
+        self.assertEqual(self.search('*andin*'), [2, 1])
+        self.assertEqual(self.search('header1'), [1])
+        self.assertEqual(self.search('landing', responses=False), [])
+        self.assertEqual(self.search('something', target_id=1), [])
+        self.assertEqual(self.search('something', target_id=2), [3])
+        with self.session() as db:
+            snippets = self.search_index.snippets(db, parse_query('landing page'), [1, 3])
+        self.assertIn(HIGHLIGHT_START + 'landing', snippets[1])
+        self.assertIsNone(snippets.get(3))
+
+    def test_mixed_terms_same_document(self) -> None:
+        """Test full-text and substring terms only match when they hit the same document."""
+        self.write([response(1, 'body about apples'), response(2, 'body about pears')])
+        self.assertEqual(self.search('page *header1'), [])
+        self.assertEqual(self.search('header1 *page'), [])
+        self.assertEqual(self.search('page *age/1'), [1])
+        self.assertEqual(self.search('apples *eader'), [])
+        self.assertEqual(self.search('apples *bout'), [1])
+        self.assertEqual(self.search('*eader *page'), [])
+        self.assertEqual(self.search('*eader *quest: header2'), [2])
+
+    def test_remove_and_prune(self) -> None:
+        """Test dropped rows lose their documents and pruned bodies lose theirs."""
+        self.write([response(1, 'kept body'), response(2, 'dropped body')])
+        self.write([{'flow_id': 'flow-2', 'action': 'Drop'}])
+        self.assertEqual(self.search('body'), [1])
+        with self.session() as db:
+            self.assertEqual(self.search_index.prune(db), 1)
+            self.assertEqual(BodyStore().prune(db), 1)
+            self.assertEqual(db.scalar(text(f"SELECT count(*) FROM {SEARCH_BODY_TABLE}")), 1)
+
+    def test_backfill(self) -> None:
+        """Test backfill indexes the rows and bodies written before the index existed."""
+        with self.engine.begin() as connection:
+            connection.execute(text(f"DROP TABLE {SEARCH_TABLE}"))
+            connection.execute(text(f"DROP TABLE {SEARCH_BODY_TABLE}"))
+        self.write([response(1, 'legacy needle'), response(2, 'legacy needle')])
+        with self.engine.begin() as connection:
+            SearchIndex.ensure(connection)
+        with self.session() as db:
+            self.assertEqual(self.search_index.backfill(db, batch_size=1), 3)
+            self.assertEqual(self.search_index.backfill(db), 0)
+        self.assertEqual(self.search('needle'), [2, 1])
+        self.write([response(3, 'fresh needle')])
+        self.assertEqual(self.search('fresh'), [3])
+    def test_spilled_bodies(self) -> None:
+        """Test spilled bodies are indexed by the writer's idle backfill."""
+        data = b'large spilled haystack'
+        spilled = SpilledBody(self.writer.body_segments, len(data))
+        spilled(data)
+        self.addCleanup(self.writer.body_segments.close)
+        record = response(1, None)
+        del record['response_text']
+        self.write([{**record, 'response_body': spilled.record()}])
+        self.assertEqual(self.search('haystack'), [])
+        self.writer._backfill_bodies() # pylint: disable=protected-access
+        self.assertEqual(self.search('haystack'), [1])
+
+if __name__ == '__main__':
+    unittest.main()
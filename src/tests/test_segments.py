@@ -0,0 +1,94 @@
+"""test_segments.py"""
+import gzip
+import tempfile
+import unittest
+
+from sqlalchemy import select
+from databasecase import DatabaseTestCase # pylint: disable=import-error
+from modules.bodystore import SPILLED_HASH_PREFIX, BodyStore, SpilledBody # pylint: disable=import-error
+from modules.segments import SegmentWriter, read_segment # pylint: disable=import-error
+from models import BodyModel # pylint: disable=import-error
+
+class SegmentsTest(DatabaseTestCase):
+    """Segment files and spilled bodies test case."""
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.segments_directory = tempfile.TemporaryDirectory() # pylint: disable=consider-using-with
+        self.addCleanup(self.segments_directory.cleanup)
+        self.segments = SegmentWriter(self.segments_directory.name, 'body', max_size=16)
+        self.addCleanup(self.segments.close)
+
+    def test_reserve_and_rotate(self) -> None:
+        """Test reserved ranges stay contiguous when filled out of order, and full segments are rotated."""
+        first = self.segments.reserve(6)
+        second = self.segments.append(b'second')
+        self.segments.write_at(first, 3, b'abc')
+        self.segments.write_at(first, 0, b'xyz')
+        self.assertEqual((first.segment, first.offset, second.offset), (second.segment, 0, 6))
+        self.assertEqual(read_segment(self.segments_directory.name, first.segment, first.offset, 12), b'xyzabcsecond')
+        third = self.segments.append(b'third-body')
+        self.assertNotEqual(third.segment, first.segment)
+        self.assertEqual(read_segment(self.segments_directory.name, third.segment, third.offset, third.length), b'third-body')
+        with self.assertRaises(ValueError):
+            self.segments.write_at(first, 4, b'too long')
+
+    def test_spilled_body(self) -> None:
+        """Test a streamed body is written to its segment, stored by reference and decoded when read."""
+        body = 'spilled body ' * 4
+        data = gzip.compress(body.encode())
+        segments = SegmentWriter(self.segments_directory.name, 'spill')
+        self.addCleanup(segments.close)
+        spilled = SpilledBody(segments, len(data), 'gzip')
+        for start in range(0, len(data), 7):
+            self.assertEqual(spilled(data[start:start + 7]), data[start:start + 7])
+        self.assertFalse(spilled.record()['truncated'])
+        body_store = BodyStore(segment_path=self.segments_directory.name)
+        record = {'response_body': spilled.record()}
+        with self.session() as db:
+            body_store.save(db, body_store.extract([record]))
+            db.commit()
+            self.assertEqual(body_store.get_text(db, record['response_body_hash']), body)
+
+    def test_truncated_body(self) -> None:
+        """Test a body longer or shorter than its reserved length is flagged and not stored."""
+        segments = SegmentWriter(self.segments_directory.name, 'spill')
+        self.addCleanup(segments.close)
+        longer = SpilledBody(segments, 4)
+        self.assertEqual(longer(b'body'), b'body')
+        self.assertEqual(longer(b'extra'), b'extra')
+        shorter = SpilledBody(segments, 8)
+        shorter(b'body')
+        self.assertTrue(longer.truncated)
+        self.assertTrue(longer.record()['truncated'])
+        self.assertTrue(shorter.record()['truncated'])
+        records = [{'response_body': longer.record()}, {'response_body': shorter.record()}]
+        self.assertEqual(BodyStore().extract(records), {})
+        self.assertEqual([record['response_body_hash'] for record in records], [None, None])
+
+    def test_spilled_and_inline_body(self) -> None:
+        """Test the same body captured spilled and inline gets two distinct keys, each counted and read back."""
+        body = 'same body ' * 8
+        data = gzip.compress(body.encode())
+        segments = SegmentWriter(self.segments_directory.name, 'spill')
+        self.addCleanup(segments.close)
+        records = [{'response_text': body}]
+        for _ in range(2):
+            spilled = SpilledBody(segments, len(data), 'gzip')
+            spilled(data)
+            records.append({'response_body': spilled.record()})
+        body_store = BodyStore(segment_path=self.segments_directory.name)
+        with self.session() as db:
+            body_store.save(db, body_store.extract(records))
+            db.commit()
+            inline_hash, spilled_hash, again_hash = [record['response_body_hash'] for record in records]
+            self.assertEqual(inline_hash, BodyStore.hash_body(body))
+            self.assertTrue(spilled_hash.startswith(SPILLED_HASH_PREFIX))
+            self.assertEqual(spilled_hash, again_hash)
+            self.assertEqual(dict(db.execute(select(BodyModel.hash, BodyModel.ref_count)).all()),
+                             {inline_hash: 1, spilled_hash: 2})
+            self.assertEqual(body_store.get_text(db, inline_hash), body)
+            self.assertEqual(body_store.get_text(db, spilled_hash), body)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,35 @@
+"""test_trafficsummary.py"""
+import unittest
+
+from modules.trafficsummary import CONTENT_NONE, NO_RESPONSE, NO_TARGET, SummaryKey, content_class, summary_deltas # pylint: disable=import-error
+
+class TrafficSummaryTest(unittest.TestCase):
+    """Traffic summary test case."""
+
+    def test_content_class(self) -> None:
+        """Test responses are classified by Content-Type, then by the extension of the path."""
+        self.assertEqual(content_class("HTTP/1.1 200\nContent-Type: text/html; charset=utf-8\n"), 'html')
+        self.assertEqual(content_class("HTTP/1.1 200\ncontent-type: application/vnd.api+json\n"), 'json')
+        self.assertEqual(content_class("HTTP/1.1 200\nContent-Type: application/javascript\n", '/app.css'), 'script')
+        self.assertEqual(content_class("HTTP/1.1 200\nX-Content-Type-Options: nosniff\n", '/static/app.js?v=2'), 'script')
+        self.assertEqual(content_class(None, '/logo.PNG'), 'image')
+        self.assertEqual(content_class(None, '/api/users'), 'other')
+
+    def test_summary_deltas(self) -> None:
+        """Test a flow moves from the pending row to its response row when the response arrives."""
+        request = {'target_id': 1, 'host': 'a.test', 'method': 'GET', 'path': '/', 'timestamp_start': 10}
+        response = {**request, 'response_status_code': 200, 'response_headers': 'Content-Type: text/html',
+                    'response_body_hash': 'h1'}
+        pending = SummaryKey(1, 'a.test', 'GET', NO_RESPONSE, CONTENT_NONE)
+        self.assertEqual(summary_deltas([], [request], {}), {pending: [1, 0, 10]})
+        self.assertEqual(summary_deltas([request], [response], {'h1': 512}), {
+            pending: [-1, 0, None],
+            SummaryKey(1, 'a.test', 'GET', 200, 'html'): [1, 512, 10]
+        })
+        self.assertEqual(summary_deltas([response], [], {'h1': 512}),
+                         {SummaryKey(1, 'a.test', 'GET', 200, 'html'): [-1, -512, None]})
+        self.assertEqual(summary_deltas([response], [response], {'h1': 512}), {})
+        self.assertEqual(list(summary_deltas([], [{'method': 'GET'}], {})), [SummaryKey(NO_TARGET, '', 'GET', NO_RESPONSE, CONTENT_NONE)])
+
+if __name__ == '__main__':
+    unittest.main()